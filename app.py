@@ -1,6 +1,9 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
-from flask_socketio import SocketIO, emit
+import hmac
+import threading
+import time
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response, g
+from flask_socketio import SocketIO, emit, join_room
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
@@ -8,7 +11,14 @@ import sys
 
 # Agregar el directorio utils al path
 sys.path.append(os.path.dirname(__file__))
-from utils.database import Database
+from utils.database import (Database, ProductosInexistentes, StockInsuficiente, TABLAS_DASHBOARD,
+                            comparaciones_predeterminadas, leer_cursor_ventas, ventana_comparacion)
+from utils.exportador import MIMETYPE_XLSX, FORMATOS_FLUJO
+from utils.metricas import METRICAS
+from utils.perfilado import iniciar_tiempo_db
+from utils.trabajos import ColaLlena, ColaTrabajos
+from utils.cache import CacheArchivos, enlazar
+from utils.mensajeria import opciones_socketio
 
 # Cargar variables de entorno
 load_dotenv()
@@ -26,22 +36,133 @@ app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB máximo
 # Crear carpeta de uploads si no existe
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Workers de gunicorn (el Procfile usa la misma variable)
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# Cola de mensajes para que los emits lleguen a los clientes de todos los
+# workers: redis://... o sqlite:///ruta (ver utils/mensajeria.py). Con varios
+# workers y sin cola configurada se usa el bus SQLite junto a la base
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+if WEB_CONCURRENCY > 1 and not SOCKETIO_MESSAGE_QUEUE:
+    SOCKETIO_MESSAGE_QUEUE = 'sqlite:///database/socketio.db'
+
 # Configurar SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", **opciones_socketio(SOCKETIO_MESSAGE_QUEUE))
+
+# Sin sesiones pegajosas, el long-polling de un cliente puede caer en otro
+# worker que no lo conoce: con cola de mensajes el cliente usa solo WebSocket
+SOCKET_OPCIONES = {'transports': ['websocket']} if SOCKETIO_MESSAGE_QUEUE else {}
 
 # Inicializar base de datos
-db = Database()
+db = Database(os.getenv('DB_PATH', 'database/licoreria.db'))
+
+# Cada cuántos segundos hacer checkpoint del WAL (0 = desactivado)
+WAL_CHECKPOINT_SEGUNDOS = int(os.getenv('WAL_CHECKPOINT_SEGUNDOS', 300))
+
+# Cada cuántos segundos revisar si faltan fotos diarias de stock (0 = desactivado)
+STOCK_SNAPSHOT_SEGUNDOS = int(os.getenv('STOCK_SNAPSHOT_SEGUNDOS', 3600))
+
+# Intervalo mínimo entre envíos del dashboard por WebSocket (0 = cada cliente lo pide)
+DASHBOARD_PUSH_SEGUNDOS = float(os.getenv('DASHBOARD_PUSH_SEGUNDOS', 1))
 
 # Credenciales de acceso (desde .env)
 ADMIN_USER = os.getenv('ADMIN_USER', 'admin')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'beer2025')
 
+# Token para que un recolector (Prometheus) lea /api/_metrics sin sesión
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Ventana (segundos) de los percentiles por ruta
+METRICAS_VENTANA = int(os.getenv('METRICAS_VENTANA', 300))
+
+# Exportaciones Excel en segundo plano: directorio, cuántas a la vez, cuántas
+# pendientes como máximo y cuántos segundos se guardan los archivos
+EXPORTS_DIR = os.getenv('EXPORTS_DIR', 'exports')
+EXPORT_CONCURRENTES = int(os.getenv('EXPORT_CONCURRENTES', 2))
+EXPORT_MAX_PENDIENTES = int(os.getenv('EXPORT_MAX_PENDIENTES', 20))
+EXPORT_RETENCION_SEGUNDOS = int(os.getenv('EXPORT_RETENCION_SEGUNDOS', 3600))
+
+# Bytes máximos del cache de exportaciones en exports/cache (0 = sin cache)
+EXPORT_CACHE_BYTES = int(os.getenv('EXPORT_CACHE_BYTES', 256 * 1024 * 1024))
+
+# Las exportaciones corren en hilos del sistema, fuera de eventlet: usan su
+# propia Database sin pool, cache ni métricas (sus locks son de eventlet).
+# Los reportes CSV/NDJSON también leen de ella: el cursor queda abierto hasta
+# que el cliente termina de descargar y no debe ocupar una conexión del pool
+db_exportaciones = Database(db.db_path, pool_size=0, usar_cache=False, usar_metricas=False)
+trabajos = ColaTrabajos(EXPORTS_DIR, EXPORT_CONCURRENTES, EXPORT_MAX_PENDIENTES,
+                        EXPORT_RETENCION_SEGUNDOS)
+cache_exportaciones = None
+if EXPORT_CACHE_BYTES > 0:
+    cache_exportaciones = CacheArchivos(os.path.join(EXPORTS_DIR, 'cache'), EXPORT_CACHE_BYTES)
+
 # ===== FUNCIONES AUXILIARES =====
 
 def allowed_file(filename):
     """Verificar si el archivo tiene una extensión permitida"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def enviar_excel(archivo, nombre):
+    """Enviar un Excel generado en archivo temporal (se transmite por bloques)"""
+    if archivo is None:
+        raise ValueError('No se pudo generar el archivo Excel')
+    return send_file(archivo, mimetype=MIMETYPE_XLSX, as_attachment=True, download_name=nombre)
+
+def responder_excel(nombre, generar, cache=None):
+    """Encolar un Excel en la cola de trabajos y responder 202 con el trabajo
+    
+    generar(base, destino=None, progreso=None) arma el archivo con la base
+    que recibe. Con ?directo=1 se genera en la petición y se descarga.
+    cache = (reporte, *parámetros) de Database.version_exportacion: si los
+    datos no cambiaron desde la última vez, se entrega el mismo archivo.
+    """
+    nombre = secure_filename(nombre)
+    clave = version = None
+    if cache and cache_exportaciones:
+        version = db.version_exportacion(*cache)
+        if version:
+            clave = cache_exportaciones.clave(cache[0], cache[1:], version)
+    guardado = cache_exportaciones.obtener(clave) if clave else None
+    
+    if request.args.get('directo') == '1':
+        if guardado:
+            return send_file(os.path.abspath(guardado), mimetype=MIMETYPE_XLSX,
+                             as_attachment=True, download_name=nombre)
+        return enviar_excel(generar(db), nombre)
+    
+    if guardado:
+        trabajo = trabajos.agregar_listo(nombre, guardado, enlazar)
+        return jsonify({'success': True, 'trabajo': trabajo})
+    
+    def generar_en_segundo_plano(destino, progreso):
+        resultado = generar(db_exportaciones, destino=destino, progreso=progreso)
+        # Solo se guarda si los datos no cambiaron mientras se generaba
+        if resultado and clave and db_exportaciones.version_exportacion(*cache) == version:
+            cache_exportaciones.guardar(clave, destino)
+        return resultado
+    
+    try:
+        trabajo = trabajos.enviar(nombre, generar_en_segundo_plano)
+    except ColaLlena as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+    return jsonify({'success': True, 'trabajo': trabajo}), 202
+
+def formato_flujo():
+    """Formato pedido con ?format=csv|ndjson (None = Excel)"""
+    formato = request.args.get('format', '').lower()
+    return formato if formato in FORMATOS_FLUJO else None
+
+def enviar_flujo(filas, formato, nombre):
+    """Enviar un reporte CSV/NDJSON en respuesta chunked, generado mientras se lee el cursor"""
+    mimetype, generar = FORMATOS_FLUJO[formato]
+    return Response(generar(filas), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={nombre}.{formato}'})
+
+@app.context_processor
+def opciones_plantillas():
+    """Opciones de conexión de Socket.IO para el cliente (base.html)"""
+    return {'socket_opciones': SOCKET_OPCIONES}
+
 # ===== DECORADOR LOGIN REQUIRED =====
 
 def login_required(f):
@@ -239,8 +360,44 @@ def producto_editar(id):
 @app.route('/api/productos', methods=['GET'])
 @login_required
 def api_productos():
-    """API: Obtener todos los productos"""
-    productos = db.obtener_productos()
+    """API: Catálogo de productos
+    
+    Responde 304 si el If-None-Match coincide con la versión del catálogo y,
+    con ?since=<versión>, devuelve solo los productos cambiados y eliminados.
+    """
+    version = db.obtener_version_catalogo()
+    if version is None:
+        return jsonify({'success': True, 'productos': db.obtener_productos()})
+    
+    etag = str(version)
+    if request.if_none_match.contains(etag):
+        respuesta = app.response_class(status=304)
+    else:
+        since = request.args.get('since', type=int)
+        cambios = None
+        if since is not None and since <= version:
+            cambios = db.obtener_cambios_catalogo(since)
+        
+        if cambios is not None:
+            respuesta = jsonify({'success': True, 'version': version, 'completo': False, **cambios})
+        else:
+            respuesta = jsonify({'success': True, 'version': version, 'completo': True,
+                                 'productos': db.obtener_productos()})
+    
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+@app.route('/api/productos/buscar', methods=['GET'])
+@login_required
+def api_productos_buscar():
+    """API: Buscar productos (?q=texto&limit=20&stock=1 para solo disponibles)"""
+    limite = max(1, min(request.args.get('limit', 20, type=int), 100))
+    productos = db.buscar_productos(
+        request.args.get('q', ''),
+        limite=limite,
+        solo_con_stock=request.args.get('stock') == '1'
+    )
     return jsonify({'success': True, 'productos': productos})
 
 @app.route('/api/producto/<int:id>', methods=['GET'])
@@ -280,13 +437,45 @@ def api_producto_eliminar(id):
 def api_productos_exportar():
     """API: Exportar productos a Excel"""
     try:
-        productos = db.obtener_productos()
-        filepath = db.exportar_productos_excel(productos)
-        return send_file(filepath, as_attachment=True, download_name=f'productos_{datetime.now().strftime("%Y%m%d")}.xlsx')
+        return responder_excel(f'productos_{datetime.now().strftime("%Y%m%d")}.xlsx',
+                               lambda base, **kw: base.exportar_productos_excel(**kw),
+                               cache=('productos',))
     except Exception as e:
         print(f"Error al exportar: {e}")
         return jsonify({'success': False, 'message': 'Error al exportar'}), 500
 
+# ===== RUTAS DE INVENTARIO =====
+
+@app.route('/api/inventario/valorizacion')
+@login_required
+def api_inventario_valorizacion():
+    """API: Stock y valor del inventario a una fecha (?fecha=YYYY-MM-DD, hoy por defecto)"""
+    try:
+        valorizacion = db.obtener_valorizacion_stock(request.args.get('fecha'))
+        if valorizacion:
+            return jsonify({'success': True, 'data': valorizacion})
+        return jsonify({'success': False, 'message': 'Error al valorizar inventario'}), 500
+    except Exception as e:
+        print(f"Error al valorizar inventario: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/producto/<int:id>/movimientos')
+@login_required
+def api_producto_movimientos(id):
+    """API: Movimientos de stock de un producto (?desde=&hasta=)"""
+    movimientos = db.obtener_movimientos_stock(id, request.args.get('desde'), request.args.get('hasta'))
+    return jsonify({'success': True, 'movimientos': movimientos})
+
+@app.route('/api/inventario/verificar')
+@login_required
+def api_inventario_verificar():
+    """API para comparar el stock de los productos con su libro de movimientos"""
+    try:
+        corregir = request.args.get('corregir') == '1'
+        return jsonify(db.verificar_stock(corregir))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ===== RUTAS DE VENTAS =====
 
 @app.route('/pos')
@@ -306,9 +495,31 @@ def ventas():
 @app.route('/api/ventas', methods=['GET'])
 @login_required
 def api_ventas():
-    """API: Obtener todas las ventas"""
-    ventas = db.obtener_ventas()
-    return jsonify({'success': True, 'ventas': ventas})
+    """API: Obtener ventas por páginas (?limit=&cursor=&desde=&hasta=&metodo_pago=)"""
+    limite = max(1, min(request.args.get('limit', 50, type=int), 500))
+    
+    despues_de = None
+    if request.args.get('cursor'):
+        try:
+            despues_de = leer_cursor_ventas(request.args['cursor'])
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Cursor de paginación inválido'}), 400
+    
+    # Se pide una venta de más para saber si hay otra página
+    ventas = db.obtener_ventas(
+        limite=limite + 1,
+        despues_de=despues_de,
+        fecha_desde=request.args.get('desde'),
+        fecha_hasta=request.args.get('hasta'),
+        metodo_pago=request.args.get('metodo_pago')
+    )
+    
+    siguiente = None
+    if len(ventas) > limite:
+        ventas = ventas[:limite]
+        siguiente = f"{ventas[-1]['fecha']}|{ventas[-1]['id']}"
+    
+    return jsonify({'success': True, 'ventas': ventas, 'siguiente': siguiente})
 
 # ============================================
 # CORRECCIÓN PARA app.py
@@ -336,10 +547,11 @@ def api_crear_venta():
         if not data or not data.get('items'):
             return jsonify({'success': False, 'message': 'Datos inválidos'}), 400
         
-        # Crear venta
-        venta_id = db.crear_venta(
+        # Crear venta, detalle, stock, caja y crédito en una sola transacción
+        venta_id = db.registrar_venta_completa(
             total=data['total'],
             metodo_pago=data['metodo_pago'],
+            items=data['items'],
             monto_efectivo=data.get('monto_efectivo', 0),
             monto_qr=data.get('monto_qr', 0),
             cliente_nombre=data.get('cliente_nombre'),
@@ -349,34 +561,14 @@ def api_crear_venta():
         if not venta_id:
             return jsonify({'success': False, 'message': 'Error al crear venta'}), 500
         
-        # Agregar detalle de venta y actualizar stock
-        for item in data['items']:
-            db.crear_detalle_venta(
-                venta_id=venta_id,
-                producto_id=item['producto_id'],
-                producto_nombre=item['producto_nombre'],
-                cantidad=item['cantidad'],
-                precio_unitario=item['precio_unitario'],
-                subtotal=item['subtotal']
-            )
-            
-            # Actualizar stock
-            db.actualizar_stock(item['producto_id'], item['cantidad'], 'restar')
-        
-        # Si es venta a crédito, crear registro de crédito
-        if data.get('metodo_pago') == 'credito':
-            db.crear_credito(
-                venta_id=venta_id,
-                cliente_nombre=data.get('cliente_nombre'),
-                cliente_telefono=data.get('cliente_telefono'),
-                monto_total=data.get('total')
-            )
-        
         # Emitir evento de WebSocket
         socketio.emit('venta_creada', {'venta_id': venta_id})
         
         return jsonify({'success': True, 'venta_id': venta_id, 'message': 'Venta creada correctamente'})
         
+    except StockInsuficiente as e:
+        # Otra terminal vendió antes: no se registró nada
+        return jsonify({'success': False, 'message': str(e), 'fallidos': e.fallidos}), 409
     except Exception as e:
         print(f"Error al crear venta: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -409,11 +601,14 @@ def api_ventas_exportar():
         fecha_desde = request.args.get('desde')
         fecha_hasta = request.args.get('hasta')
         
-        ventas = db.obtener_ventas_por_fecha(fecha_desde, fecha_hasta)
-        filepath = db.exportar_ventas_excel(ventas, fecha_desde, fecha_hasta)
+        formato = formato_flujo()
+        if formato:
+            filas = db_exportaciones.iterar_exportacion('ventas', fecha_desde, fecha_hasta)
+            return enviar_flujo(filas, formato, f'ventas_{fecha_desde}_{fecha_hasta}')
         
-        return send_file(filepath, as_attachment=True, 
-                        download_name=f'ventas_{fecha_desde}_{fecha_hasta}.xlsx')
+        return responder_excel(f'ventas_{fecha_desde}_{fecha_hasta}.xlsx',
+                               lambda base, **kw: base.exportar_ventas_excel(fecha_desde, fecha_hasta, **kw),
+                               cache=('ventas', fecha_desde, fecha_hasta))
     except Exception as e:
         print(f"Error al exportar ventas: {e}")
         return jsonify({'success': False, 'message': 'Error al exportar'}), 500
@@ -495,13 +690,14 @@ def api_compras():
             if not data:
                 return jsonify({'success': False, 'message': 'Datos inválidos'}), 400
             
-            # Crear compra principal
-            compra_id = db.crear_compra(
+            # Crear compra, egreso de caja, detalle y stock en una sola transacción
+            compra_id = db.registrar_compra_completa(
                 tipo=data['tipo'],
                 descripcion=data.get('descripcion'),
                 monto=data['monto'],
                 proveedor=data.get('proveedor'),
                 metodo_pago=data['metodo_pago'],
+                items=data.get('items'),
                 fecha=data.get('fecha'),
                 observaciones=data.get('observaciones')
             )
@@ -509,21 +705,6 @@ def api_compras():
             if not compra_id:
                 return jsonify({'success': False, 'message': 'Error al crear compra'}), 500
             
-            # Si es compra de productos, agregar detalles y actualizar stock
-            if data['tipo'] == 'productos' and data.get('items'):
-                for item in data['items']:
-                    db.crear_detalle_compra(
-                        compra_id=compra_id,
-                        producto_id=item['producto_id'],
-                        producto_nombre=item['producto_nombre'],
-                        cantidad=item['cantidad'],
-                        precio_unitario=item['precio_unitario'],
-                        subtotal=item['subtotal']
-                    )
-                    
-                    # Actualizar stock (sumar porque es compra)
-                    db.actualizar_stock(item['producto_id'], item['cantidad'], 'sumar')
-            
             # Emitir evento de WebSocket
             socketio.emit('compra_creada', {'compra_id': compra_id})
             
@@ -533,6 +714,9 @@ def api_compras():
                 'message': 'Compra registrada correctamente'
             })
             
+        except ProductosInexistentes as e:
+            # No se registró nada: ni la compra ni el egreso de caja
+            return jsonify({'success': False, 'message': str(e), 'fallidos': e.fallidos}), 400
         except Exception as e:
             print(f"Error al crear compra: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -626,11 +810,13 @@ def api_compras_exportar():
         desde = request.args.get('desde')
         hasta = request.args.get('hasta')
         
-        compras = db.obtener_compras(tipo=tipo, desde=desde, hasta=hasta)
-        filepath = db.exportar_compras_excel(compras, desde, hasta)
+        formato = formato_flujo()
+        if formato:
+            filas = db_exportaciones.iterar_exportacion('compras', desde, hasta, tipo=tipo)
+            return enviar_flujo(filas, formato, f'compras_{desde}_{hasta}')
         
-        return send_file(filepath, as_attachment=True,
-                        download_name=f'compras_{desde}_{hasta}.xlsx')
+        return responder_excel(f'compras_{desde}_{hasta}.xlsx',
+                               lambda base, **kw: base.exportar_compras_excel(tipo, desde, hasta, **kw))
                         
     except Exception as e:
         print(f"Error al exportar compras: {e}")
@@ -748,8 +934,13 @@ def api_creditos_estadisticas():
 def api_creditos_exportar():
     """Exportar créditos a Excel"""
     try:
-        archivo = db.exportar_creditos_excel()
-        return send_file(archivo, as_attachment=True)
+        formato = formato_flujo()
+        if formato:
+            filas = db_exportaciones.iterar_exportacion('creditos')
+            return enviar_flujo(filas, formato, f'creditos_{datetime.now().strftime("%Y%m%d_%H%M%S")}')
+        
+        return responder_excel(f'creditos_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+                               lambda base, **kw: base.exportar_creditos_excel(**kw))
     except Exception as e:
         flash(f'Error al exportar: {str(e)}', 'danger')
         return redirect(url_for('creditos'))
@@ -890,6 +1081,19 @@ def api_caja_detalle(id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/caja/<int:id>/verificar')
+@login_required
+def api_caja_verificar(id):
+    """API para comparar los totales acumulados de una caja con sus movimientos"""
+    try:
+        corregir = request.args.get('corregir') == '1'
+        resultado = db.verificar_totales_caja(id, corregir)
+        if resultado:
+            return jsonify(resultado)
+        return jsonify({'error': 'Caja no encontrada'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/caja/exportar')
 @login_required
 def api_caja_exportar():
@@ -899,12 +1103,19 @@ def api_caja_exportar():
         fecha_desde = request.args.get('fecha_desde')
         fecha_hasta = request.args.get('fecha_hasta')
         
-        if caja_id:
-            archivo = db.exportar_caja_excel(caja_id)
-        else:
-            archivo = db.exportar_historial_cajas_excel(fecha_desde, fecha_hasta)
+        formato = formato_flujo()
+        if formato:
+            filas = db_exportaciones.iterar_exportacion('caja', fecha_desde, fecha_hasta, caja_id=caja_id)
+            nombre = f'caja_{caja_id}' if caja_id else 'historial_cajas'
+            return enviar_flujo(filas, formato, f'{nombre}_{datetime.now().strftime("%Y%m%d_%H%M%S")}')
         
-        return send_file(archivo, as_attachment=True)
+        if caja_id:
+            return responder_excel(f'caja_{caja_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+                                   lambda base, **kw: base.exportar_caja_excel(caja_id, **kw),
+                                   cache=('caja', caja_id))
+        return responder_excel(f'historial_cajas_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+                               lambda base, **kw: base.exportar_historial_cajas_excel(
+                                   fecha_desde, fecha_hasta, **kw))
     except Exception as e:
         flash(f'Error al exportar: {str(e)}', 'danger')
         return redirect(url_for('caja'))
@@ -1087,9 +1298,34 @@ def api_estadisticas_categorias():
 @app.route('/api/estadisticas/comparativa')
 @login_required
 def api_estadisticas_comparativa():
-    """API para obtener comparativa entre períodos"""
+    """API para obtener comparativa entre períodos
+    
+    Con ?desde=&hasta= agrega la comparación 'personalizado' contra
+    ?comparar_desde=&comparar_hasta= o, si faltan, contra ?comparar=
+    anterior (los días previos, por defecto) o anio_anterior.
+    """
     try:
-        comparativa = db.obtener_comparativa_periodos()
+        comparaciones = None
+        desde = request.args.get('desde')
+        hasta = request.args.get('hasta')
+        if desde and hasta:
+            try:
+                datetime.strptime(desde, '%Y-%m-%d')
+                datetime.strptime(hasta, '%Y-%m-%d')
+                if request.args.get('comparar_desde') and request.args.get('comparar_hasta'):
+                    anterior = (request.args['comparar_desde'], request.args['comparar_hasta'])
+                    for fecha in anterior:
+                        datetime.strptime(fecha, '%Y-%m-%d')
+                else:
+                    anterior = ventana_comparacion(desde, hasta, request.args.get('comparar', 'anterior'))
+            except ValueError as e:
+                return jsonify({'success': False, 'message': f'Parámetros inválidos: {e}'}), 400
+            
+            comparaciones = comparaciones_predeterminadas(datetime.now()) + (
+                ('personalizado', (desde, hasta), anterior),
+            )
+        
+        comparativa = db.obtener_comparativa_periodos(comparaciones)
         if comparativa:
             return jsonify({'success': True, 'data': comparativa})
         return jsonify({'success': False, 'message': 'Error al obtener comparativa'}), 500
@@ -1110,6 +1346,28 @@ def api_estadisticas_ventas_hora():
         print(f"Error al obtener ventas por hora: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/estadisticas/mapa-calor')
+@login_required
+def api_estadisticas_mapa_calor():
+    """API para el mapa de calor día de la semana x hora de las ventas"""
+    try:
+        fecha_desde = request.args.get('desde')
+        fecha_hasta = request.args.get('hasta')
+        try:
+            for fecha in (fecha_desde, fecha_hasta):
+                if fecha:
+                    datetime.strptime(fecha, '%Y-%m-%d')
+        except ValueError as e:
+            return jsonify({'success': False, 'message': f'Parámetros inválidos: {e}'}), 400
+        
+        mapa = db.obtener_mapa_calor_ventas(fecha_desde, fecha_hasta)
+        if mapa:
+            return jsonify({'success': True, 'data': mapa})
+        return jsonify({'success': False, 'message': 'Error al obtener mapa de calor'}), 500
+    except Exception as e:
+        print(f"Error al obtener mapa de calor: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/estadisticas/exportar')
 @login_required
 def api_estadisticas_exportar():
@@ -1125,14 +1383,11 @@ def api_estadisticas_exportar():
             fecha_desde = hoy.replace(day=1).strftime('%Y-%m-%d')
             fecha_hasta = hoy.strftime('%Y-%m-%d')
         
-        archivo = db.exportar_estadisticas_excel(fecha_desde, fecha_hasta)
-        
-        if archivo:
-            return send_file(archivo, as_attachment=True, 
-                           download_name=f'estadisticas_{fecha_desde}_{fecha_hasta}.xlsx')
-        
-        flash('Error al generar el reporte', 'danger')
-        return redirect(url_for('estadisticas'))
+        # Este reporte usa openpyxl completo (con gráficos): no informa filas
+        return responder_excel(f'estadisticas_{fecha_desde}_{fecha_hasta}.xlsx',
+                               lambda base, destino=None, progreso=None:
+                                   base.exportar_estadisticas_excel(fecha_desde, fecha_hasta, destino),
+                               cache=('estadisticas', fecha_desde, fecha_hasta))
         
     except Exception as e:
         print(f"Error al exportar estadísticas: {e}")
@@ -1145,6 +1400,96 @@ def api_estadisticas_exportar():
 # FIN DEL CÓDIGO PARA app.py
 # ============================================
 
+# ===== MÉTRICAS =====
+
+PETICION_SEGUNDOS = METRICAS.resumen('http_peticion_segundos', 'Duración de cada petición por ruta',
+                                     ventana=METRICAS_VENTANA)
+PETICION_DB_SEGUNDOS = METRICAS.resumen('http_peticion_db_segundos', 'Tiempo en Database por petición',
+                                        ventana=METRICAS_VENTANA)
+RESPUESTA_BYTES = METRICAS.resumen('http_respuesta_bytes', 'Tamaño del cuerpo de la respuesta',
+                                   ventana=METRICAS_VENTANA)
+PETICIONES = METRICAS.contador('http_peticiones_total', 'Peticiones atendidas por ruta y estado')
+
+@app.before_request
+def iniciar_medicion():
+    """Marcar el inicio de la petición y empezar a acumular el tiempo en la base"""
+    g.inicio_peticion = time.perf_counter()
+    g.tiempo_db = iniciar_tiempo_db()
+
+@app.after_request
+def registrar_medicion(response):
+    """Registrar duración, tiempo en base y tamaño; agregar el header Server-Timing"""
+    inicio = g.get('inicio_peticion')
+    if inicio is None:
+        return response
+    
+    total = time.perf_counter() - inicio
+    en_db = g.tiempo_db[0]
+    etiquetas = {
+        'ruta': request.url_rule.rule if request.url_rule else 'sin_ruta',
+        'metodo': request.method
+    }
+    
+    PETICION_SEGUNDOS.observar(total, **etiquetas)
+    PETICION_DB_SEGUNDOS.observar(en_db, **etiquetas)
+    PETICIONES.incrementar(estado=f'{response.status_code // 100}xx', **etiquetas)
+    
+    # Las respuestas en flujo (CSV, NDJSON) no tienen tamaño conocido aquí
+    if not response.is_streamed and response.content_length is not None:
+        RESPUESTA_BYTES.observar(response.content_length, **etiquetas)
+    
+    response.headers['Server-Timing'] = (
+        f'db;dur={en_db * 1000:.1f}, render;dur={(total - en_db) * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+    return response
+
+def metricas_autorizadas():
+    """Sesión iniciada o 'Authorization: Bearer <METRICS_TOKEN>'"""
+    autorizacion = request.headers.get('Authorization', '')
+    con_token = bool(METRICS_TOKEN) and hmac.compare_digest(autorizacion, f'Bearer {METRICS_TOKEN}')
+    return session.get('logged_in') or con_token
+
+@app.route('/api/_metrics')
+def api_metricas():
+    """Métricas en formato de texto de Prometheus (sesión iniciada o token Bearer)"""
+    if not metricas_autorizadas():
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    
+    return Response(METRICAS.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/_metrics/rutas')
+def api_metricas_rutas():
+    """p50/p95/p99 de duración, tiempo en base y tamaño por ruta (en ms y bytes)"""
+    if not metricas_autorizadas():
+        return jsonify({'success': False, 'message': 'No autorizado'}), 401
+    
+    def cuantiles(datos, escala=1):
+        if datos is None:
+            return None
+        return {f'p{int(q * 100)}': round(v * escala, 2) if v is not None else None
+                for q, v in datos['cuantiles'].items()}
+    
+    duraciones = PETICION_SEGUNDOS.calcular()
+    en_db = PETICION_DB_SEGUNDOS.calcular()
+    tamanos = RESPUESTA_BYTES.calcular()
+    
+    rutas = []
+    for clave, datos in duraciones.items():
+        etiquetas = dict(clave)
+        rutas.append({
+            'ruta': etiquetas['ruta'],
+            'metodo': etiquetas['metodo'],
+            'peticiones': datos['total'],
+            'muestras': datos['muestras'],
+            'duracion_ms': cuantiles(datos, 1000),
+            'db_ms': cuantiles(en_db.get(clave), 1000),
+            'bytes': cuantiles(tamanos.get(clave))
+        })
+    rutas.sort(key=lambda r: r['duracion_ms']['p95'] or 0, reverse=True)
+    
+    return jsonify({'success': True, 'ventana_segundos': METRICAS_VENTANA, 'rutas': rutas})
+
 # ===== WEBSOCKET EVENTS =====
 
 @socketio.on('connect')
@@ -1159,8 +1504,118 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Evento cuando un cliente se desconecta"""
+    suscriptores_dashboard.discard(request.sid)
     print('❌ Cliente desconectado')
 
+# ===== DASHBOARD EN VIVO =====
+# En lugar de que cada dashboard abierto pida /api/dashboard/stats tras cada
+# evento, el servidor lo calcula una vez por tanda de cambios y lo envía a
+# la sala 'dashboard'.
+
+dashboard_pendiente = threading.Event()
+suscriptores_dashboard = set()
+
+@socketio.on('suscribir_dashboard')
+def handle_suscribir_dashboard():
+    """Suscribir el cliente al envío del dashboard; responde si el push está activo"""
+    if DASHBOARD_PUSH_SEGUNDOS <= 0 or not session.get('logged_in'):
+        return {'push': False}
+    join_room('dashboard')
+    suscriptores_dashboard.add(request.sid)
+    return {'push': True}
+
+def marcar_dashboard(tablas):
+    """Las escrituras en tablas del dashboard (las mismas que invalidan su cache) piden un envío"""
+    if set(tablas) & set(TABLAS_DASHBOARD):
+        dashboard_pendiente.set()
+
+db.observadores_escritura.append(marcar_dashboard)
+
+# ===== EXPORTACIONES EN SEGUNDO PLANO =====
+
+@app.route('/api/trabajos/<trabajo_id>')
+@login_required
+def api_trabajo_estado(trabajo_id):
+    """Estado de una exportación en segundo plano"""
+    trabajo = trabajos.obtener(trabajo_id)
+    if not trabajo:
+        return jsonify({'success': False, 'message': 'Trabajo no encontrado'}), 404
+    return jsonify({'success': True, 'trabajo': trabajos.publico(trabajo)})
+
+@app.route('/api/trabajos/<trabajo_id>/descargar')
+@login_required
+def api_trabajo_descargar(trabajo_id):
+    """Descargar el archivo de una exportación terminada"""
+    trabajo = trabajos.obtener(trabajo_id)
+    if not trabajo:
+        return jsonify({'success': False, 'message': 'Trabajo no encontrado'}), 404
+    if trabajo['estado'] != 'listo':
+        return jsonify({'success': False, 'message': f"La exportación está {trabajo['estado']}"}), 409
+    return send_file(os.path.abspath(trabajo['ruta']), mimetype=MIMETYPE_XLSX,
+                     as_attachment=True, download_name=trabajo['nombre'])
+
+@socketio.on('suscribir_trabajo')
+def handle_suscribir_trabajo(trabajo_id):
+    """Recibir 'trabajo_actualizado' de una exportación; responde su estado actual"""
+    trabajo = trabajos.obtener(str(trabajo_id))
+    if not session.get('logged_in') or not trabajo:
+        return None
+    join_room(f'trabajo_{trabajo_id}')
+    return trabajos.publico(trabajo)
+
+
+# ===== TAREAS EN SEGUNDO PLANO =====
+
+def tarea_checkpoint_wal():
+    """Checkpoint periódico del WAL para que no crezca sin límite"""
+    while True:
+        socketio.sleep(WAL_CHECKPOINT_SEGUNDOS)
+        db.checkpoint_wal()
+
+if WAL_CHECKPOINT_SEGUNDOS > 0 and db.pragmas['journal_mode'].upper() == 'WAL':
+    socketio.start_background_task(tarea_checkpoint_wal)
+
+def tarea_snapshot_stock():
+    """Generar las fotos diarias de stock de los días ya cerrados"""
+    while True:
+        db.generar_snapshots_stock()
+        socketio.sleep(STOCK_SNAPSHOT_SEGUNDOS)
+
+if STOCK_SNAPSHOT_SEGUNDOS > 0:
+    socketio.start_background_task(tarea_snapshot_stock)
+
+def tarea_dashboard():
+    """Calcular el dashboard una vez por tanda de cambios y enviarlo a los suscritos"""
+    while True:
+        socketio.sleep(DASHBOARD_PUSH_SEGUNDOS)
+        # Con cola de mensajes los suscritos pueden estar en otro worker
+        if not dashboard_pendiente.is_set() or not (suscriptores_dashboard or SOCKETIO_MESSAGE_QUEUE):
+            continue
+        dashboard_pendiente.clear()
+        stats = db.obtener_estadisticas_dashboard()
+        if stats:
+            socketio.emit('dashboard_actualizado', stats, to='dashboard')
+
+if DASHBOARD_PUSH_SEGUNDOS > 0:
+    socketio.start_background_task(tarea_dashboard)
+
+def tarea_trabajos():
+    """Publicar el avance de las exportaciones y borrar las viejas"""
+    vistos = {}
+    ultima_limpieza = 0
+    while True:
+        socketio.sleep(0.5)
+        for trabajo in trabajos.cambiados(vistos):
+            socketio.emit('trabajo_actualizado', trabajos.publico(trabajo),
+                          to=f"trabajo_{trabajo['id']}")
+        if time.monotonic() - ultima_limpieza >= 60:
+            ultima_limpieza = time.monotonic()
+            borrados = trabajos.limpiar()
+            if borrados:
+                print(f'🧹 Exportaciones viejas borradas: {borrados}')
+
+socketio.start_background_task(tarea_trabajos)
+
 # ===== MANEJADOR DE ERRORES =====
 
 @app.errorhandler(404)
@@ -1181,6 +1636,8 @@ if __name__ == '__main__':
     print(f'📍 Puerto: {port}')
     print(f'👤 Usuario: {ADMIN_USER}')
     print(f'🔑 Contraseña: {ADMIN_PASSWORD}')
+    if SOCKETIO_MESSAGE_QUEUE:
+        print(f"📨 Cola de mensajes: {SOCKETIO_MESSAGE_QUEUE.split('://')[0]}")
     print('-' * 50)
     
     socketio.run(app, debug=False, host='0.0.0.0', port=port)
\ No newline at end of file
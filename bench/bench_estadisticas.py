@@ -0,0 +1,181 @@
+# ============================================
+# BENCHMARK - bench/bench_estadisticas.py
+# ============================================
+# Mide cada método de estadísticas de Database contra bases generadas con
+# bench/generar_datos.py (10k, 100k y 1M ventas por defecto) y guarda los
+# tiempos en JSON, para comparar un cambio en el SQL contra el commit
+# anterior:
+#
+#   python bench/bench_estadisticas.py                       # guarda en bench/resultados/
+#   python bench/bench_estadisticas.py --comparar bench/resultados/estadisticas_abc1234.json
+#
+# Las bases se generan una vez por día y tamaño (los métodos usan "hoy")
+# y quedan en bench/datos/ para las siguientes corridas. El cache de
+# resultados y el perfilado se desactivan: se mide solo la consulta.
+# ============================================
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.database import Database
+from bench.generar_datos import generar
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def casos(hoy):
+    """(método, nombre del caso, kwargs) a medir; las fechas son relativas a hoy"""
+    def hace(dias):
+        return (hoy - timedelta(days=dias)).strftime('%Y-%m-%d')
+
+    fecha_hoy = hoy.strftime('%Y-%m-%d')
+    return [
+        ('obtener_estadisticas_dashboard', 'hoy', {}),
+        ('obtener_ventas_por_periodo', 'dia_30d', {'periodo': 'dia', 'fecha_desde': hace(30), 'fecha_hasta': fecha_hoy}),
+        ('obtener_ventas_por_periodo', 'semana_90d', {'periodo': 'semana', 'fecha_desde': hace(90), 'fecha_hasta': fecha_hoy}),
+        ('obtener_ventas_por_periodo', 'mes_365d', {'periodo': 'mes', 'fecha_desde': hace(365), 'fecha_hasta': fecha_hoy}),
+        ('obtener_top_productos', '30d', {'limite': 10, 'fecha_desde': hace(30), 'fecha_hasta': fecha_hoy}),
+        ('obtener_top_productos', '365d', {'limite': 10, 'fecha_desde': hace(365), 'fecha_hasta': fecha_hoy}),
+        ('obtener_ventas_por_categoria', '30d', {'fecha_desde': hace(30), 'fecha_hasta': fecha_hoy}),
+        ('obtener_ventas_por_categoria', '365d', {'fecha_desde': hace(365), 'fecha_hasta': fecha_hoy}),
+        ('obtener_resumen_financiero', 'mes', {}),
+        ('obtener_resumen_financiero', '365d', {'fecha_desde': hace(365), 'fecha_hasta': fecha_hoy}),
+        ('obtener_comparativa_periodos', 'hoy', {}),
+        ('obtener_ventas_por_hora', 'hoy', {}),
+        ('obtener_ventas_por_hora', 'ayer', {'fecha': hace(1)}),
+        ('obtener_mapa_calor_ventas', '28d', {}),
+        ('obtener_mapa_calor_ventas', '365d', {'fecha_desde': hace(365), 'fecha_hasta': fecha_hoy}),
+    ]
+
+
+def preparar_base(ventas, semilla, directorio):
+    """Ruta de la base generada para el tamaño (la crea si falta)"""
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    ruta = os.path.join(directorio, f'ventas_{ventas}_s{semilla}_{hoy}.db')
+    if not os.path.exists(ruta):
+        print(f'   Generando {ruta}...')
+        inicio = time.perf_counter()
+        generar(ruta + '.tmp', ventas=ventas, semilla=semilla, hasta=hoy)
+        os.replace(ruta + '.tmp', ruta)
+        print(f'   Lista en {time.perf_counter() - inicio:.1f} s')
+    return ruta
+
+
+def medir(db, metodo, kwargs, repeticiones):
+    """Tiempos (segundos) de varias llamadas, después de una de calentamiento"""
+    llamar = getattr(db, metodo)
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultado = llamar(**kwargs)
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            llamar(**kwargs)
+            tiempos.append(time.perf_counter() - inicio)
+    return tiempos, resultado is not None
+
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=DIRECTORIO, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+
+def ejecutar(tamanos, repeticiones=5, semilla=42, directorio=None):
+    """Medir todos los casos en cada tamaño; devuelve el resultado como dict"""
+    directorio = directorio or os.path.join(DIRECTORIO, 'datos')
+    os.makedirs(directorio, exist_ok=True)
+
+    resultado = {
+        'commit': commit_actual(),
+        'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'repeticiones': repeticiones,
+        'semilla': semilla,
+        'tamanos': {}
+    }
+
+    for ventas in tamanos:
+        print(f'\n📊 {ventas} ventas')
+        ruta = preparar_base(ventas, semilla, directorio)
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = Database(ruta, usar_cache=False, usar_metricas=False)
+
+        medidos = {}
+        for metodo, caso, kwargs in casos(datetime.now()):
+            tiempos, correcto = medir(db, metodo, kwargs, repeticiones)
+            clave = f'{metodo}[{caso}]'
+            medidos[clave] = {
+                'min_ms': round(min(tiempos) * 1000, 3),
+                'mediana_ms': round(statistics.median(tiempos) * 1000, 3),
+                'media_ms': round(statistics.mean(tiempos) * 1000, 3),
+                'max_ms': round(max(tiempos) * 1000, 3),
+                'correcto': correcto
+            }
+            print(f"   {clave:<52}{medidos[clave]['mediana_ms']:>10.2f} ms"
+                  f"{'' if correcto else '  ❌ devolvió None'}")
+
+        if db.pool:
+            db.pool.cerrar()
+        resultado['tamanos'][str(ventas)] = medidos
+
+    return resultado
+
+
+def comparar(actual, anterior):
+    """Imprimir la mediana de cada caso contra la de otra corrida"""
+    print(f"\nComparación con {anterior.get('commit')} ({anterior.get('fecha')})")
+    print(f"{'Caso':<60}{'Antes':>10}{'Ahora':>10}{'Cambio':>9}")
+    for ventas, medidos in actual['tamanos'].items():
+        previos = anterior.get('tamanos', {}).get(ventas, {})
+        for clave, datos in medidos.items():
+            if clave not in previos:
+                continue
+            antes, ahora = previos[clave]['mediana_ms'], datos['mediana_ms']
+            cambio = f'{ahora / antes:.2f}x' if antes else '-'
+            print(f"{ventas + ' ' + clave:<60}{antes:>10.2f}{ahora:>10.2f}{cambio:>9}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de los métodos de estadísticas')
+    parser.add_argument('--tamanos', default='10000,100000,1000000',
+                        help='Cantidades de ventas separadas por coma')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--datos', help='Directorio de las bases generadas (bench/datos)')
+    parser.add_argument('--salida', help='Archivo JSON (bench/resultados/estadisticas_<commit>.json)')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior')
+    args = parser.parse_args()
+
+    tamanos = [int(t) for t in args.tamanos.split(',') if t.strip()]
+
+    print('=' * 50)
+    print(f'BENCHMARK ESTADÍSTICAS: {", ".join(map(str, tamanos))} ventas')
+    print('=' * 50)
+
+    resultado = ejecutar(tamanos, max(1, args.repeticiones), args.semilla, args.datos)
+
+    salida = args.salida or os.path.join(DIRECTORIO, 'resultados',
+                                         f"estadisticas_{resultado['commit']}.json")
+    if os.path.dirname(salida):
+        os.makedirs(os.path.dirname(salida), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+    print(f'\n✅ Resultado guardado en {salida}')
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            comparar(resultado, json.load(archivo))
@@ -0,0 +1,86 @@
+# ============================================
+# BENCHMARK - bench/bench_pool.py
+# ============================================
+# Compara ventas/segundo con y sin pool de conexiones, y contra
+# registrar_venta_completa (una sola transacción por venta).
+# Ejecuta: python bench/bench_pool.py [num_ventas] [items_por_venta]
+# ============================================
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.database import Database
+
+
+def preparar_db(db_path, pool_size, num_productos=50):
+    """Crear base de datos temporal con productos y caja abierta"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = Database(db_path, pool_size=pool_size)
+        for i in range(num_productos):
+            db.crear_producto(f'Producto {i}', '', None, 10, 15, 'unidad',
+                              'Cervezas', 1000000, 5)
+        db.abrir_caja(100)
+    return db
+
+
+def registrar_venta(db, items):
+    """Recorrido por línea: una llamada (y un commit) por detalle y stock"""
+    db.obtener_caja_actual()
+    total = sum(item['subtotal'] for item in items)
+    venta_id = db.crear_venta(total=total, metodo_pago='efectivo')
+    for item in items:
+        db.crear_detalle_venta(venta_id, item['producto_id'], item['producto_nombre'],
+                               item['cantidad'], item['precio_unitario'], item['subtotal'])
+        db.actualizar_stock(item['producto_id'], item['cantidad'], 'restar')
+
+
+def registrar_venta_transaccion(db, items):
+    """Mismo recorrido que api_crear_venta en app.py"""
+    db.obtener_caja_actual()
+    total = sum(item['subtotal'] for item in items)
+    db.registrar_venta_completa(total=total, metodo_pago='efectivo', items=items)
+
+
+def medir(pool_size, num_ventas, items_por_venta, registrar=registrar_venta):
+    """Devolver ventas por segundo para un tamaño de pool"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = preparar_db(os.path.join(tmp, 'bench.db'), pool_size)
+        items = [{
+            'producto_id': i + 1,
+            'producto_nombre': f'Producto {i}',
+            'cantidad': 1,
+            'precio_unitario': 15,
+            'subtotal': 15
+        } for i in range(items_por_venta)]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            for _ in range(num_ventas):
+                registrar(db, items)
+            duracion = time.perf_counter() - inicio
+
+        if db.pool:
+            db.pool.cerrar()
+        return num_ventas / duracion
+
+
+if __name__ == '__main__':
+    num_ventas = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    items_por_venta = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print('=' * 50)
+    print(f'BENCHMARK POOL: {num_ventas} ventas x {items_por_venta} items')
+    print('=' * 50)
+
+    sin_pool = medir(0, num_ventas, items_por_venta)
+    con_pool = medir(5, num_ventas, items_por_venta)
+    transaccion = medir(5, num_ventas, items_por_venta, registrar_venta_transaccion)
+
+    print(f'   Sin pool:              {sin_pool:8.1f} ventas/seg')
+    print(f'   Con pool:              {con_pool:8.1f} ventas/seg  ({con_pool / sin_pool:.2f}x)')
+    print(f'   Una transacción/venta: {transaccion:8.1f} ventas/seg  ({transaccion / sin_pool:.2f}x)')
@@ -0,0 +1,257 @@
+# ============================================
+# PRUEBA DE CARGA - bench/carga.py
+# ============================================
+# Varios hilos piden rutas de la API con el cliente de pruebas de Flask
+# (sin red) durante un tiempo fijo y se informa el throughput y la
+# latencia p50/p95/p99 de cada escenario. Conviene correrla sobre una base
+# generada con bench/generar_datos.py:
+#
+#   python bench/generar_datos.py --db /tmp/bench.db --ventas 100000
+#   python bench/carga.py --db /tmp/bench.db --hilos 8 --duracion 20
+#
+# La mezcla se ajusta con --mezcla "venta=4,caja=3,dashboard=3,csv=1,excel=0.2"
+# y --json guarda el resultado para compararlo entre commits.
+#
+# Con --procesos N los hilos se reparten en N procesos con su propia app,
+# como los workers de gunicorn (WEB_CONCURRENCY=N: cache compartido y bus de
+# Socket.IO en SQLite), para ver cómo escala con los núcleos:
+#
+#   python bench/carga.py --db /tmp/bench.db --hilos 8 --procesos 4
+# ============================================
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MEZCLA_DEFECTO = 'venta=4,caja=3,dashboard=3,csv=1,excel=0.2'
+
+
+def _rango_exportacion():
+    hoy = datetime.now()
+    return (hoy - timedelta(days=7)).strftime('%Y-%m-%d'), hoy.strftime('%Y-%m-%d')
+
+
+def escenario_venta(cliente, rng, productos):
+    """POST /api/ventas con 1 a 3 productos al azar"""
+    items = []
+    for producto in rng.sample(productos, k=min(len(productos), rng.randint(1, 3))):
+        items.append({
+            'producto_id': producto['id'],
+            'producto_nombre': producto['nombre'],
+            'cantidad': 1,
+            'precio_unitario': producto['precio_venta'],
+            'subtotal': producto['precio_venta']
+        })
+    return cliente.post('/api/ventas', json={
+        'total': sum(item['subtotal'] for item in items),
+        'metodo_pago': rng.choice(['efectivo', 'efectivo', 'qr']),
+        'items': items
+    })
+
+
+def escenario_caja(cliente, rng, productos):
+    return cliente.get('/api/caja/actual')
+
+
+def escenario_dashboard(cliente, rng, productos):
+    return cliente.get('/api/dashboard/stats')
+
+
+def escenario_csv(cliente, rng, productos):
+    desde, hasta = _rango_exportacion()
+    return cliente.get(f'/api/ventas/exportar?desde={desde}&hasta={hasta}&format=csv')
+
+
+def escenario_excel(cliente, rng, productos):
+    """Exportación en segundo plano: encolar, esperar a que termine y descargar"""
+    desde, hasta = _rango_exportacion()
+    respuesta = cliente.get(f'/api/ventas/exportar?desde={desde}&hasta={hasta}')
+    if respuesta.status_code != 202:
+        return respuesta
+    trabajo = respuesta.get_json()['trabajo']
+    while trabajo['estado'] in ('en_cola', 'en_curso'):
+        time.sleep(0.05)
+        trabajo = cliente.get(f"/api/trabajos/{trabajo['id']}").get_json()['trabajo']
+    return cliente.get(f"/api/trabajos/{trabajo['id']}/descargar")
+
+
+ESCENARIOS = {
+    'venta': escenario_venta,
+    'caja': escenario_caja,
+    'dashboard': escenario_dashboard,
+    'csv': escenario_csv,
+    'excel': escenario_excel,
+}
+
+
+def leer_mezcla(texto):
+    """'venta=4,caja=3' -> {'venta': 4.0, 'caja': 3.0}"""
+    mezcla = {}
+    for parte in texto.split(','):
+        nombre, _, peso = parte.partition('=')
+        nombre = nombre.strip()
+        if nombre not in ESCENARIOS:
+            raise ValueError(f'Escenario desconocido: {nombre} (hay {", ".join(ESCENARIOS)})')
+        mezcla[nombre] = float(peso or 1)
+    return {nombre: peso for nombre, peso in mezcla.items() if peso > 0}
+
+
+def percentil(valores, q):
+    """Percentil por rango más cercano de una lista ordenada"""
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, int(q * len(valores)))]
+
+
+def nuevo_cliente(app, usuario, clave):
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': usuario, 'password': clave})
+    return cliente
+
+
+def trabajador(app, credenciales, mezcla, productos, semilla, hasta, resultados):
+    """Pedir escenarios al azar hasta el tiempo límite, anotando (escenario, segundos, estado)"""
+    rng = random.Random(semilla)
+    cliente = nuevo_cliente(app, *credenciales)
+    nombres, pesos = list(mezcla), list(mezcla.values())
+    propios = []
+
+    while time.monotonic() < hasta:
+        nombre = rng.choices(nombres, weights=pesos)[0]
+        inicio = time.perf_counter()
+        respuesta = ESCENARIOS[nombre](cliente, rng, productos)
+        respuesta.get_data()  # Las exportaciones se generan mientras se leen
+        propios.append((nombre, time.perf_counter() - inicio, respuesta.status_code))
+        respuesta.close()
+
+    resultados.extend(propios)
+
+
+def cargar(hilos, duracion, mezcla, productos, semilla):
+    """Correr la carga en este proceso; devuelve ([(escenario, segundos, estado)], segundos)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import app, ADMIN_USER, ADMIN_PASSWORD
+
+    credenciales = (ADMIN_USER, ADMIN_PASSWORD)
+    resultados = []
+    hasta = time.monotonic() + duracion
+    trabajadores = [
+        threading.Thread(target=trabajador,
+                         args=(app, credenciales, mezcla, productos, semilla + i, hasta, resultados))
+        for i in range(hilos)
+    ]
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in trabajadores:
+            t.start()
+        for t in trabajadores:
+            t.join()
+    return resultados, time.perf_counter() - inicio
+
+
+def ejecutar(hilos=8, duracion=20, mezcla=None, semilla=42, procesos=1):
+    """Correr la carga contra la base de DB_PATH; devuelve el resumen por escenario"""
+    procesos = max(1, min(procesos, hilos))
+    if procesos > 1:
+        # Los procesos hijos heredan el entorno: se configuran como N workers
+        os.environ['WEB_CONCURRENCY'] = str(procesos)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import db
+
+    mezcla = leer_mezcla(mezcla or MEZCLA_DEFECTO)
+
+    # Las ventas necesitan una caja abierta y productos con stock
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not db.obtener_caja_actual():
+            db.abrir_caja(200)
+        productos = [dict(p) for p in db.obtener_productos() if p['stock'] > 0]
+    if 'venta' in mezcla and not productos:
+        raise RuntimeError('No hay productos con stock para el escenario de ventas')
+
+    if procesos == 1:
+        resultados, transcurrido = cargar(hilos, duracion, mezcla, productos, semilla)
+    else:
+        # Reparto de hilos: los primeros procesos se llevan el resto
+        partes = [(hilos // procesos + (1 if i < hilos % procesos else 0), duracion, mezcla,
+                   productos, semilla + 1000 * i) for i in range(procesos)]
+        with multiprocessing.get_context('spawn').Pool(procesos) as pool:
+            corridas = pool.starmap(cargar, partes)
+        resultados = [r for propios, _ in corridas for r in propios]
+        transcurrido = max(segundos for _, segundos in corridas)
+
+    resumen = {}
+    for nombre in mezcla:
+        tiempos = sorted(s for n, s, _ in resultados if n == nombre)
+        estados = {}
+        for n, _, estado in resultados:
+            if n == nombre:
+                estados[estado] = estados.get(estado, 0) + 1
+        resumen[nombre] = {
+            'peticiones': len(tiempos),
+            'por_segundo': round(len(tiempos) / transcurrido, 1),
+            'errores': sum(c for estado, c in estados.items() if estado >= 400),
+            'estados': {str(estado): c for estado, c in sorted(estados.items())},
+            **{f'p{int(q * 100)}_ms': round(percentil(tiempos, q) * 1000, 2) if tiempos else None
+               for q in (0.5, 0.95, 0.99)},
+            'max_ms': round(tiempos[-1] * 1000, 2) if tiempos else None,
+        }
+
+    return {
+        'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'hilos': hilos,
+        'procesos': procesos,
+        'duracion_s': round(transcurrido, 2),
+        'peticiones': len(resultados),
+        'por_segundo': round(len(resultados) / transcurrido, 1),
+        'escenarios': resumen,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prueba de carga de la API')
+    parser.add_argument('--db', help='Base a usar (por defecto la de DB_PATH o database/licoreria.db)')
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--procesos', type=int, default=1, help='Procesos (workers) entre los que se reparten los hilos')
+    parser.add_argument('--duracion', type=float, default=20, help='Segundos de carga')
+    parser.add_argument('--mezcla', default=MEZCLA_DEFECTO)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--json', help='Guardar el resultado en este archivo')
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ['DB_PATH'] = args.db
+    # Sin tareas en segundo plano para no mezclar su trabajo con la medición
+    os.environ.setdefault('WAL_CHECKPOINT_SEGUNDOS', '0')
+    os.environ.setdefault('STOCK_SNAPSHOT_SEGUNDOS', '0')
+
+    print('=' * 78)
+    print(f'PRUEBA DE CARGA: {args.hilos} hilos en {args.procesos} proceso(s) x {args.duracion:g} s ({args.mezcla})')
+    print('=' * 78)
+
+    resultado = ejecutar(args.hilos, args.duracion, args.mezcla, args.semilla, args.procesos)
+
+    print(f"{'Escenario':<12}{'Peticiones':>11}{'Req/s':>9}{'Errores':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>10}")
+    for nombre, datos in resultado['escenarios'].items():
+        print(f"{nombre:<12}{datos['peticiones']:>11}{datos['por_segundo']:>9}{datos['errores']:>9}"
+              f"{datos['p50_ms'] or 0:>9.1f}{datos['p95_ms'] or 0:>9.1f}"
+              f"{datos['p99_ms'] or 0:>9.1f}{datos['max_ms'] or 0:>10.1f}")
+    print('-' * 78)
+    print(f"Total: {resultado['peticiones']} peticiones, {resultado['por_segundo']} req/s")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+        print(f'✅ Resultado guardado en {args.json}')
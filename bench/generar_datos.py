@@ -0,0 +1,407 @@
+# ============================================
+# GENERADOR DE DATOS - bench/generar_datos.py
+# ============================================
+# Llena una base con volúmenes realistas para los benchmarks: productos,
+# ventas con detalle, compras y gastos, créditos con pagos y una caja
+# cerrada por día. Con la misma semilla se generan los mismos datos.
+#
+# Las filas se insertan directo (sin pasar por los métodos de Database),
+# pero con los mismos valores que escribe la aplicación; los triggers
+# mantienen el resumen diario, los contadores de caja, la versión del
+# catálogo y el índice de búsqueda.
+#
+# Ejecuta: python bench/generar_datos.py [--ventas 100000] [--productos 300]
+#          [--dias 365] [--semilla 42] [--db database/licoreria.db] [--reemplazar]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.database import Database
+
+CATEGORIAS = {
+    # categoría: (marcas, presentaciones, rango de precio de compra)
+    'cerveza': (['Paceña', 'Huari', 'Potosina', 'Corona', 'Heineken', 'Stella Artois'],
+                ['Lata 355ml', 'Botella 620ml', 'Six Pack', 'Caja x12'], (6, 90)),
+    'vino': (['Kohlberg', 'Campos de Solana', 'Aranjuez', 'Casa Real', 'Concha y Toro'],
+             ['Tinto 750ml', 'Blanco 750ml', 'Rosé 750ml', 'Reserva 750ml'], (35, 180)),
+    'whisky': (['Johnnie Walker', 'Chivas Regal', 'Jack Daniels', 'Old Parr', 'Ballantines'],
+               ['Red 750ml', 'Black 750ml', '12 años 1L', 'Honey 750ml'], (120, 650)),
+    'ron': (['Havana Club', 'Bacardí', 'Flor de Caña', 'Abuelo'],
+            ['Blanco 750ml', 'Añejo 750ml', '7 años 1L'], (60, 260)),
+    'vodka': (['Absolut', 'Smirnoff', 'Skyy', 'Grey Goose'],
+              ['750ml', '1L', 'Saborizado 750ml'], (55, 320)),
+    'tequila': (['José Cuervo', 'Don Julio', 'Olmeca'],
+                ['Blanco 750ml', 'Reposado 750ml'], (110, 480)),
+    'licor': (['Singani Casa Real', 'Singani Rujero', 'Baileys', 'Jägermeister', 'Amaretto'],
+              ['750ml', '1L', 'Petaca 375ml'], (40, 220)),
+    'otro': (['Coca-Cola', 'Red Bull', 'Schweppes', 'Hielo', 'Maní'],
+             ['2L', 'Lata', 'Bolsa 3kg', 'Paquete'], (4, 25)),
+}
+UNIDADES = ['unidad', 'botella', 'caja', 'pack']
+
+CLIENTES = ['Juan Pérez', 'María López', 'Carlos Mamani', 'Ana Quispe', 'Luis Flores',
+            'Rosa Choque', 'Jorge Vargas', 'Sofía Rojas', 'Miguel Gutiérrez', 'Elena Torrez',
+            'Pedro Condori', 'Lucía Fernández', 'Diego Castro', 'Valeria Romero', 'Raúl Ticona']
+PROVEEDORES = ['CBN', 'Distribuidora El Alto', 'Importadora Andina', 'Vinos del Sur', 'Mayorista Central']
+GASTOS = ['Luz', 'Agua', 'Internet', 'Alquiler', 'Limpieza', 'Bolsas', 'Transporte']
+
+# Distribución de las ventas
+METODOS_PAGO = (['efectivo', 'qr', 'mixto', 'credito'], [55, 30, 7, 8])
+LINEAS_POR_VENTA = ([1, 2, 3, 4, 5], [45, 28, 15, 8, 4])
+CANTIDAD_POR_LINEA = ([1, 2, 3, 6], [70, 18, 8, 4])
+# Peso de cada hora de 10:00 a 23:00 (más movimiento de noche)
+PESO_HORA = {10: 2, 11: 3, 12: 4, 13: 4, 14: 3, 15: 3, 16: 4, 17: 6,
+             18: 9, 19: 11, 20: 12, 21: 11, 22: 8, 23: 5}
+# Peso de cada día de la semana (lunes = 0)
+PESO_DIA_SEMANA = [0.8, 0.8, 0.9, 1.0, 1.4, 1.7, 1.1]
+
+LINEAS_PROMEDIO = sum(n * p for n, p in zip(*LINEAS_POR_VENTA)) / sum(LINEAS_POR_VENTA[1])
+CANTIDAD_PROMEDIO = sum(n * p for n, p in zip(*CANTIDAD_POR_LINEA)) / sum(CANTIDAD_POR_LINEA[1])
+
+
+def _hora(rng, dia):
+    """Instante al azar dentro del horario de atención del día"""
+    hora = rng.choices(list(PESO_HORA), weights=list(PESO_HORA.values()))[0]
+    return dia + timedelta(hours=hora, minutes=rng.randrange(60), seconds=rng.randrange(60))
+
+
+def _texto(fecha):
+    return fecha.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _ventas_por_dia(rng, dias, total):
+    """Repartir el total de ventas entre los días según el día de la semana"""
+    pesos = [PESO_DIA_SEMANA[d.weekday()] * rng.uniform(0.85, 1.15) for d in dias]
+    suma = sum(pesos)
+    cantidades = [int(total * p / suma) for p in pesos]
+    for i in range(total - sum(cantidades)):
+        cantidades[i % len(cantidades)] += 1
+    return cantidades
+
+
+class Generador:
+    """Estado de la generación: contadores de ids y stock de cada producto"""
+
+    def __init__(self, cursor, rng, dias, ventas):
+        self.cursor = cursor
+        self.rng = rng
+        self.dias = dias
+        self.ventas = ventas
+        self.ids = {'ventas': 0, 'compras': 0, 'creditos': 0, 'pagos_creditos': 0, 'caja': 0}
+        self.productos = []
+        self.stock = {}
+        self.objetivo = {}
+        self.creditos_abiertos = []
+        self.conteo = {'detalle_ventas': 0, 'movimientos_caja': 0, 'movimientos_stock': 0}
+
+    def _siguiente(self, tabla):
+        self.ids[tabla] += 1
+        return self.ids[tabla]
+
+    def crear_productos(self, cantidad):
+        """Productos con popularidad desigual (unos pocos venden mucho)"""
+        rng = self.rng
+        inicio = _texto(self.dias[0] - timedelta(days=1))
+        filas = []
+        nombres = set()
+        for producto_id in range(1, cantidad + 1):
+            categoria = rng.choice(list(CATEGORIAS))
+            marcas, presentaciones, (minimo, maximo) = CATEGORIAS[categoria]
+            nombre = f'{rng.choice(marcas)} {rng.choice(presentaciones)}'
+            if nombre in nombres:
+                nombre = f'{nombre} #{producto_id}'
+            nombres.add(nombre)
+
+            precio_compra = round(rng.uniform(minimo, maximo), 1)
+            precio_venta = round(precio_compra * rng.uniform(1.25, 1.6), 1)
+            popularidad = 1 / producto_id ** 0.8 * rng.uniform(0.5, 1.5)
+            self.productos.append({
+                'id': producto_id, 'nombre': nombre, 'precio_compra': precio_compra,
+                'precio_venta': precio_venta, 'popularidad': popularidad
+            })
+            filas.append((producto_id, nombre, f'{nombre} ({categoria})', precio_compra,
+                          precio_venta, rng.choice(UNIDADES), categoria,
+                          rng.choice([5, 10, 12, 24]), inicio, inicio))
+
+        self.cursor.executemany('''
+            INSERT INTO productos
+            (id, nombre, descripcion, precio_compra, precio_venta, unidad, categoria,
+             stock, stock_minimo, fecha_creacion, fecha_modificacion)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?)
+        ''', filas)
+
+        # Stock objetivo: una semana de la demanda esperada de cada producto
+        suma = sum(p['popularidad'] for p in self.productos)
+        unidades_dia = self.ventas / len(self.dias) * LINEAS_PROMEDIO * CANTIDAD_PROMEDIO
+        self.pesos = [p['popularidad'] for p in self.productos]
+        for p in self.productos:
+            demanda = unidades_dia * p['popularidad'] / suma
+            self.objetivo[p['id']] = max(30, math.ceil(demanda * 7))
+            self.stock[p['id']] = self.objetivo[p['id']]
+
+        self._movimientos_stock([(p['id'], inicio, self.stock[p['id']], 'inicial', None,
+                                  p['precio_compra']) for p in self.productos])
+
+    def _movimientos_stock(self, filas):
+        """Filas (producto_id, fecha, cantidad, origen, referencia_id, costo_unitario)"""
+        self.cursor.executemany('''
+            INSERT INTO movimientos_stock
+            (producto_id, fecha, cantidad, origen, referencia_id, costo_unitario)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', filas)
+        self.conteo['movimientos_stock'] += len(filas)
+
+    def generar_dia(self, dia, num_ventas):
+        """Caja del día con sus ventas, pagos de crédito, compras y gastos"""
+        rng = self.rng
+        caja_id = self._siguiente('caja')
+        self.cursor.execute('''
+            INSERT INTO caja (id, fecha_apertura, monto_inicial, estado, usuario)
+            VALUES (?, ?, ?, 'abierta', 'admin')
+        ''', (caja_id, _texto(dia + timedelta(hours=9)), 200))
+
+        ventas, detalle, libro, caja, creditos = [], [], [], [], []
+        for fecha in sorted(_hora(rng, dia) for _ in range(num_ventas)):
+            venta_id = self._siguiente('ventas')
+            fecha = _texto(fecha)
+            total = 0
+            lineas = rng.choices(LINEAS_POR_VENTA[0], weights=LINEAS_POR_VENTA[1])[0]
+            for producto in rng.choices(self.productos, weights=self.pesos, k=lineas):
+                cantidad = rng.choices(CANTIDAD_POR_LINEA[0], weights=CANTIDAD_POR_LINEA[1])[0]
+                subtotal = round(cantidad * producto['precio_venta'], 2)
+                total += subtotal
+                detalle.append((venta_id, producto['id'], producto['nombre'], cantidad,
+                                producto['precio_venta'], subtotal))
+                libro.append((producto['id'], fecha, -cantidad, 'venta', venta_id,
+                              producto['precio_compra']))
+                self.stock[producto['id']] -= cantidad
+            total = round(total, 2)
+
+            metodo = rng.choices(*METODOS_PAGO)[0]
+            efectivo = qr = 0
+            cliente = None
+            if metodo == 'efectivo':
+                caja.append((caja_id, 'ingreso', f'Venta #{venta_id}', total, 'efectivo',
+                             venta_id, 'venta', fecha))
+            elif metodo == 'qr':
+                caja.append((caja_id, 'ingreso', f'Venta #{venta_id}', total, 'qr',
+                             venta_id, 'venta', fecha))
+            elif metodo == 'mixto':
+                efectivo = round(total * rng.uniform(0.2, 0.8), 2)
+                qr = round(total - efectivo, 2)
+                caja.append((caja_id, 'ingreso', f'Venta #{venta_id} - Efectivo', efectivo,
+                             'efectivo', venta_id, 'venta', fecha))
+                caja.append((caja_id, 'ingreso', f'Venta #{venta_id} - QR', qr,
+                             'qr', venta_id, 'venta', fecha))
+            else:
+                cliente = rng.choice(CLIENTES)
+                credito_id = self._siguiente('creditos')
+                creditos.append([credito_id, venta_id, cliente, total, fecha])
+            ventas.append((venta_id, total, metodo, efectivo, qr, cliente, fecha))
+
+        self.cursor.executemany('''
+            INSERT INTO ventas
+            (id, total, metodo_pago, monto_efectivo, monto_qr, cliente_nombre, fecha)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ventas)
+        self.cursor.executemany('''
+            INSERT INTO detalle_ventas
+            (venta_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', detalle)
+        self.conteo['detalle_ventas'] += len(detalle)
+        self.cursor.executemany('''
+            INSERT INTO creditos
+            (id, venta_id, cliente_nombre, monto_total, saldo_pendiente, fecha_credito)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(c, v, cliente, total, total, fecha) for c, v, cliente, total, fecha in creditos])
+        self.creditos_abiertos.extend([c, total, 0] for c, _, _, total, _ in creditos)
+
+        caja.extend(self._pagos_creditos(dia, caja_id))
+        caja.extend(self._compras(dia, caja_id, libro))
+        self._movimientos_stock(libro)
+
+        self.cursor.executemany('''
+            INSERT INTO movimientos_caja
+            (caja_id, tipo, concepto, monto, metodo_pago, referencia_id, referencia_tipo, fecha)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', caja)
+        self.conteo['movimientos_caja'] += len(caja)
+
+        # Cierre igual a cerrar_caja, con los contadores que dejaron los triggers
+        self.cursor.execute('''
+            UPDATE caja SET
+                fecha_cierre = ?,
+                total_efectivo = ingresos_efectivo - egresos_efectivo,
+                total_qr = ingresos_qr,
+                total_credito = ingresos_credito,
+                efectivo_esperado = monto_inicial + ingresos_efectivo - egresos_efectivo,
+                efectivo_contado = monto_inicial + ingresos_efectivo - egresos_efectivo + ?,
+                diferencia = ?,
+                estado = 'cerrada'
+            WHERE id = ?
+        ''', (_texto(dia + timedelta(hours=23, minutes=59, seconds=59)),
+              *[rng.choice([0, 0, 0, -5, 5, -10])] * 2, caja_id))
+
+    def _pagos_creditos(self, dia, caja_id):
+        """Algunos clientes pagan parte o todo de lo que deben"""
+        rng = self.rng
+        movimientos, pagos, cambios = [], [], []
+        pendientes = []
+        for credito in self.creditos_abiertos:
+            credito_id, total, pagado = credito
+            if rng.random() < 0.15:
+                saldo = round(total - pagado, 2)
+                monto = saldo if rng.random() < 0.6 else round(saldo * rng.uniform(0.3, 0.7), 2)
+                pago_id = self._siguiente('pagos_creditos')
+                metodo = rng.choice(['efectivo', 'efectivo', 'qr'])
+                fecha = _texto(_hora(rng, dia))
+                pagos.append((pago_id, credito_id, monto, metodo, fecha))
+                movimientos.append((caja_id, 'ingreso', f'Pago de crédito #{credito_id}', monto,
+                                    metodo, pago_id, 'pago_credito', fecha))
+                credito[2] = pagado = round(pagado + monto, 2)
+                estado = 'pagado' if pagado >= total else 'parcial'
+                cambios.append((pagado, max(round(total - pagado, 2), 0), estado, fecha, credito_id))
+            if credito[2] < credito[1]:
+                pendientes.append(credito)
+        self.creditos_abiertos = pendientes
+
+        self.cursor.executemany('''
+            INSERT INTO pagos_creditos (id, credito_id, monto, metodo_pago, fecha)
+            VALUES (?, ?, ?, ?, ?)
+        ''', pagos)
+        self.cursor.executemany('''
+            UPDATE creditos
+            SET monto_pagado = ?, saldo_pendiente = ?, estado = ?, fecha_ultimo_pago = ?
+            WHERE id = ?
+        ''', cambios)
+        return movimientos
+
+    def _compras(self, dia, caja_id, libro):
+        """Reponer al objetivo los productos bajo la mitad, y algún gasto del día"""
+        rng = self.rng
+        compras, detalle, movimientos = [], [], []
+
+        reponer = [p for p in self.productos if self.stock[p['id']] < self.objetivo[p['id']] / 2]
+        if reponer:
+            compra_id = self._siguiente('compras')
+            fecha = _texto(dia + timedelta(hours=9, minutes=30))
+            monto = 0
+            for p in reponer:
+                cantidad = self.objetivo[p['id']] - self.stock[p['id']]
+                subtotal = round(cantidad * p['precio_compra'], 2)
+                monto += subtotal
+                detalle.append((compra_id, p['id'], p['nombre'], cantidad, p['precio_compra'], subtotal))
+                libro.append((p['id'], fecha, cantidad, 'compra', compra_id, p['precio_compra']))
+                self.stock[p['id']] += cantidad
+            metodo = rng.choice(['efectivo', 'qr', 'transferencia'])
+            compras.append((compra_id, 'productos', f'Reposición de {len(reponer)} productos',
+                            round(monto, 2), rng.choice(PROVEEDORES), metodo, fecha))
+            movimientos.append((caja_id, 'egreso', f'Compra de productos #{compra_id}', round(monto, 2),
+                                metodo, compra_id, 'compra', fecha))
+
+        if rng.random() < 0.3:
+            compra_id = self._siguiente('compras')
+            fecha = _texto(_hora(rng, dia))
+            gasto = rng.choice(GASTOS)
+            monto = round(rng.uniform(20, 400), 2)
+            compras.append((compra_id, 'gastos', gasto, monto, None, 'efectivo', fecha))
+            movimientos.append((caja_id, 'egreso', f'Gasto: {gasto}', monto, 'efectivo',
+                                compra_id, 'compra', fecha))
+
+        self.cursor.executemany('''
+            INSERT INTO compras (id, tipo, descripcion, monto, proveedor, metodo_pago, fecha)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', compras)
+        self.cursor.executemany('''
+            INSERT INTO detalle_compras
+            (compra_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', detalle)
+        return movimientos
+
+    def cerrar_stock(self):
+        """Dejar en productos el stock que resulta del libro"""
+        self.cursor.executemany('UPDATE productos SET stock = ? WHERE id = ?',
+                                [(stock, producto_id) for producto_id, stock in self.stock.items()])
+
+
+def generar(db_path, ventas=100000, productos=300, dias=365, semilla=42, hasta=None):
+    """Crear la base en db_path (que no debe existir) y llenarla; devuelve los conteos"""
+    if os.path.exists(db_path):
+        raise FileExistsError(f'{db_path} ya existe')
+
+    directorio = os.path.dirname(db_path)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = Database(db_path, pool_size=0, usar_cache=False, usar_metricas=False)
+
+    rng = random.Random(semilla)
+    ultimo = datetime.strptime(hasta, '%Y-%m-%d') if hasta else datetime.now()
+    ultimo = ultimo.replace(hour=0, minute=0, second=0, microsecond=0)
+    lista_dias = [ultimo - timedelta(days=n) for n in range(dias - 1, -1, -1)]
+
+    conn = db.get_connection()
+    conn.execute('PRAGMA synchronous = OFF')
+    try:
+        cursor = conn.cursor()
+        generador = Generador(cursor, rng, lista_dias, ventas)
+        generador.crear_productos(productos)
+
+        for dia, cantidad in zip(lista_dias, _ventas_por_dia(rng, lista_dias, ventas)):
+            generador.generar_dia(dia, cantidad)
+
+        generador.cerrar_stock()
+        conn.commit()
+    finally:
+        conn.close()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.generar_snapshots_stock()
+        db.checkpoint_wal('TRUNCATE')
+
+    return {'productos': productos, **generador.ids, **generador.conteo}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generar datos de prueba para los benchmarks')
+    parser.add_argument('--db', default='database/licoreria.db')
+    parser.add_argument('--ventas', type=int, default=100000)
+    parser.add_argument('--productos', type=int, default=300)
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--hasta', help='Último día con datos (YYYY-MM-DD, por defecto hoy)')
+    parser.add_argument('--reemplazar', action='store_true',
+                        help='Borrar la base si ya existe (¡pierde sus datos!)')
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        if not args.reemplazar:
+            print(f'❌ {args.db} ya existe; usa --reemplazar para generarla de nuevo')
+            sys.exit(1)
+        for sufijo in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + sufijo):
+                os.remove(args.db + sufijo)
+
+    print('=' * 50)
+    print(f'GENERANDO DATOS: {args.ventas} ventas, {args.productos} productos, {args.dias} días')
+    print('=' * 50)
+
+    inicio = time.perf_counter()
+    conteos = generar(args.db, args.ventas, args.productos, args.dias, args.semilla, args.hasta)
+    duracion = time.perf_counter() - inicio
+
+    for tabla, cantidad in conteos.items():
+        print(f'{tabla:<20} {cantidad:>10}')
+    print(f'✅ {args.db} lista en {duracion:.1f} s')
@@ -13,7 +13,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // WebSocket para actualizaciones en tiempo real
     if (typeof io !== 'undefined') {
-        const socket = io();
+        const socket = io(SOCKET_OPCIONES);
         
         socket.on('caja_abierta', function(data) {
             console.log('Caja abierta:', data);
@@ -26,7 +26,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Conectar Socket.IO para actualizaciones en tiempo real
     if (typeof io !== 'undefined') {
-        const socket = io();
+        const socket = io(SOCKET_OPCIONES);
         
         socket.on('compra_creada', function(data) {
             if (esListado) {
@@ -343,8 +343,7 @@ function exportarExcel() {
     if (desde) url += `desde=${desde}&`;
     if (hasta) url += `hasta=${hasta}`;
     
-    window.location.href = url;
-    mostrarToast('Exportando compras a Excel...', 'info');
+    Exportaciones.excel(url);
 }
 
 function imprimirDetalle() {
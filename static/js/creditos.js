@@ -62,7 +62,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // WebSocket para actualizaciones en tiempo real
     if (typeof io !== 'undefined') {
-        const socket = io();
+        const socket = io(SOCKET_OPCIONES);
         
         socket.on('pago_credito_registrado', function(data) {
             console.log('Pago registrado:', data);
@@ -364,7 +364,7 @@ async function mostrarResumenClientes() {
 
 // Exportar créditos a Excel
 function exportarCreditos() {
-    window.location.href = '/api/creditos/exportar';
+    Exportaciones.excel('/api/creditos/exportar');
     mostrarToast('Exportando créditos...', 'info');
 }
 
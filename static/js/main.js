@@ -287,11 +287,53 @@ const Utils = {
     }
 };
 
+// ===== CATÁLOGO DE PRODUCTOS =====
+const Catalogo = {
+    version: null,
+    productos: new Map(),
+    
+    /**
+     * Sincronizar con el servidor: la primera vez trae el catálogo completo
+     * (el navegador lo revalida con ETag) y después solo los cambios
+     * @returns {Promise<Array>} Productos ordenados por nombre
+     */
+    sincronizar: async function() {
+        const url = this.version === null ? '/api/productos' : `/api/productos?since=${this.version}`;
+        const response = await fetch(url);
+        
+        if (!response.ok) {
+            throw new Error('Error al cargar productos');
+        }
+        
+        const data = await response.json();
+        
+        if (data.completo !== false) {
+            this.productos.clear();
+        }
+        (data.productos || []).forEach(p => this.productos.set(p.id, p));
+        (data.eliminados || []).forEach(id => this.productos.delete(id));
+        
+        if (data.version !== undefined) {
+            this.version = data.version;
+        }
+        
+        return this.lista();
+    },
+    
+    /**
+     * Productos en memoria ordenados por nombre
+     * @returns {Array}
+     */
+    lista: function() {
+        return [...this.productos.values()].sort((a, b) => a.nombre.localeCompare(b.nombre));
+    }
+};
+
 // ===== CONEXIÓN WEBSOCKET (SOCKET.IO) =====
 let socket;
 
 if (typeof io !== 'undefined') {
-    socket = io();
+    socket = io(SOCKET_OPCIONES);
     
     socket.on('connect', function() {
         console.log('✅ Conectado al servidor WebSocket');
@@ -313,8 +355,91 @@ if (typeof io !== 'undefined') {
             Notification[data.type](data.message);
         }
     });
+    
+    socket.on('trabajo_actualizado', function(trabajo) {
+        Exportaciones.actualizar(trabajo);
+    });
 }
 
+// ===== EXPORTACIONES EN SEGUNDO PLANO =====
+const Exportaciones = {
+    pendientes: new Map(),
+    
+    /**
+     * Pedir una exportación Excel: el servidor la genera en segundo plano,
+     * avisa el avance por WebSocket y al terminar se descarga el archivo
+     * @param {string} url - Ruta de exportación con sus parámetros
+     */
+    excel: async function(url) {
+        try {
+            const response = await fetch(url);
+            const data = await response.json();
+            
+            if (!response.ok || !data.success) {
+                throw new Error(data.message || 'Error al exportar');
+            }
+            
+            Notification.info('Generando archivo Excel...');
+            this.seguir(data.trabajo);
+        } catch (error) {
+            console.error('Error:', error);
+            Notification.error(error.message || 'Error al exportar a Excel');
+        }
+    },
+    
+    seguir: function(trabajo) {
+        this.pendientes.set(trabajo.id, {filas: 0, aviso: Date.now()});
+        
+        if (socket && socket.connected) {
+            socket.emit('suscribir_trabajo', trabajo.id, (estado) => {
+                if (estado) this.actualizar(estado);
+            });
+        } else {
+            this.consultar(trabajo.id);
+        }
+    },
+    
+    /**
+     * Sin WebSocket: preguntar el estado cada 2 segundos
+     */
+    consultar: async function(id) {
+        while (this.pendientes.has(id)) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            try {
+                const response = await fetch(`/api/trabajos/${id}`);
+                const data = await response.json();
+                if (!data.success) {
+                    this.pendientes.delete(id);
+                    Notification.error(data.message || 'Error al exportar');
+                    return;
+                }
+                this.actualizar(data.trabajo);
+            } catch (error) {
+                console.error('Error:', error);
+            }
+        }
+    },
+    
+    actualizar: function(trabajo) {
+        const pendiente = this.pendientes.get(trabajo.id);
+        if (!pendiente) return;
+        
+        if (trabajo.estado === 'listo') {
+            this.pendientes.delete(trabajo.id);
+            window.location.href = `/api/trabajos/${trabajo.id}/descargar`;
+            Notification.success('Archivo Excel descargado correctamente');
+        } else if (trabajo.estado === 'error') {
+            this.pendientes.delete(trabajo.id);
+            Notification.error(`Error al exportar: ${trabajo.error}`);
+        } else if (trabajo.filas > pendiente.filas && Date.now() - pendiente.aviso > 5000) {
+            // Avance cada 5 segundos como máximo
+            pendiente.filas = trabajo.filas;
+            pendiente.aviso = Date.now();
+            Notification.info(`Generando archivo Excel... ${trabajo.filas} filas`);
+        }
+    }
+};
+
 // ===== FUNCIONES DE BÚSQUEDA EN TIEMPO REAL =====
 function setupRealtimeSearch(inputId, tableBodyId, searchFunction) {
     const input = document.getElementById(inputId);
@@ -351,6 +476,8 @@ window.Notification = Notification;
 window.Format = Format;
 window.Validate = Validate;
 window.Utils = Utils;
+window.Exportaciones = Exportaciones;
+window.Catalogo = Catalogo;
 
 // ===== LOGS DE CONSOLA PERSONALIZADOS =====
 console.log('%c🍺 Beer Licorería', 'color: #007bff; font-size: 20px; font-weight: bold;');
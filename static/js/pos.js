@@ -19,14 +19,11 @@ document.addEventListener('DOMContentLoaded', function() {
 // ===== CARGAR PRODUCTOS =====
 async function cargarProductos() {
     try {
-        const response = await fetch('/api/productos');
-        const data = await response.json();
-        
-        if (data.success) {
-            productos = data.productos.filter(p => p.stock > 0);
-            mostrarProductos(productos);
-            console.log(`✅ ${productos.length} productos disponibles`);
-        }
+        // Solo se descargan los productos que cambiaron desde la última carga
+        const catalogo = await Catalogo.sincronizar();
+        productos = catalogo.filter(p => p.stock > 0);
+        mostrarResultados();
+        console.log(`✅ ${productos.length} productos disponibles`);
     } catch (error) {
         console.error('Error:', error);
         Notification.error('Error al cargar productos');
@@ -73,15 +70,53 @@ function mostrarProductos(listaProductos) {
 }
 
 // ===== BÚSQUEDA =====
+// Búsqueda en el servidor (índice FTS, sin acentos y por prefijo)
+let busquedaTimeout;
+let ultimaBusqueda = 0;
+
+// Grilla según el buscador: tras una sincronización se repite la búsqueda
+// activa en lugar de mostrar el catálogo completo
+function mostrarResultados() {
+    const input = document.getElementById('searchProducto');
+    const termino = input ? input.value.trim() : '';
+    
+    if (termino) {
+        buscarProductos(termino);
+    } else {
+        mostrarProductos(productos);
+    }
+}
+
+async function buscarProductos(termino) {
+    const numero = ++ultimaBusqueda;
+    
+    try {
+        const params = new URLSearchParams({ q: termino, stock: 1, limit: 50 });
+        const response = await fetch(`/api/productos/buscar?${params}`);
+        const data = await response.json();
+        
+        // Ignorar respuestas de búsquedas anteriores que lleguen tarde
+        if (numero === ultimaBusqueda && data.success) {
+            mostrarProductos(data.productos);
+        }
+    } catch (error) {
+        console.error('Error al buscar productos:', error);
+    }
+}
+
 const searchInput = document.getElementById('searchProducto');
 if (searchInput) {
     searchInput.addEventListener('input', function() {
-        const termino = this.value.toLowerCase();
-        const filtrados = productos.filter(p => 
-            p.nombre.toLowerCase().includes(termino) ||
-            p.categoria.toLowerCase().includes(termino)
-        );
-        mostrarProductos(filtrados);
+        const termino = this.value.trim();
+        clearTimeout(busquedaTimeout);
+        
+        if (!termino) {
+            ultimaBusqueda++;
+            mostrarProductos(productos);
+            return;
+        }
+        
+        busquedaTimeout = setTimeout(() => buscarProductos(termino), 150);
     });
 }
 
@@ -459,6 +494,11 @@ async function confirmarVenta() {
                 }, 2000);
             } else {
                 Notification.error(data.message || 'Error al procesar la venta');
+                
+                // Stock insuficiente: traer el stock actual de los productos
+                if (data.fallidos) {
+                    cargarProductos();
+                }
             }
         }
     } catch (error) {
@@ -468,4 +508,15 @@ async function confirmarVenta() {
     }
 }
 
+// ===== WEBSOCKET EVENTS =====
+if (typeof socket !== 'undefined') {
+    // Cambios de productos o stock (también ventas de otras terminales):
+    // la resincronización trae solo las filas modificadas
+    ['producto_agregado', 'producto_actualizado', 'producto_eliminado', 'venta_creada'].forEach(evento => {
+        socket.on(evento, function() {
+            cargarProductos();
+        });
+    });
+}
+
 console.log('✅ POS Mejorado cargado');
\ No newline at end of file
@@ -21,14 +21,8 @@ document.addEventListener('DOMContentLoaded', function() {
 // ===== CARGAR PRODUCTOS =====
 async function cargarProductos() {
     try {
-        const response = await fetch('/api/productos');
-        
-        if (!response.ok) {
-            throw new Error('Error al cargar productos');
-        }
-        
-        const data = await response.json();
-        todosLosProductos = data.productos || [];
+        // Solo se descargan los productos que cambiaron desde la última carga
+        todosLosProductos = await Catalogo.sincronizar();
         productosFiltrados = todosLosProductos;
         
         mostrarProductos(productosFiltrados);
@@ -223,31 +217,8 @@ async function eliminarProducto(id) {
 }
 
 // ===== EXPORTAR A EXCEL =====
-async function exportarExcel() {
-    try {
-        Notification.info('Generando archivo Excel...');
-        
-        const response = await fetch('/api/productos/exportar');
-        
-        if (!response.ok) {
-            throw new Error('Error al exportar');
-        }
-        
-        const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = `productos_${new Date().toISOString().split('T')[0]}.xlsx`;
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        window.URL.revokeObjectURL(url);
-        
-        Notification.success('Archivo Excel descargado correctamente');
-    } catch (error) {
-        console.error('Error:', error);
-        Notification.error('Error al exportar a Excel');
-    }
+function exportarExcel() {
+    Exportaciones.excel('/api/productos/exportar');
 }
 
 // ===== WEBSOCKET EVENTS =====
@@ -4,14 +4,17 @@
    ======================================== */
 
 // ===== VARIABLES GLOBALES =====
-let todasLasVentas = [];
-let ventasFiltradas = [];
+const VENTAS_POR_PAGINA = 50;
+let ventasCargadas = [];
+let siguienteCursor = null;
+let cargandoVentas = false;
 
 // ===== INICIALIZACIÓN =====
 document.addEventListener('DOMContentLoaded', function() {
     console.log('📋 Historial de ventas iniciado');
     inicializarFechas();
     cargarVentas();
+    calcularEstadisticas();
 });
 
 // ===== INICIALIZAR FECHAS =====
@@ -24,33 +27,55 @@ function inicializarFechas() {
     document.getElementById('fechaHasta').value = hoy;
 }
 
-// ===== CARGAR VENTAS =====
-async function cargarVentas() {
+// ===== CARGAR VENTAS (PAGINADAS) =====
+async function cargarVentas(siguientePagina = false) {
+    if (cargandoVentas) return;
+    cargandoVentas = true;
+    
     try {
-        const response = await fetch('/api/ventas');
+        const params = new URLSearchParams({ limit: VENTAS_POR_PAGINA });
+        const fechaDesde = document.getElementById('fechaDesde').value;
+        const fechaHasta = document.getElementById('fechaHasta').value;
+        const metodoPago = document.getElementById('filtroMetodoPago').value;
+        
+        if (fechaDesde) params.append('desde', fechaDesde);
+        if (fechaHasta) params.append('hasta', fechaHasta);
+        if (metodoPago) params.append('metodo_pago', metodoPago);
+        if (siguientePagina && siguienteCursor) params.append('cursor', siguienteCursor);
+        
+        const response = await fetch(`/api/ventas?${params}`);
         const data = await response.json();
         
         if (data.success) {
-            todasLasVentas = data.ventas;
-            ventasFiltradas = todasLasVentas;
+            ventasCargadas = siguientePagina ? ventasCargadas.concat(data.ventas) : data.ventas;
+            siguienteCursor = data.siguiente;
             
-            mostrarVentas(ventasFiltradas);
-            calcularEstadisticas();
+            mostrarVentas(ventasCargadas);
             
-            console.log(`✅ ${todasLasVentas.length} ventas cargadas`);
+            console.log(`✅ ${data.ventas.length} ventas cargadas`);
         }
     } catch (error) {
         console.error('Error al cargar ventas:', error);
         Notification.error('Error al cargar las ventas');
+    } finally {
+        cargandoVentas = false;
     }
 }
 
+// ===== CARGAR MÁS =====
+function cargarMasVentas() {
+    cargarVentas(true);
+}
+
 // ===== MOSTRAR VENTAS EN TABLA =====
 function mostrarVentas(ventas) {
     const tbody = document.getElementById('ventasTableBody');
     const noVentas = document.getElementById('noVentas');
     const table = tbody.closest('table');
     
+    const btnCargarMas = document.getElementById('btnCargarMas');
+    btnCargarMas.classList.toggle('d-none', !siguienteCursor);
+    
     if (ventas.length === 0) {
         tbody.innerHTML = '';
         table.style.display = 'none';
@@ -116,60 +141,34 @@ function mostrarVentas(ventas) {
 
 // ===== APLICAR FILTROS =====
 function aplicarFiltros() {
-    const fechaDesde = document.getElementById('fechaDesde').value;
-    const fechaHasta = document.getElementById('fechaHasta').value;
-    const metodoPago = document.getElementById('filtroMetodoPago').value;
-    
-    ventasFiltradas = todasLasVentas.filter(venta => {
-        const fechaVenta = new Date(venta.fecha).toISOString().split('T')[0];
-        
-        // Filtro de fecha
-        const cumpleFecha = (!fechaDesde || fechaVenta >= fechaDesde) && 
-                           (!fechaHasta || fechaVenta <= fechaHasta);
-        
-        // Filtro de método de pago
-        const cumpleMetodo = !metodoPago || venta.metodo_pago === metodoPago;
-        
-        return cumpleFecha && cumpleMetodo;
-    });
-    
-    mostrarVentas(ventasFiltradas);
-    calcularEstadisticas();
+    // Los filtros se aplican en el servidor: se vuelve a la primera página
+    cargarVentas();
 }
 
 // ===== LIMPIAR FILTROS =====
 function limpiarFiltros() {
     inicializarFechas();
     document.getElementById('filtroMetodoPago').value = '';
-    ventasFiltradas = todasLasVentas;
-    mostrarVentas(ventasFiltradas);
-    calcularEstadisticas();
+    cargarVentas();
 }
 
 // ===== CALCULAR ESTADÍSTICAS =====
-function calcularEstadisticas() {
-    const hoy = new Date().toISOString().split('T')[0];
-    const mesActual = new Date().toISOString().slice(0, 7); // YYYY-MM
-    
-    // Ventas de hoy
-    const ventasHoy = todasLasVentas.filter(v => 
-        new Date(v.fecha).toISOString().split('T')[0] === hoy
-    );
-    
-    // Ventas del mes
-    const ventasMes = todasLasVentas.filter(v => 
-        new Date(v.fecha).toISOString().slice(0, 7) === mesActual
-    );
-    
-    // Totales
-    const totalHoy = ventasHoy.reduce((sum, v) => sum + v.total, 0);
-    const totalMes = ventasMes.reduce((sum, v) => sum + v.total, 0);
-    
-    // Actualizar DOM
-    document.getElementById('ventasHoy').textContent = ventasHoy.length;
-    document.getElementById('totalHoy').textContent = Format.currency(totalHoy);
-    document.getElementById('ventasMes').textContent = ventasMes.length;
-    document.getElementById('totalMes').textContent = Format.currency(totalMes);
+async function calcularEstadisticas() {
+    try {
+        // Totales de hoy y del mes desde el resumen del servidor
+        const response = await fetch('/api/dashboard/stats');
+        const data = await response.json();
+        
+        if (data.success) {
+            const stats = data.data;
+            document.getElementById('ventasHoy').textContent = stats.ventas_hoy.cantidad;
+            document.getElementById('totalHoy').textContent = Format.currency(stats.ventas_hoy.total);
+            document.getElementById('ventasMes').textContent = stats.ventas_mes.cantidad;
+            document.getElementById('totalMes').textContent = Format.currency(stats.ventas_mes.total);
+        }
+    } catch (error) {
+        console.error('Error al cargar estadísticas:', error);
+    }
 }
 
 // ===== VER DETALLE DE VENTA =====
@@ -273,35 +272,11 @@ async function verDetalleVenta(ventaId) {
 }
 
 // ===== EXPORTAR A EXCEL =====
-async function exportarVentasExcel() {
-    try {
-        Notification.info('Generando archivo Excel...');
-        
-        const fechaDesde = document.getElementById('fechaDesde').value;
-        const fechaHasta = document.getElementById('fechaHasta').value;
-        
-        const url = `/api/ventas/exportar?desde=${fechaDesde}&hasta=${fechaHasta}`;
-        const response = await fetch(url);
-        
-        if (!response.ok) {
-            throw new Error('Error al exportar');
-        }
-        
-        const blob = await response.blob();
-        const urlBlob = window.URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = urlBlob;
-        a.download = `ventas_${fechaDesde}_${fechaHasta}.xlsx`;
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        window.URL.revokeObjectURL(urlBlob);
-        
-        Notification.success('Archivo Excel descargado correctamente');
-    } catch (error) {
-        console.error('Error:', error);
-        Notification.error('Error al exportar a Excel');
-    }
+function exportarVentasExcel() {
+    const fechaDesde = document.getElementById('fechaDesde').value;
+    const fechaHasta = document.getElementById('fechaHasta').value;
+    
+    Exportaciones.excel(`/api/ventas/exportar?desde=${fechaDesde}&hasta=${fechaHasta}`);
 }
 
 // ===== WEBSOCKET EVENTS =====
@@ -309,7 +284,8 @@ if (typeof socket !== 'undefined') {
     // Escuchar cuando se realiza una nueva venta
     socket.on('venta_realizada', function(data) {
         console.log('Nueva venta realizada:', data);
-        cargarVentas(); // Recargar lista
+        cargarVentas(); // Recargar primera página
+        calcularEstadisticas();
     });
 }
 
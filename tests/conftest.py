@@ -0,0 +1,90 @@
+import contextlib
+import importlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.database import Database, ORIGENES_RESUMEN_DIARIO
+
+
+def abrir_base(ruta):
+    """Database sobre la ruta, sin cache ni métricas y sin los print de cada operación"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Database(str(ruta), usar_cache=False, usar_metricas=False)
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Base nueva en un directorio temporal"""
+    base = abrir_base(tmp_path / 'prueba.db')
+    yield base
+    if base.pool:
+        base.pool.cerrar()
+
+
+@pytest.fixture
+def silencio():
+    """Ocultar los print de los métodos de Database"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    """Cliente de la app con sesión iniciada, sobre una base temporal"""
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'app.db'))
+    monkeypatch.setenv('EXPORTS_DIR', str(tmp_path / 'exports'))
+    for variable in ('WAL_CHECKPOINT_SEGUNDOS', 'STOCK_SNAPSHOT_SEGUNDOS', 'DASHBOARD_PUSH_SEGUNDOS'):
+        monkeypatch.setenv(variable, '0')
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as modulo
+        modulo = importlib.reload(modulo)
+    cliente = modulo.app.test_client()
+    cliente.post('/login', data={'username': modulo.ADMIN_USER, 'password': modulo.ADMIN_PASSWORD})
+    return modulo, cliente
+
+
+@pytest.fixture
+def producto(db, silencio):
+    """Producto con 10 unidades en stock"""
+    return db.crear_producto('Cerveza', '', None, 8, 12, 'unidad', 'Cervezas', 10, 2)
+
+
+def item(producto_id, cantidad=1, precio=12, nombre='Cerveza'):
+    """Línea de venta o compra como la envía el frontend"""
+    return {'producto_id': producto_id, 'producto_nombre': nombre, 'cantidad': cantidad,
+            'precio_unitario': precio, 'subtotal': cantidad * precio}
+
+
+def resumen_recalculado(db):
+    """resumen_diario calculado desde cero con las tablas de origen"""
+    conn = db.get_connection()
+    esperado = {}
+    for tabla, origen, fecha, clave, total, efectivo, qr in ORIGENES_RESUMEN_DIARIO:
+        filas = conn.execute(f'''
+            SELECT COALESCE(DATE({fecha}), ''), {f"COALESCE({clave}, '')" if clave else "''"},
+                   COUNT(*), COALESCE(SUM({total}), 0),
+                   {f'COALESCE(SUM({efectivo}), 0)' if efectivo else '0'},
+                   {f'COALESCE(SUM({qr}), 0)' if qr else '0'}
+            FROM {tabla} GROUP BY 1, 2
+        ''').fetchall()
+        for dia, valor_clave, cantidad, suma, suma_efectivo, suma_qr in filas:
+            esperado[(dia, origen, valor_clave)] = (cantidad, round(suma, 2),
+                                                    round(suma_efectivo, 2), round(suma_qr, 2))
+    conn.close()
+    return esperado
+
+
+def resumen_acumulado(db):
+    """resumen_diario tal como lo dejaron los triggers (sin las filas que quedaron en cero)"""
+    conn = db.get_connection()
+    filas = conn.execute('''
+        SELECT fecha, origen, clave, cantidad, total, monto_efectivo, monto_qr
+        FROM resumen_diario WHERE cantidad != 0
+    ''').fetchall()
+    conn.close()
+    return {(fecha, origen, clave): (cantidad, round(total, 2), round(efectivo, 2), round(qr, 2))
+            for fecha, origen, clave, cantidad, total, efectivo, qr in filas}
@@ -0,0 +1,139 @@
+import threading
+import time
+
+from utils.cache import CacheResultados, cacheado, invalida
+
+
+class Contador:
+    """calcular() que cuenta sus llamadas y devuelve un valor nuevo cada vez"""
+
+    def __init__(self, esperar=None):
+        self.llamadas = 0
+        self.esperar = esperar
+
+    def __call__(self):
+        self.llamadas += 1
+        if self.esperar:
+            self.esperar.wait(5)
+        return {'llamada': self.llamadas, 'filas': [1, 2]}
+
+
+def test_devuelve_copias_del_valor_guardado():
+    cache = CacheResultados()
+    calcular = Contador()
+
+    primero = cache.obtener('clave', calcular, ['ventas'])
+    primero['filas'].append(3)
+    segundo = cache.obtener('clave', calcular, ['ventas'])
+    segundo['llamada'] = 99
+
+    assert cache.obtener('clave', calcular, ['ventas']) == {'llamada': 1, 'filas': [1, 2]}
+    assert calcular.llamadas == 1
+
+
+def test_pedidos_simultaneos_calculan_una_vez():
+    cache = CacheResultados()
+    liberar = threading.Event()
+    calcular = Contador(esperar=liberar)
+    resultados = []
+
+    hilos = [threading.Thread(target=lambda: resultados.append(cache.obtener('clave', calcular, ['ventas'])))
+             for _ in range(5)]
+    for hilo in hilos:
+        hilo.start()
+    time.sleep(0.05)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert calcular.llamadas == 1
+    assert resultados == [{'llamada': 1, 'filas': [1, 2]}] * 5
+
+
+def test_vencimiento_por_ttl():
+    cache = CacheResultados(ttl=60)
+    calcular = Contador()
+
+    cache.obtener('vence', calcular, ['ventas'], ttl=0)
+    cache.obtener('vence', calcular, ['ventas'], ttl=0)
+    assert calcular.llamadas == 2
+
+    cache.obtener('dura', calcular, ['ventas'])
+    cache.obtener('dura', calcular, ['ventas'])
+    assert calcular.llamadas == 3
+
+
+def test_invalidar_borra_solo_las_tablas_indicadas():
+    cache = CacheResultados()
+    ventas, compras = Contador(), Contador()
+    cache.obtener('ventas', ventas, ['ventas', 'detalle_ventas'])
+    cache.obtener('compras', compras, ['compras'])
+
+    cache.invalidar('detalle_ventas')
+    cache.obtener('ventas', ventas, ['ventas', 'detalle_ventas'])
+    cache.obtener('compras', compras, ['compras'])
+
+    assert (ventas.llamadas, compras.llamadas) == (2, 1)
+
+
+def test_descarta_el_valor_si_hubo_escritura_mientras_se_calculaba():
+    cache = CacheResultados()
+    llamadas = []
+
+    def calcular():
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            cache.invalidar('otra_tabla')  # Escritura de otro pedido a mitad del cálculo
+        return len(llamadas)
+
+    assert cache.obtener('clave', calcular, ['ventas']) == 1
+    assert cache.obtener('clave', calcular, ['ventas']) == 2
+    assert cache.obtener('clave', calcular, ['ventas']) == 2
+
+
+def test_versiones_compartidas_entre_procesos():
+    versiones = {'ventas': 1}
+    cache = CacheResultados(leer_versiones=lambda: dict(versiones),
+                            publicar_versiones=lambda tablas: None)
+    calcular = Contador()
+    cache.obtener('clave', calcular, ['ventas'])
+    cache.obtener('clave', calcular, ['ventas'])
+
+    versiones['ventas'] = 2  # Otro worker escribió en ventas
+    cache.obtener('clave', calcular, ['ventas'])
+
+    assert calcular.llamadas == 2
+
+
+class Base:
+    """Lo mínimo de Database que usan los decoradores"""
+
+    def __init__(self):
+        self.cache = CacheResultados(ttl=60, ttl_hoy=0)
+        self.observadores_escritura = []
+        self.consultas = 0
+
+    @cacheado('ventas')
+    def estadisticas(self, desde=None, hasta=None):
+        self.consultas += 1
+        return self.consultas
+
+    @invalida('ventas')
+    def vender(self):
+        pass
+
+
+def test_decoradores_cachean_e_invalidan():
+    base = Base()
+    notificadas = []
+    base.observadores_escritura.append(notificadas.append)
+
+    # Un rango pasado usa el ttl normal; uno que incluye hoy, ttl_hoy (0 = siempre recalcula)
+    assert base.estadisticas('2020-01-01', '2020-01-31') == 1
+    assert base.estadisticas('2020-01-01', '2020-01-31') == 1
+    assert base.estadisticas() == 2
+    assert base.estadisticas() == 3
+
+    base.vender()
+    assert base.estadisticas('2020-01-01', '2020-01-31') == 4
+    assert notificadas == [('ventas',)]
@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+from conftest import item
+
+
+def esperar_listo(cliente, trabajo):
+    """Consultar /api/trabajos/<id> hasta que la exportación termine"""
+    limite = time.monotonic() + 10
+    while trabajo['estado'] not in ('listo', 'error'):
+        if time.monotonic() > limite:
+            pytest.fail('La exportación no terminó')
+        time.sleep(0.02)
+        trabajo = cliente.get(f"/api/trabajos/{trabajo['id']}").get_json()['trabajo']
+    return trabajo
+
+
+def exportar(cliente, url):
+    """(código de la respuesta, trabajo terminado, bytes del archivo)"""
+    respuesta = cliente.get(url)
+    trabajo = esperar_listo(cliente, respuesta.get_json()['trabajo'])
+    assert trabajo['estado'] == 'listo', trabajo['error']
+    archivo = cliente.get(f"/api/trabajos/{trabajo['id']}/descargar")
+    assert archivo.status_code == 200
+    return respuesta.status_code, trabajo, archivo.get_data()
+
+
+def test_misma_version_reutiliza_el_archivo(cliente, silencio):
+    modulo, cliente = cliente
+    modulo.db.crear_producto('Cerveza', '', None, 8, 12, 'unidad', 'Cervezas', 10, 2)
+
+    codigo, primero, contenido = exportar(cliente, '/api/productos/exportar')
+    assert codigo == 202
+
+    # Sin cambios: el trabajo nace listo con el archivo del cache
+    codigo, segundo, repetido = exportar(cliente, '/api/productos/exportar')
+    assert codigo == 200
+    assert segundo['id'] != primero['id']
+    assert repetido == contenido
+
+
+def test_una_escritura_genera_version_nueva(cliente, silencio):
+    modulo, cliente = cliente
+    producto = modulo.db.crear_producto('Cerveza', '', None, 8, 12, 'unidad', 'Cervezas', 10, 2)
+    _, _, contenido = exportar(cliente, '/api/productos/exportar')
+
+    modulo.db.actualizar_stock(producto, 3, 'restar')
+
+    codigo, _, nuevo = exportar(cliente, '/api/productos/exportar')
+    assert codigo == 202
+    assert nuevo != contenido
+
+
+def test_directo_usa_el_cache(cliente, silencio):
+    modulo, cliente = cliente
+    modulo.db.crear_producto('Cerveza', '', None, 8, 12, 'unidad', 'Cervezas', 10, 2)
+    _, _, contenido = exportar(cliente, '/api/productos/exportar')
+
+    respuesta = cliente.get('/api/productos/exportar?directo=1')
+
+    assert respuesta.status_code == 200
+    assert respuesta.get_data() == contenido
+
+
+def test_version_exportacion_por_reporte(db, producto, silencio):
+    caja_id = db.abrir_caja(100)
+    hoy = time.strftime('%Y-%m-%d', time.gmtime())  # Fecha de CURRENT_TIMESTAMP
+    versiones = lambda: (db.version_exportacion('productos'), db.version_exportacion('caja', caja_id),
+                         db.version_exportacion('ventas', hoy, hoy),
+                         db.version_exportacion('ventas', '2020-01-01', '2020-01-31'),
+                         db.version_exportacion('estadisticas', hoy, hoy))
+    antes = versiones()
+    assert antes == versiones()
+    assert all(antes)
+
+    db.registrar_venta_completa(12, 'efectivo', [item(producto)])
+    despues = versiones()
+
+    # Cambian los reportes que incluyen la venta; el rango pasado queda igual
+    assert [a != d for a, d in zip(antes, despues)] == [True, True, True, False, True]
+
+    # Renombrar un producto cambia las estadísticas (top de productos) pero no las ventas
+    db.actualizar_producto(producto, 'Cerveza Negra', '', None, 8, 12, 'unidad', 'Cervezas', 9, 2)
+    renombrado = versiones()
+    assert renombrado[2] == despues[2]
+    assert renombrado[4] != despues[4]
+
+
+def test_reportes_sin_marca_no_se_cachean(db, silencio):
+    assert db.version_exportacion('ventas', None, None) is None
+    assert db.version_exportacion('caja', 999) is None
+    assert db.version_exportacion('creditos') is None
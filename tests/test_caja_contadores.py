@@ -0,0 +1,82 @@
+from conftest import item
+
+
+def credito_de_venta(db, venta_id):
+    conn = db.get_connection()
+    credito_id = conn.execute('SELECT id FROM creditos WHERE venta_id = ?', (venta_id,)).fetchone()[0]
+    conn.close()
+    return credito_id
+
+
+def test_contadores_despues_de_ventas_compras_y_pagos(db, producto, silencio):
+    caja_id = db.abrir_caja(100)
+    db.registrar_venta_completa(24, 'efectivo', [item(producto, 2)])
+    db.registrar_venta_completa(12, 'qr', [item(producto)])
+    db.registrar_venta_completa(36, 'mixto', [item(producto, 3)], monto_efectivo=20, monto_qr=16)
+    venta_credito = db.registrar_venta_completa(12, 'credito', [item(producto)], cliente_nombre='Ana')
+    db.registrar_compra_completa('productos', 40, 'Proveedor', 'efectivo', [item(producto, 5, 8)])
+    db.crear_compra('gastos', 15, None, 'qr', descripcion='Luz')
+    db.registrar_pago_credito(credito_de_venta(db, venta_credito), {'monto': 5, 'metodo_pago': 'efectivo'})
+    db.registrar_retiro_caja(caja_id, {'monto': 10})
+
+    assert db.verificar_totales_caja(caja_id)['correcto']
+
+    caja = db.obtener_caja(caja_id)
+    assert caja['ingresos_efectivo'] == 24 + 20 + 5
+    assert caja['ingresos_qr'] == 12 + 16
+    assert caja['egresos_efectivo'] == 40 + 10
+    assert caja['egresos_otros'] == 15
+    assert caja['num_ventas'] == 4  # La venta a crédito no entra en caja; la mixta son dos movimientos
+
+
+def test_contadores_despues_de_eliminar_compra(db, producto, silencio):
+    caja_id = db.abrir_caja(100)
+    compra_id = db.registrar_compra_completa('productos', 40, 'Proveedor', 'efectivo',
+                                             [item(producto, 5, 8)])
+    db.eliminar_compra(compra_id)
+
+    assert db.verificar_totales_caja(caja_id)['correcto']
+
+
+def test_borrar_movimiento_descuenta_contadores(db, silencio):
+    caja_id = db.abrir_caja(100)
+    db.registrar_retiro_caja(caja_id, {'monto': 10})
+    db.registrar_retiro_caja(caja_id, {'monto': 7})
+
+    conn = db.get_connection()
+    conn.execute('DELETE FROM movimientos_caja WHERE monto = 10')
+    conn.execute('UPDATE movimientos_caja SET metodo_pago = ? WHERE monto = 7', ('qr',))
+    conn.commit()
+    conn.close()
+
+    assert db.verificar_totales_caja(caja_id)['correcto']
+    caja = db.obtener_caja(caja_id)
+    assert (caja['egresos_efectivo'], caja['egresos_otros']) == (0, 7)
+
+
+def test_verificar_detecta_y_corrige_diferencias(db, silencio):
+    caja_id = db.abrir_caja(100)
+    db.registrar_retiro_caja(caja_id, {'monto': 10})
+
+    conn = db.get_connection()
+    conn.execute('UPDATE caja SET total_egresos = 99 WHERE id = ?', (caja_id,))
+    conn.commit()
+    conn.close()
+
+    resultado = db.verificar_totales_caja(caja_id, corregir=True)
+    assert not resultado['correcto']
+    assert resultado['diferencias']['total_egresos'] == {'acumulado': 99, 'recalculado': 10}
+    assert db.verificar_totales_caja(caja_id)['correcto']
+
+
+def test_cierre_usa_los_contadores(db, producto, silencio):
+    caja_id = db.abrir_caja(100)
+    db.registrar_venta_completa(24, 'efectivo', [item(producto, 2)])
+    db.registrar_retiro_caja(caja_id, {'monto': 10})
+
+    db.cerrar_caja(caja_id, 110)
+
+    caja = db.obtener_caja(caja_id)
+    assert caja['efectivo_esperado'] == 100 + 24 - 10
+    assert caja['diferencia'] == -4
+    assert db.verificar_totales_caja(caja_id)['correcto']
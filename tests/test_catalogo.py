@@ -0,0 +1,144 @@
+import pytest
+
+
+def crear(db, nombre, categoria='Cervezas', stock=10, descripcion=''):
+    return db.crear_producto(nombre, descripcion, None, 8, 12, 'unidad', categoria, stock, 2)
+
+
+def actualizar(db, producto_id, **cambios):
+    producto = {**db.obtener_producto(producto_id), **cambios}
+    db.actualizar_producto(producto_id, producto['nombre'], producto['descripcion'], producto['imagen'],
+                           producto['precio_compra'], producto['precio_venta'], producto['unidad'],
+                           producto['categoria'], producto['stock'], producto['stock_minimo'])
+
+
+@pytest.fixture
+def catalogo(cliente, silencio):
+    """Cliente con tres productos cargados"""
+    modulo, cliente = cliente
+    ids = {nombre: crear(modulo.db, nombre, categoria, descripcion=descripcion)
+           for nombre, categoria, descripcion in [('Paceña', 'Cervezas', 'Lata 355 ml'),
+                                                  ('Huari', 'Cervezas', ''),
+                                                  ('Singani Casa Real', 'Licores', 'Botella etiqueta negra')]}
+    return modulo, cliente, ids
+
+
+def buscar(cliente, texto, **params):
+    respuesta = cliente.get('/api/productos/buscar', query_string={'q': texto, **params})
+    return [p['nombre'] for p in respuesta.get_json()['productos']]
+
+
+# ===== Sincronización por diferencias (ETag y ?since=) =====
+
+def test_catalogo_completo_con_etag(catalogo):
+    _, cliente, ids = catalogo
+
+    respuesta = cliente.get('/api/productos')
+    datos = respuesta.get_json()
+
+    assert respuesta.headers['ETag'] == f'"{datos["version"]}"'
+    assert datos['completo']
+    assert {p['id'] for p in datos['productos']} == set(ids.values())
+
+
+def test_etag_igual_responde_304(catalogo):
+    modulo, cliente, ids = catalogo
+    etag = cliente.get('/api/productos').headers['ETag']
+
+    assert cliente.get('/api/productos', headers={'If-None-Match': etag}).status_code == 304
+
+    actualizar(modulo.db, ids['Huari'], stock=3)
+    respuesta = cliente.get('/api/productos', headers={'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers['ETag'] != etag
+
+
+def test_since_trae_solo_cambiados_y_eliminados(catalogo):
+    modulo, cliente, ids = catalogo
+    version = cliente.get('/api/productos').get_json()['version']
+
+    actualizar(modulo.db, ids['Huari'], precio_venta=15)
+    modulo.db.registrar_venta_completa(12, 'efectivo', [{
+        'producto_id': ids['Paceña'], 'producto_nombre': 'Paceña', 'cantidad': 1,
+        'precio_unitario': 12, 'subtotal': 12}], validar_stock=False)
+    modulo.db.eliminar_producto(ids['Singani Casa Real'])
+    nuevo = crear(modulo.db, 'Ron Abuelo', 'Licores')
+
+    datos = cliente.get(f'/api/productos?since={version}').get_json()
+
+    assert not datos['completo']
+    assert datos['version'] > version
+    assert {p['id']: p['nombre'] for p in datos['productos']} == \
+           {ids['Huari']: 'Huari', ids['Paceña']: 'Paceña', nuevo: 'Ron Abuelo'}
+    assert next(p for p in datos['productos'] if p['id'] == ids['Paceña'])['stock'] == 9
+    assert datos['eliminados'] == [ids['Singani Casa Real']]
+
+    # Desde la versión nueva no hay nada pendiente
+    al_dia = cliente.get(f'/api/productos?since={datos["version"]}').get_json()
+    assert (al_dia['productos'], al_dia['eliminados']) == ([], [])
+
+
+def test_since_posterior_a_la_version_devuelve_todo(catalogo):
+    _, cliente, ids = catalogo
+    version = cliente.get('/api/productos').get_json()['version']
+
+    datos = cliente.get(f'/api/productos?since={version + 100}').get_json()
+
+    assert datos['completo']
+    assert len(datos['productos']) == len(ids)
+
+
+def test_producto_eliminado_y_recreado_sale_de_eliminados(catalogo):
+    modulo, cliente, ids = catalogo
+    version = cliente.get('/api/productos').get_json()['version']
+    modulo.db.eliminar_producto(ids['Huari'])
+
+    conn = modulo.db.get_connection()
+    conn.execute('''
+        INSERT INTO productos (id, nombre, precio_compra, precio_venta, unidad, categoria, stock)
+        VALUES (?, 'Huari', 8, 12, 'unidad', 'Cervezas', 5)
+    ''', (ids['Huari'],))
+    conn.commit()
+    conn.close()
+
+    datos = cliente.get(f'/api/productos?since={version}').get_json()
+    assert [p['id'] for p in datos['productos']] == [ids['Huari']]
+    assert datos['eliminados'] == []
+
+
+# ===== Búsqueda FTS =====
+
+def test_busqueda_sin_acentos_y_por_prefijo(catalogo):
+    _, cliente, _ = catalogo
+
+    assert buscar(cliente, 'pacena') == ['Paceña']
+    assert buscar(cliente, 'PAC') == ['Paceña']
+    assert set(buscar(cliente, 'cerv')) == {'Paceña', 'Huari'}
+    assert buscar(cliente, 'sing real') == ['Singani Casa Real']
+    assert buscar(cliente, 'etiqueta') == ['Singani Casa Real']
+    assert buscar(cliente, 'vodka') == []
+    assert buscar(cliente, '"*') == []
+
+
+def test_busqueda_filtra_stock_y_limita(catalogo):
+    modulo, cliente, ids = catalogo
+    actualizar(modulo.db, ids['Huari'], stock=0)
+
+    assert buscar(cliente, 'cerveza', stock=1) == ['Paceña']
+    assert len(buscar(cliente, 'cerveza', limit=1)) == 1
+
+
+def test_indice_al_dia_tras_renombrar_y_eliminar(catalogo):
+    modulo, cliente, ids = catalogo
+
+    actualizar(modulo.db, ids['Paceña'], nombre='Potosina')
+    assert buscar(cliente, 'pacena') == []
+    assert buscar(cliente, 'potos') == ['Potosina']
+
+    # Un cambio de stock no toca el texto indexado
+    actualizar(modulo.db, ids['Paceña'], stock=4)
+    assert buscar(cliente, 'potos') == ['Potosina']
+
+    modulo.db.eliminar_producto(ids['Huari'])
+    assert buscar(cliente, 'huari') == []
+    assert buscar(cliente, 'cerv') == ['Potosina']
@@ -0,0 +1,283 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from conftest import item
+from utils.database import (DIAS_SEMANA, comparaciones_predeterminadas, mismo_dia_anio_anterior,
+                            ventana_comparacion)
+
+# Precios con mitades: las sumas en coma flotante son exactas y se comparan con ==
+PRODUCTOS = [('Cerveza', 'Cervezas', 12), ('Vino', 'Vinos', 25.5),
+             ('Ron', 'Licores', 40), ('Singani', 'Licores', 7.5)]
+
+
+def dias_historial():
+    """Días con ventas: alrededor de hoy, del 29 de febrero de 2024 y del año anterior"""
+    hoy = date.today()
+    cercanos = [hoy - timedelta(days=n) for n in range(0, 70)]
+    bisiesto = [date(2024, 2, 29) + timedelta(days=n) for n in range(-40, 35)]
+    anterior = [date(2023, 2, 28) + timedelta(days=n) for n in range(-40, 35)]
+    return cercanos + bisiesto + anterior
+
+
+@pytest.fixture
+def historial(db, silencio):
+    """Ventas con fecha y hora al azar (semilla fija) cargadas por SQL, como llegarían de la caja"""
+    azar = random.Random(20240229)
+    productos = [db.crear_producto(nombre, '', None, precio / 2, precio, 'unidad', categoria, 1000, 1)
+                 for nombre, categoria, precio in PRODUCTOS]
+    dias = dias_historial()
+
+    conn = db.get_connection()
+    for _ in range(600):
+        momento = datetime.combine(azar.choice(dias), datetime.min.time()) + timedelta(
+            hours=azar.randrange(24), minutes=azar.randrange(60))
+        lineas = [(i, azar.randint(1, 4)) for i in azar.sample(range(len(productos)), azar.randint(1, 3))]
+        total = sum(PRODUCTOS[i][2] * cantidad for i, cantidad in lineas)
+        metodo = azar.choice(['efectivo', 'qr', 'mixto', 'credito'])
+        efectivo = total / 2 if metodo == 'mixto' else 0
+        venta_id = conn.execute('''
+            INSERT INTO ventas (total, metodo_pago, monto_efectivo, monto_qr, fecha) VALUES (?, ?, ?, ?, ?)
+        ''', (total, metodo, efectivo, efectivo, momento.strftime('%Y-%m-%d %H:%M:%S'))).lastrowid
+        conn.executemany('''
+            INSERT INTO detalle_ventas (venta_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(venta_id, productos[i], PRODUCTOS[i][0], cantidad, PRODUCTOS[i][2], PRODUCTOS[i][2] * cantidad)
+              for i, cantidad in lineas])
+    conn.commit()
+    conn.close()
+    return productos
+
+
+# ===== Consultas originales (antes del resumen diario y las tablas por producto y hora) =====
+
+def ventas_entre(db, desde, hasta):
+    conn = db.get_connection()
+    fila = conn.execute('''
+        SELECT COALESCE(SUM(total), 0) as total, COUNT(*) as cantidad
+        FROM ventas WHERE DATE(fecha) >= DATE(?) AND DATE(fecha) <= DATE(?)
+    ''', (desde, hasta)).fetchone()
+    conn.close()
+    return fila['total'], fila['cantidad']
+
+
+def top_original(db, fecha_desde=None, fecha_hasta=None):
+    query = '''
+        SELECT dv.producto_id, SUM(dv.cantidad) as cantidad_vendida, SUM(dv.subtotal) as total_vendido,
+               p.categoria, p.stock
+        FROM detalle_ventas dv
+        LEFT JOIN productos p ON dv.producto_id = p.id
+        LEFT JOIN ventas v ON dv.venta_id = v.id
+    '''
+    params = []
+    if fecha_desde and fecha_hasta:
+        query += ' WHERE DATE(v.fecha) BETWEEN DATE(?) AND DATE(?)'
+        params = [fecha_desde, fecha_hasta]
+    query += ' GROUP BY dv.producto_id'
+    conn = db.get_connection()
+    filas = {fila['producto_id']: dict(fila) for fila in conn.execute(query, params)}
+    conn.close()
+    return filas
+
+
+def categorias_original(db, fecha_desde=None, fecha_hasta=None):
+    query = '''
+        SELECT p.categoria, SUM(dv.cantidad) as cantidad, SUM(dv.subtotal) as total
+        FROM detalle_ventas dv
+        LEFT JOIN productos p ON dv.producto_id = p.id
+        LEFT JOIN ventas v ON dv.venta_id = v.id
+    '''
+    params = []
+    if fecha_desde and fecha_hasta:
+        query += ' WHERE DATE(v.fecha) BETWEEN DATE(?) AND DATE(?)'
+        params = [fecha_desde, fecha_hasta]
+    query += ' GROUP BY p.categoria'
+    conn = db.get_connection()
+    filas = {fila['categoria']: dict(fila) for fila in conn.execute(query, params)}
+    conn.close()
+    return filas
+
+
+def mapa_recalculado(db, desde, hasta):
+    """Matrices 7x24 (lunes a domingo) recorriendo cada venta"""
+    fila_de = {dia: i for i, (dia, _) in enumerate(DIAS_SEMANA)}
+    cantidad = [[0] * 24 for _ in DIAS_SEMANA]
+    total = [[0] * 24 for _ in DIAS_SEMANA]
+    conn = db.get_connection()
+    for fila in conn.execute('''
+        SELECT CAST(strftime('%w', fecha) AS INTEGER) as dia, CAST(strftime('%H', fecha) AS INTEGER) as hora,
+               total
+        FROM ventas WHERE DATE(fecha) BETWEEN ? AND ?
+    ''', (desde, hasta)):
+        cantidad[fila_de[fila['dia']]][fila['hora']] += 1
+        total[fila_de[fila['dia']]][fila['hora']] += fila['total']
+    conn.close()
+    return cantidad, total
+
+
+# ===== Pruebas =====
+
+def test_mismo_dia_anio_anterior_y_ventanas():
+    assert mismo_dia_anio_anterior(date(2024, 2, 29)) == date(2023, 2, 28)
+    assert mismo_dia_anio_anterior(date(2024, 3, 1)) == date(2023, 3, 1)
+    assert ventana_comparacion('2024-02-01', '2024-02-29', 'anio_anterior') == ('2023-02-01', '2023-02-28')
+    assert ventana_comparacion('2024-02-26', '2024-03-03') == ('2024-02-19', '2024-02-25')
+    with pytest.raises(ValueError):
+        ventana_comparacion('2024-02-01', '2024-02-29', 'semana')
+
+
+def test_comparativa_predeterminada_igual_a_consultas_por_periodo(db, historial, silencio):
+    comparaciones = comparaciones_predeterminadas(datetime.now())
+
+    resultado = db.obtener_comparativa_periodos()
+
+    for nombre, (desde, hasta), (anterior_desde, anterior_hasta) in comparaciones:
+        total, cantidad = ventas_entre(db, desde, hasta)
+        total_anterior, cantidad_anterior = ventas_entre(db, anterior_desde, anterior_hasta)
+        assert (resultado[nombre]['total'], resultado[nombre]['cantidad']) == (total, cantidad)
+        assert (resultado[nombre]['comparar_con'], resultado[nombre]['cantidad_anterior']) == \
+               (total_anterior, cantidad_anterior)
+    assert resultado['mes']['cantidad'] > 0
+
+
+def test_comparativa_con_ventanas_arbitrarias(db, historial, silencio):
+    comparaciones = [
+        ('febrero_bisiesto', ('2024-02-01', '2024-02-29'),
+         ventana_comparacion('2024-02-01', '2024-02-29', 'anio_anterior')),
+        ('solo_29', ('2024-02-29', '2024-02-29'), ventana_comparacion('2024-02-29', '2024-02-29', 'anio_anterior')),
+        ('cruza_marzo', ('2024-02-26', '2024-03-03'), ventana_comparacion('2024-02-26', '2024-03-03')),
+        ('se_pisan', ('2024-01-01', '2024-03-31'), ('2024-02-10', '2024-02-20')),
+        ('sin_ventas', ('2019-01-01', '2019-01-31'), ('2018-12-01', '2018-12-31')),
+    ]
+
+    resultado = db.obtener_comparativa_periodos(comparaciones)
+
+    assert resultado['solo_29']['comparar_desde'] == '2023-02-28'
+    for nombre, actual, anterior in comparaciones:
+        assert (resultado[nombre]['total'], resultado[nombre]['cantidad']) == ventas_entre(db, *actual)
+        assert (resultado[nombre]['comparar_con'], resultado[nombre]['cantidad_anterior']) == \
+               ventas_entre(db, *anterior)
+    assert resultado['sin_ventas']['variacion'] == 0
+
+
+def test_dashboard_igual_a_consultas_originales(db, historial, silencio):
+    caja_id = db.abrir_caja(100)
+    db.registrar_venta_completa(24, 'efectivo', [item(historial[0], 2)])
+    db.registrar_venta_completa(51, 'mixto', [item(historial[1], 2, 25.5, 'Vino')],
+                                monto_efectivo=30, monto_qr=21)
+    db.registrar_compra_completa('productos', 40, 'Proveedor', 'efectivo', [item(historial[2], 2, 20, 'Ron')])
+    db.crear_compra('gastos', 15, None, 'qr', descripcion='Luz')
+    db.registrar_retiro_caja(caja_id, {'monto': 10})
+    conn = db.get_connection()
+    conn.execute('UPDATE productos SET stock = 0 WHERE id = ?', (historial[3],))
+    conn.commit()
+
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    ventas_hoy = conn.execute('''
+        SELECT COUNT(*) as cantidad, COALESCE(SUM(total), 0) as total FROM ventas WHERE DATE(fecha) = DATE(?)
+    ''', (hoy,)).fetchone()
+    ventas_mes = conn.execute('''
+        SELECT COUNT(*) as cantidad, COALESCE(SUM(total), 0) as total FROM ventas
+        WHERE strftime('%Y-%m', fecha) = strftime('%Y-%m', 'now')
+    ''').fetchone()
+    gastos_mes = conn.execute('''
+        SELECT COALESCE(SUM(monto), 0) FROM compras WHERE strftime('%Y-%m', fecha) = strftime('%Y-%m', 'now')
+    ''').fetchone()[0]
+    efectivo = conn.execute('''
+        SELECT COALESCE(SUM(CASE WHEN tipo = 'ingreso' AND metodo_pago = 'efectivo' THEN monto ELSE 0 END), 0) -
+               COALESCE(SUM(CASE WHEN tipo = 'egreso' AND metodo_pago = 'efectivo' THEN monto ELSE 0 END), 0)
+        FROM movimientos_caja WHERE caja_id = ?
+    ''', (caja_id,)).fetchone()[0]
+    conn.close()
+
+    assert db.obtener_estadisticas_dashboard() == {
+        'productos': {'total': 4, 'stock_bajo': 1},
+        'ventas_hoy': {'cantidad': ventas_hoy['cantidad'], 'total': ventas_hoy['total']},
+        'ventas_mes': {'cantidad': ventas_mes['cantidad'], 'total': ventas_mes['total']},
+        'gastos_mes': gastos_mes,
+        'creditos': {'cantidad': 0, 'total': 0},
+        'caja': {'abierta': True, 'monto_actual': 100 + efectivo},
+        'ganancia_mes': ventas_mes['total'] - gastos_mes
+    }
+
+
+@pytest.mark.parametrize('rango', [
+    (None, None),
+    ('2024-02-29', '2024-02-29'),
+    ('2024-02-01', '2024-03-15'),      # Rango corto: por fecha
+    ('2023-01-01', '2024-12-31'),      # Rango largo: por el índice de producto
+    ('2019-01-01', '2019-01-31'),
+])
+def test_top_y_categorias_iguales_a_consultas_originales(db, historial, silencio, rango):
+    top = db.obtener_top_productos(10, *rango)
+    original = top_original(db, *rango)
+
+    assert {fila['producto_id']: (fila['cantidad_vendida'], fila['total_vendido'], fila['categoria'], fila['stock'])
+            for fila in top} == \
+           {pid: (fila['cantidad_vendida'], fila['total_vendido'], fila['categoria'], fila['stock'])
+            for pid, fila in original.items()}
+    assert [fila['cantidad_vendida'] for fila in top] == sorted((f['cantidad_vendida'] for f in top), reverse=True)
+
+    categorias = db.obtener_ventas_por_categoria(*rango)
+    assert {fila['categoria']: (fila['cantidad'], fila['total']) for fila in categorias} == \
+           {cat: (fila['cantidad'], fila['total']) for cat, fila in categorias_original(db, *rango).items()}
+
+
+def test_top_con_ventas_modificadas_y_producto_eliminado(db, historial, silencio):
+    conn = db.get_connection()
+    conn.execute('UPDATE detalle_ventas SET cantidad = cantidad + 1, subtotal = subtotal + 12 WHERE id % 7 = 0')
+    conn.execute('UPDATE detalle_ventas SET producto_id = ? WHERE id % 11 = 0', (historial[2],))
+    conn.execute('DELETE FROM detalle_ventas WHERE id % 13 = 0')
+    # Corrección de fechas (el detalle se mueve de día) y ventas borradas con su detalle suelto
+    conn.execute("UPDATE ventas SET fecha = DATETIME(fecha, '+3 days') WHERE id % 5 = 0")
+    conn.execute('DELETE FROM ventas WHERE id % 17 = 0')
+    conn.commit()
+    conn.close()
+    db.eliminar_producto(historial[1])
+
+    for rango in [(None, None), ('2024-02-01', '2024-03-15')]:
+        top = db.obtener_top_productos(10, *rango)
+        original = top_original(db, *rango)
+        assert {fila['producto_id']: (fila['cantidad_vendida'], fila['total_vendido'], fila['categoria'])
+                for fila in top} == \
+               {pid: (fila['cantidad_vendida'], fila['total_vendido'], fila['categoria'])
+                for pid, fila in original.items()}
+        assert next(f for f in top if f['producto_id'] == historial[1])['producto_nombre'] == 'Vino'
+        assert {fila['categoria']: (fila['cantidad'], fila['total']) for fila in db.obtener_ventas_por_categoria(*rango)} == \
+               {cat: (fila['cantidad'], fila['total']) for cat, fila in categorias_original(db, *rango).items()}
+
+
+@pytest.mark.parametrize('rango', [
+    ('2024-02-01', '2024-02-29'),
+    ('2024-02-26', '2024-03-03'),
+    ('2023-01-01', '2024-12-31'),
+])
+def test_mapa_de_calor_igual_a_recorrer_las_ventas(db, historial, silencio, rango):
+    mapa = db.obtener_mapa_calor_ventas(*rango)
+
+    assert (mapa['cantidad'], mapa['total']) == mapa_recalculado(db, *rango)
+    inicio, fin = (date.fromisoformat(f) for f in rango)
+    dias = [inicio + timedelta(days=n) for n in range((fin - inicio).days + 1)]
+    assert mapa['dias_en_rango'] == [sum(1 for d in dias if d.weekday() == i) for i in range(7)]
+
+
+def test_ventas_por_hora_y_mapa_tras_cambios_en_ventas(db, historial, silencio):
+    conn = db.get_connection()
+    conn.execute("UPDATE ventas SET fecha = DATETIME(fecha, '+5 hours') WHERE id % 5 = 0")
+    conn.execute('UPDATE ventas SET total = total + 1 WHERE id % 3 = 0')
+    conn.commit()
+    conn.close()
+
+    assert (lambda m: (m['cantidad'], m['total']))(db.obtener_mapa_calor_ventas('2024-01-01', '2024-04-30')) == \
+           mapa_recalculado(db, '2024-01-01', '2024-04-30')
+
+    conn = db.get_connection()
+    horas = conn.execute('''
+        SELECT CAST(strftime('%H', fecha) AS INTEGER) as hora, COUNT(*) as cantidad, SUM(total) as total
+        FROM ventas WHERE DATE(fecha) = '2024-02-29' GROUP BY hora
+    ''').fetchall()
+    conn.close()
+    esperado = {hora: {'cantidad': 0, 'total': 0} for hora in range(24)}
+    esperado.update({fila['hora']: {'cantidad': fila['cantidad'], 'total': fila['total']} for fila in horas})
+    assert db.obtener_ventas_por_hora('2024-02-29') == esperado
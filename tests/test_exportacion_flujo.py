@@ -0,0 +1,47 @@
+import time
+
+
+def cargar_ventas(db, cantidad):
+    conn = db.get_connection()
+    conn.executemany('INSERT INTO ventas (total, metodo_pago, fecha) VALUES (?, ?, ?)',
+                     [(10 + n, 'efectivo', f'2026-01-{n % 28 + 1:02d} 12:00:00') for n in range(cantidad)])
+    conn.commit()
+    conn.close()
+
+
+def test_descargas_lentas_no_agotan_el_pool(cliente, silencio):
+    modulo, cliente = cliente
+    cargar_ventas(modulo.db, 1200)
+    modulo.db.pool.timeout = 1
+
+    # Más descargas a medio leer que conexiones tiene el pool
+    flujos = []
+    for _ in range(modulo.db.pool.tamano + 1):
+        respuesta = cliente.get('/api/ventas/exportar?format=ndjson&desde=2026-01-01&hasta=2026-01-31',
+                                buffered=False)
+        assert respuesta.status_code == 200
+        partes = iter(respuesta.response)
+        assert next(partes).count(b'\n') == 500
+        flujos.append((respuesta, partes))
+
+    inicio = time.monotonic()
+    conn = modulo.db.get_connection()
+    assert conn.execute('SELECT COUNT(*) FROM ventas').fetchone()[0] == 1200
+    conn.close()
+    assert time.monotonic() - inicio < 0.5
+
+    # Las descargas siguen y terminan con todas las filas
+    for respuesta, partes in flujos:
+        assert sum(parte.count(b'\n') for parte in partes) == 700
+        respuesta.close()
+
+
+def test_csv_trae_encabezado_y_filas(cliente, silencio):
+    modulo, cliente = cliente
+    cargar_ventas(modulo.db, 3)
+
+    respuesta = cliente.get('/api/ventas/exportar?format=csv&desde=2026-01-01&hasta=2026-01-31')
+
+    lineas = respuesta.get_data(as_text=True).lstrip('\ufeff').splitlines()
+    assert lineas[0].startswith('id,total,metodo_pago')
+    assert len(lineas) == 4
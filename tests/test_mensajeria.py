@@ -0,0 +1,115 @@
+import pickle
+import sqlite3
+import threading
+import time
+
+import socketio
+
+from utils.mensajeria import ManagerSQLite, opciones_socketio, ruta_sqlite
+
+
+def manager(ruta, **kwargs):
+    """ManagerSQLite enlazado a su propio servidor, como en cada worker"""
+    nuevo = ManagerSQLite(f'sqlite:///{ruta}', **kwargs)
+    socketio.Server(client_manager=nuevo, async_mode='threading')
+    return nuevo
+
+
+class Escucha:
+    """Recorre _listen() de un manager en un hilo hasta que se le pide parar"""
+
+    def __init__(self, manager):
+        self.recibidos = []
+        self.parar = False
+        self.hilo = threading.Thread(target=self._recorrer, args=(manager,), daemon=True)
+        self.hilo.start()
+
+    def _recorrer(self, manager):
+        for mensaje in manager._listen():
+            self.recibidos.append(mensaje)
+            if self.parar:
+                break
+
+    def esperar(self, condicion, segundos=5):
+        limite = time.monotonic() + segundos
+        while not condicion():
+            assert time.monotonic() < limite, 'No llegó el mensaje esperado'
+            time.sleep(0.01)
+
+
+def envejecer(ruta, segundos):
+    conn = sqlite3.connect(ruta)
+    conn.execute('UPDATE mensajes SET creado = creado - ?', (segundos,))
+    conn.commit()
+    conn.close()
+
+
+def eventos(ruta):
+    """Eventos guardados en la tabla de mensajes, en orden"""
+    conn = sqlite3.connect(ruta)
+    filas = conn.execute('SELECT datos FROM mensajes ORDER BY id').fetchall()
+    conn.close()
+    return [pickle.loads(datos)['event'] for datos, in filas]
+
+
+def test_publicacion_llega_al_otro_worker(tmp_path):
+    ruta = str(tmp_path / 'bus.db')
+    publica, recibe = manager(ruta), manager(ruta)
+    escucha = Escucha(recibe)
+
+    # El hilo empieza a leer desde el último id: avisar hasta que vea algo
+    escucha.esperar(lambda: publica.emit('ping', {}) or escucha.recibidos)
+    publica.emit('venta_creada', {'id': 7, 'total': 24.5}, room='caja')
+
+    escucha.esperar(lambda: any(m['event'] == 'venta_creada' for m in escucha.recibidos))
+    escucha.parar = True
+    mensaje = next(m for m in escucha.recibidos if m['event'] == 'venta_creada')
+    assert (mensaje['method'], mensaje['data'], mensaje['room']) == ('emit', [{'id': 7, 'total': 24.5}], 'caja')
+
+
+def test_otro_canal_no_se_recibe(tmp_path):
+    ruta = str(tmp_path / 'bus.db')
+    otro_canal, publica, recibe = manager(ruta, channel='otro'), manager(ruta), manager(ruta)
+    escucha = Escucha(recibe)
+
+    escucha.esperar(lambda: publica.emit('ping', {}) or escucha.recibidos)
+    otro_canal.emit('ajeno', {})
+    publica.emit('propio', {})
+
+    escucha.esperar(lambda: any(m['event'] == 'propio' for m in escucha.recibidos))
+    escucha.parar = True
+    assert not any(m['event'] == 'ajeno' for m in escucha.recibidos)
+
+
+def test_borra_mensajes_mas_viejos_que_la_retencion(tmp_path):
+    ruta = str(tmp_path / 'bus.db')
+    publica = manager(ruta)
+    publica.emit('viejo', {})
+    publica.emit('viejo', {})
+    envejecer(ruta, 60)
+    publica.emit('reciente', {})
+
+    manager(ruta, retencion=30)._borrar_viejos(sqlite3.connect(ruta, isolation_level=None))
+
+    assert eventos(ruta) == ['reciente']
+
+
+def test_la_escucha_limpia_cada_retencion(tmp_path):
+    ruta = str(tmp_path / 'bus.db')
+    publica = manager(ruta)
+    publica.emit('viejo', {})
+    envejecer(ruta, 60)
+
+    escucha = Escucha(manager(ruta, retencion=0.1))
+    escucha.esperar(lambda: publica.emit('ping', {}) or 'viejo' not in eventos(ruta))
+    escucha.parar = True
+
+    assert 'viejo' not in eventos(ruta)
+
+
+def test_opciones_segun_la_url(tmp_path):
+    assert opciones_socketio('') == {}
+    assert opciones_socketio('redis://localhost:6379/0') == {'message_queue': 'redis://localhost:6379/0'}
+    assert isinstance(opciones_socketio(f'sqlite:///{tmp_path}/bus.db')['client_manager'], ManagerSQLite)
+    assert ruta_sqlite('sqlite:////tmp/bus.db') == '/tmp/bus.db'
+    assert ruta_sqlite('sqlite:///database/bus.db') == 'database/bus.db'
@@ -0,0 +1,87 @@
+import sqlite3
+
+from conftest import abrir_base, item, resumen_acumulado, resumen_recalculado
+from utils import database
+
+
+def crear_base_original(ruta, monkeypatch):
+    """Base con solo las tablas originales (user_version 0) y datos cargados sin triggers"""
+    with monkeypatch.context() as m:
+        m.setattr(database, 'MIGRACIONES', [])
+        base = abrir_base(ruta)
+        base.pool.cerrar()
+
+    conn = sqlite3.connect(ruta)
+    conn.executescript('''
+        INSERT INTO productos (id, nombre, precio_compra, precio_venta, unidad, categoria, stock)
+        VALUES (1, 'Cerveza', 8, 12, 'unidad', 'Cervezas', 20),
+               (2, 'Vino', 30, 50, 'botella', 'Vinos', 0);
+        INSERT INTO caja (id, monto_inicial, estado) VALUES (1, 100, 'abierta');
+        INSERT INTO ventas (id, total, metodo_pago, monto_efectivo, monto_qr, fecha) VALUES
+            (1, 24, 'efectivo', 0, 0, '2026-01-10 10:00:00'),
+            (2, 62, 'mixto', 40, 22, '2026-01-10 18:30:00'),
+            (3, 50, 'credito', 0, 0, '2026-01-11 09:00:00');
+        INSERT INTO detalle_ventas (venta_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal)
+        VALUES (1, 1, 'Cerveza', 2, 12, 24), (2, 1, 'Cerveza', 1, 12, 12),
+               (2, 2, 'Vino', 1, 50, 50), (3, 2, 'Vino', 1, 50, 50);
+        INSERT INTO compras (id, tipo, monto, proveedor, metodo_pago, fecha)
+        VALUES (1, 'productos', 80, 'Proveedor', 'efectivo', '2026-01-09 08:00:00');
+        INSERT INTO creditos (id, venta_id, cliente_nombre, monto_total, monto_pagado, saldo_pendiente, fecha_credito)
+        VALUES (1, 3, 'Ana', 50, 20, 30, '2026-01-11 09:00:00');
+        INSERT INTO pagos_creditos (credito_id, monto, metodo_pago, fecha)
+        VALUES (1, 20, 'qr', '2026-01-12 11:00:00');
+        INSERT INTO movimientos_caja (caja_id, tipo, concepto, monto, metodo_pago, referencia_id, referencia_tipo)
+        VALUES (1, 'ingreso', 'Venta #1', 24, 'efectivo', 1, 'venta'),
+               (1, 'ingreso', 'Venta #2 - Efectivo', 40, 'efectivo', 2, 'venta'),
+               (1, 'ingreso', 'Venta #2 - QR', 22, 'qr', 2, 'venta'),
+               (1, 'egreso', 'Compra de productos #1', 80, 'efectivo', 1, 'compra'),
+               (1, 'ingreso', 'Pago de crédito #1', 20, 'qr', 1, 'credito');
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def test_migrar_base_original(tmp_path, monkeypatch, silencio):
+    ruta = str(tmp_path / 'original.db')
+    crear_base_original(ruta, monkeypatch)
+
+    db = abrir_base(ruta)
+    try:
+        conn = db.get_connection()
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == database.MIGRACIONES[-1][0]
+        por_producto = conn.execute('''
+            SELECT producto_id, SUM(cantidad), SUM(subtotal) FROM ventas_producto_diario GROUP BY producto_id
+        ''').fetchall()
+        por_hora = conn.execute('SELECT SUM(cantidad), SUM(total) FROM ventas_por_hora').fetchone()
+        conn.close()
+
+        # Los datos derivados se llenan con el historial existente
+        assert resumen_acumulado(db) == resumen_recalculado(db)
+        assert [tuple(f) for f in por_producto] == [(1, 3, 36), (2, 2, 100)]
+        assert tuple(por_hora) == (3, 136)
+        assert db.verificar_totales_caja(1)['correcto']
+        assert db.obtener_caja(1)['ingresos_efectivo'] == 64
+        assert db.verificar_stock()['correcto']
+
+        # Y después se mantienen con las operaciones nuevas
+        db.registrar_venta_completa(12, 'efectivo', [item(1)])
+        assert resumen_acumulado(db) == resumen_recalculado(db)
+        assert db.verificar_totales_caja(1)['correcto']
+        assert db.verificar_stock()['correcto']
+    finally:
+        db.pool.cerrar()
+
+
+def test_migraciones_no_se_repiten(tmp_path, silencio):
+    ruta = str(tmp_path / 'nueva.db')
+    primera = abrir_base(ruta)
+    primera.pool.cerrar()
+
+    segunda = abrir_base(ruta)
+    try:
+        conn = segunda.get_connection()
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == database.MIGRACIONES[-1][0]
+        assert conn.execute('SELECT COUNT(*) FROM movimientos_stock').fetchone()[0] == 0
+        conn.close()
+    finally:
+        segunda.pool.cerrar()
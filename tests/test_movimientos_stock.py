@@ -0,0 +1,111 @@
+import pytest
+
+from conftest import item
+from utils.database import ProductosInexistentes, StockInsuficiente
+
+
+def stock(db, producto_id):
+    return db.obtener_producto(producto_id)['stock']
+
+
+def contar(db, tabla):
+    conn = db.get_connection()
+    cantidad = conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+    conn.close()
+    return cantidad
+
+
+def test_lote_valido_se_aplica_entero(db, producto, silencio):
+    otro = db.crear_producto('Vino', '', None, 30, 50, 'botella', 'Vinos', 4, 1)
+
+    fallidos = db.aplicar_movimientos_stock([
+        {'producto_id': producto, 'cantidad': 3},
+        {'producto_id': otro, 'cantidad': 2, 'operacion': 'sumar'},
+        {'producto_id': producto, 'cantidad': 1},
+    ], validar=True)
+
+    assert fallidos == []
+    assert (stock(db, producto), stock(db, otro)) == (6, 6)
+    assert db.verificar_stock()['correcto']
+
+
+def test_lote_con_falla_no_aplica_nada(db, producto, silencio):
+    otro = db.crear_producto('Vino', '', None, 30, 50, 'botella', 'Vinos', 4, 1)
+    movimientos_antes = contar(db, 'movimientos_stock')
+
+    fallidos = db.aplicar_movimientos_stock([
+        {'producto_id': producto, 'cantidad': 3},
+        {'producto_id': otro, 'cantidad': 3, 'producto_nombre': 'Vino'},
+        {'producto_id': otro, 'cantidad': 2, 'producto_nombre': 'Vino'},
+        {'producto_id': 999, 'cantidad': 1},
+    ], validar=True)
+
+    # Las líneas repetidas se suman: 3 + 2 de Vino no alcanzan con 4
+    assert [(f['indice'], f['producto_id']) for f in fallidos] == [(1, otro), (2, otro), (3, 999)]
+    assert fallidos[0]['stock'] == 4
+    assert fallidos[2]['motivo'] == 'producto inexistente'
+    assert (stock(db, producto), stock(db, otro)) == (10, 4)
+    assert contar(db, 'movimientos_stock') == movimientos_antes
+
+
+def test_sin_validar_permite_stock_negativo(db, producto, silencio):
+    assert db.aplicar_movimientos_stock([{'producto_id': producto, 'cantidad': 12}]) == []
+    assert stock(db, producto) == -2
+    assert db.verificar_stock()['correcto']
+
+
+def test_venta_sin_stock_no_registra_nada(db, producto, silencio):
+    db.abrir_caja(100)
+
+    with pytest.raises(StockInsuficiente) as error:
+        db.registrar_venta_completa(132, 'efectivo', [item(producto, 11)])
+
+    assert error.value.fallidos[0]['producto_id'] == producto
+    assert stock(db, producto) == 10
+    for tabla in ('ventas', 'detalle_ventas', 'movimientos_caja'):
+        assert contar(db, tabla) == 0
+
+
+def test_compra_con_producto_inexistente_no_registra_nada(db, producto, silencio):
+    db.abrir_caja(100)
+
+    with pytest.raises(ProductosInexistentes) as error:
+        db.registrar_compra_completa('productos', 50, 'Proveedor', 'efectivo',
+                                     [item(producto, 5, 5), item(999, 5, 5, 'Desconocido')])
+
+    assert [f['producto_id'] for f in error.value.fallidos] == [999]
+    assert stock(db, producto) == 10
+    for tabla in ('compras', 'detalle_compras', 'movimientos_caja'):
+        assert contar(db, tabla) == 0
+    assert db.verificar_stock()['correcto']
+
+
+def test_compra_valida_se_registra_entera(db, producto, silencio):
+    caja_id = db.abrir_caja(100)
+
+    compra_id = db.registrar_compra_completa('productos', 25, 'Proveedor', 'efectivo',
+                                             [item(producto, 5, 5)])
+
+    assert compra_id
+    assert stock(db, producto) == 15
+    assert [d['cantidad'] for d in db.obtener_detalle_compra(compra_id)] == [5]
+    assert db.obtener_caja(caja_id)['egresos_efectivo'] == 25
+    assert db.verificar_stock()['correcto']
+
+
+def test_api_compra_con_producto_inexistente_responde_400(cliente, silencio):
+    modulo, cliente = cliente
+    modulo.db.abrir_caja(100)
+    producto = modulo.db.crear_producto('Cerveza', '', None, 8, 12, 'unidad', 'Cervezas', 10, 2)
+
+    respuesta = cliente.post('/api/compras', json={
+        'tipo': 'productos', 'monto': 50, 'metodo_pago': 'efectivo',
+        'items': [item(producto, 5, 5), item(999, 5, 5, 'Desconocido')]
+    })
+
+    assert respuesta.status_code == 400
+    datos = respuesta.get_json()
+    assert not datos['success']
+    assert [f['producto_id'] for f in datos['fallidos']] == [999]
+    assert modulo.db.obtener_producto(producto)['stock'] == 10
+    assert contar(modulo.db, 'compras') == 0
@@ -0,0 +1,70 @@
+import pytest
+
+from utils.database import leer_cursor_ventas
+
+
+def cargar_ventas(db):
+    """25 ventas en 5 instantes repetidos (varias comparten fecha) y métodos alternados"""
+    conn = db.get_connection()
+    conn.executemany('INSERT INTO ventas (total, metodo_pago, fecha) VALUES (?, ?, ?)',
+                     [(n, 'efectivo' if n % 2 else 'qr', f'2026-01-{n % 5 + 1:02d} 12:00:00')
+                      for n in range(25)])
+    conn.commit()
+    ids = [fila[0] for fila in conn.execute('SELECT id FROM ventas ORDER BY fecha DESC, id DESC')]
+    conn.close()
+    return ids
+
+
+def recorrer(cliente, consulta):
+    """Ids de todas las páginas de /api/ventas siguiendo el cursor"""
+    ids, cursor, paginas = [], None, 0
+    while True:
+        url = f'/api/ventas?{consulta}' + (f'&cursor={cursor}' if cursor else '')
+        datos = cliente.get(url).get_json()
+        ids += [venta['id'] for venta in datos['ventas']]
+        paginas += 1
+        cursor = datos['siguiente']
+        if not cursor:
+            return ids, paginas
+
+
+def test_paginas_sin_repetidos_ni_huecos(cliente, silencio):
+    modulo, cliente = cliente
+    esperado = cargar_ventas(modulo.db)
+
+    for limite in (1, 4, 5, 7, 25, 50):
+        ids, paginas = recorrer(cliente, f'limit={limite}')
+        assert ids == esperado
+        assert paginas == max(1, -(-25 // limite))
+
+
+def test_paginas_con_filtros(cliente, silencio):
+    modulo, cliente = cliente
+    cargar_ventas(modulo.db)
+
+    conn = modulo.db.get_connection()
+    esperado = [fila[0] for fila in conn.execute('''
+        SELECT id FROM ventas WHERE metodo_pago = 'qr' AND fecha >= '2026-01-02' AND fecha < '2026-01-05'
+        ORDER BY fecha DESC, id DESC
+    ''')]
+    conn.close()
+
+    ids, _ = recorrer(cliente, 'limit=2&metodo_pago=qr&desde=2026-01-02&hasta=2026-01-04')
+    assert ids == esperado
+
+
+@pytest.mark.parametrize('cursor', ['abc', 'x|y', '2026-01-01 12:00:00|', '|5', 'fecha|5',
+                                    '2026-01-01 12:00:00|-1'])
+def test_cursor_invalido_responde_400(cliente, silencio, cursor):
+    _, cliente = cliente
+
+    respuesta = cliente.get('/api/ventas', query_string={'cursor': cursor})
+
+    assert respuesta.status_code == 400
+    assert not respuesta.get_json()['success']
+
+
+def test_leer_cursor_ventas():
+    assert leer_cursor_ventas('2026-01-01 12:00:00|17') == ('2026-01-01 12:00:00', 17)
+    with pytest.raises(ValueError):
+        leer_cursor_ventas('17')
@@ -0,0 +1,129 @@
+import gc
+import sqlite3
+import time
+
+import pytest
+
+from utils.pool import PoolConexiones
+
+
+class Creadas:
+    """crear_conexion que cuenta las conexiones abiertas"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.conexiones = []
+
+    def __call__(self):
+        conn = sqlite3.connect(self.ruta, check_same_thread=False)
+        self.conexiones.append(conn)
+        return conn
+
+
+@pytest.fixture
+def creadas(tmp_path):
+    crear = Creadas(str(tmp_path / 'pool.db'))
+    conn = crear()
+    conn.execute('CREATE TABLE numeros (n INTEGER)')
+    conn.commit()
+    conn.close()
+    crear.conexiones.clear()
+    return crear
+
+
+def test_pool_agotado_espera_el_timeout(creadas):
+    pool = PoolConexiones(creadas, tamano=2, timeout=0.2)
+    prestadas = [pool.obtener(), pool.obtener()]
+
+    inicio = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError, match='agotado'):
+        pool.obtener()
+    assert time.monotonic() - inicio >= 0.2
+
+    prestadas[0].close()
+    assert pool.obtener() is not None
+
+
+def test_close_devuelve_la_conexion_al_pool(creadas):
+    pool = PoolConexiones(creadas, tamano=2)
+
+    conn = pool.obtener()
+    conn.execute('SELECT 1')
+    conn.close()
+    conn.close()  # Cerrar dos veces no devuelve dos veces
+    otra = pool.obtener()
+
+    assert otra._conn is creadas.conexiones[0]
+    assert len(creadas.conexiones) == 1
+    assert pool._libres.qsize() == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+
+
+def test_devolver_deshace_lo_no_confirmado(creadas):
+    pool = PoolConexiones(creadas, tamano=1)
+
+    conn = pool.obtener()
+    conn.execute('INSERT INTO numeros VALUES (1)')
+    conn.close()
+
+    conn = pool.obtener()
+    assert conn.execute('SELECT COUNT(*) FROM numeros').fetchone()[0] == 0
+    assert not conn.in_transaction
+    conn.close()
+
+
+def test_conexion_olvidada_vuelve_al_liberarse(creadas):
+    pool = PoolConexiones(creadas, tamano=1, timeout=0.2)
+
+    def olvidar():
+        conn = pool.obtener()
+        conn.execute('INSERT INTO numeros VALUES (1)')
+        # Sin close(): por ejemplo, una excepción antes de cerrar
+
+    olvidar()
+    gc.collect()
+
+    conn = pool.obtener()
+    assert conn._conn is creadas.conexiones[0]
+    assert conn.execute('SELECT COUNT(*) FROM numeros').fetchone()[0] == 0
+    conn.close()
+
+
+def test_conexion_que_no_responde_se_reemplaza(creadas):
+    pool = PoolConexiones(creadas, tamano=1, verificar_cada=0)
+    conn = pool.obtener()
+    conn.close()
+    creadas.conexiones[0].close()  # Se cerró por fuera mientras estaba libre
+
+    nueva = pool.obtener()
+
+    assert nueva._conn is creadas.conexiones[1]
+    assert nueva.execute('SELECT 1').fetchone() == (1,)
+    nueva.close()
+
+
+def test_cerrar_cierra_las_libres(creadas):
+    pool = PoolConexiones(creadas, tamano=2)
+    a, b = pool.obtener(), pool.obtener()
+    a.close()
+    b.close()
+
+    pool.cerrar()
+
+    for conn in creadas.conexiones:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+
+
+def test_database_reutiliza_las_conexiones_del_pool(db, silencio):
+    conexiones = [db.get_connection() for _ in range(db.pool.tamano)]
+    crudas = {conn._conn for conn in conexiones}
+    for conn in conexiones:
+        conn.close()
+
+    reutilizada = db.get_connection()
+
+    assert reutilizada._conn in crudas
+    assert db.pool._libres.qsize() == db.pool.tamano - 1
+    reutilizada.close()
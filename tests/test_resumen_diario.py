@@ -0,0 +1,53 @@
+from conftest import item, resumen_acumulado, resumen_recalculado
+
+
+def registrar_movimientos(db, producto):
+    """Ventas con cada método de pago, una compra, un crédito con pago parcial"""
+    db.abrir_caja(100)
+    db.registrar_venta_completa(24, 'efectivo', [item(producto, 2)])
+    db.registrar_venta_completa(12, 'qr', [item(producto)])
+    db.registrar_venta_completa(36, 'mixto', [item(producto, 3)], monto_efectivo=20, monto_qr=16)
+    venta_credito = db.registrar_venta_completa(12, 'credito', [item(producto)],
+                                                cliente_nombre='Ana', cliente_telefono='700')
+    db.registrar_compra_completa('productos', 40, 'Proveedor', 'efectivo', [item(producto, 5, 8)])
+    db.crear_compra('gastos', 15, None, 'qr', descripcion='Luz')
+
+    conn = db.get_connection()
+    credito_id = conn.execute('SELECT id FROM creditos WHERE venta_id = ?',
+                              (venta_credito,)).fetchone()[0]
+    conn.close()
+    db.registrar_pago_credito(credito_id, {'monto': 5, 'metodo_pago': 'efectivo'})
+    return credito_id
+
+
+def test_triggers_igualan_recalculo(db, producto, silencio):
+    registrar_movimientos(db, producto)
+
+    acumulado = resumen_acumulado(db)
+    assert acumulado == resumen_recalculado(db)
+    assert {origen for _, origen, _ in acumulado} == {'venta', 'compra', 'credito', 'pago_credito'}
+
+
+def test_borrar_y_modificar_filas_de_origen(db, producto, silencio):
+    registrar_movimientos(db, producto)
+
+    conn = db.get_connection()
+    conn.execute("UPDATE ventas SET fecha = DATE(fecha, '-3 days'), total = total + 1 WHERE metodo_pago = 'qr'")
+    conn.execute("UPDATE ventas SET metodo_pago = 'qr' WHERE metodo_pago = 'efectivo'")
+    conn.execute("DELETE FROM compras WHERE tipo = 'gastos'")
+    conn.commit()
+    conn.close()
+
+    assert resumen_acumulado(db) == resumen_recalculado(db)
+
+
+def test_eliminar_compra_descuenta_del_resumen(db, producto, silencio):
+    db.abrir_caja(100)
+    compra_id = db.registrar_compra_completa('productos', 40, 'Proveedor', 'efectivo',
+                                             [item(producto, 5, 8)])
+
+    db.eliminar_compra(compra_id)
+
+    acumulado = resumen_acumulado(db)
+    assert acumulado == resumen_recalculado(db)
+    assert not any(origen == 'compra' for _, origen, _ in acumulado)
@@ -0,0 +1,126 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import item
+from utils import database
+
+
+@pytest.fixture
+def historial(db, silencio):
+    """Producto sin stock inicial con movimientos en días pasados: 10, 7 y 12 al cierre"""
+    producto = db.crear_producto('Ron', '', None, 40, 60, 'botella', 'Licores', 0, 1)
+    conn = db.get_connection()
+    conn.executemany('''
+        INSERT INTO movimientos_stock (producto_id, fecha, cantidad, origen, costo_unitario)
+        VALUES (?, ?, ?, ?, 40)
+    ''', [(producto, '2026-01-01 10:00:00', 10, 'compra'),
+          (producto, '2026-01-02 12:00:00', -3, 'venta'),
+          (producto, '2026-01-05 09:00:00', 5, 'compra')])
+    conn.execute('UPDATE productos SET stock = 12 WHERE id = ?', (producto,))
+    conn.commit()
+    conn.close()
+    return producto
+
+
+def stock_en(db, fecha, producto):
+    return db.obtener_stock_en_fecha(fecha, producto).get(producto, 0)
+
+
+def test_stock_en_fecha_sin_fotos(db, historial):
+    assert [stock_en(db, fecha, historial)
+            for fecha in ('2025-12-31', '2026-01-01', '2026-01-03', '2026-01-05')] == [0, 10, 7, 12]
+
+
+def test_fotos_diarias_no_cambian_el_resultado(db, historial, silencio):
+    assert db.generar_snapshots_stock(hasta='2026-01-03') == 2
+    assert db.generar_snapshots_stock(hasta='2026-01-03') == 0
+
+    conn = db.get_connection()
+    fotos = conn.execute('SELECT fecha, stock FROM stock_diario WHERE producto_id = ? ORDER BY fecha',
+                         (historial,)).fetchall()
+    conn.close()
+    assert [tuple(f) for f in fotos] == [('2026-01-01', 10), ('2026-01-02', 7)]
+
+    assert [stock_en(db, fecha, historial)
+            for fecha in ('2025-12-31', '2026-01-01', '2026-01-03', '2026-01-05')] == [0, 10, 7, 12]
+
+    assert db.generar_snapshots_stock(hasta='2026-01-10') == 1
+    assert stock_en(db, '2026-01-10', historial) == 12
+
+
+class Reloj(datetime):
+    """Servidor en UTC+3: a la 01:00 local del 4 de enero en UTC todavía es el 3"""
+    utc = datetime(2026, 1, 3, 22, 0, tzinfo=timezone.utc)
+
+    @classmethod
+    def now(cls, tz=None):
+        if tz is None:
+            return (cls.utc + timedelta(hours=3)).replace(tzinfo=None)
+        return cls.utc.astimezone(tz)
+
+
+def test_foto_de_ayer_espera_el_fin_del_dia_utc(db, historial, monkeypatch, silencio):
+    monkeypatch.setattr(database, 'datetime', Reloj)
+    conn = db.get_connection()
+    conn.execute('''
+        INSERT INTO movimientos_stock (producto_id, fecha, cantidad, origen) VALUES (?, ?, -2, 'venta')
+    ''', (historial, '2026-01-03 10:00:00'))
+    conn.commit()
+
+    db.generar_snapshots_stock()
+
+    # Venta al final del día 3 en UTC, después de la primera corrida
+    conn.execute('''
+        INSERT INTO movimientos_stock (producto_id, fecha, cantidad, origen) VALUES (?, ?, -1, 'venta')
+    ''', (historial, '2026-01-03 23:30:00'))
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(Reloj, 'utc', datetime(2026, 1, 6, 22, 0, tzinfo=timezone.utc))
+    db.generar_snapshots_stock()
+
+    assert [stock_en(db, fecha, historial)
+            for fecha in ('2026-01-02', '2026-01-03', '2026-01-05')] == [7, 4, 9]
+
+
+def test_libro_es_de_solo_agregar(db, historial):
+    conn = db.get_connection()
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute('UPDATE movimientos_stock SET cantidad = 0')
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute('DELETE FROM movimientos_stock')
+    conn.rollback()
+    conn.close()
+
+
+def test_verificar_stock_despues_de_operaciones(db, producto, silencio):
+    db.abrir_caja(100)
+    db.registrar_venta_completa(24, 'efectivo', [item(producto, 2)])
+    venta_credito = db.registrar_venta_completa(12, 'credito', [item(producto)], cliente_nombre='Ana')
+    compra_id = db.registrar_compra_completa('productos', 40, 'Proveedor', 'efectivo',
+                                             [item(producto, 5, 8)])
+    db.actualizar_stock(producto, 1, 'sumar')
+    db.eliminar_compra(compra_id)
+
+    conn = db.get_connection()
+    credito_id = conn.execute('SELECT id FROM creditos WHERE venta_id = ?', (venta_credito,)).fetchone()[0]
+    conn.close()
+    db.registrar_pago_credito(credito_id, {'monto': 12, 'metodo_pago': 'qr'})
+
+    assert db.obtener_producto(producto)['stock'] == 10 - 2 - 1 + 5 + 1
+    assert db.verificar_stock()['correcto']
+    assert db.obtener_stock_en_fecha('2999-12-31', producto) == {producto: 13}
+
+
+def test_verificar_stock_corrige_con_ajuste(db, producto, silencio):
+    conn = db.get_connection()
+    conn.execute('UPDATE productos SET stock = 4 WHERE id = ?', (producto,))
+    conn.commit()
+    conn.close()
+
+    resultado = db.verificar_stock(corregir=True)
+    assert resultado['diferencias'] == [{'producto_id': producto, 'nombre': 'Cerveza',
+                                         'stock': 4, 'libro': 10}]
+    assert db.verificar_stock()['correcto']
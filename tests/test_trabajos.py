@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+import pytest
+
+from utils.trabajos import ColaLlena, ColaTrabajos
+
+
+def esperar(cola, trabajo_id, estados=('listo', 'error')):
+    """Estado del trabajo cuando llega a uno de los estados (o falla a los 5 s)"""
+    limite = time.monotonic() + 5
+    while time.monotonic() < limite:
+        trabajo = cola.obtener(trabajo_id)
+        if trabajo['estado'] in estados:
+            return trabajo
+        time.sleep(0.01)
+    pytest.fail(f'El trabajo {trabajo_id} no terminó')
+
+
+def escribir(texto, filas=3):
+    """Función de trabajo que informa progreso y escribe texto en el destino"""
+    def funcion(destino, progreso):
+        for fila in range(1, filas + 1):
+            progreso(fila)
+        with open(destino, 'w') as archivo:
+            archivo.write(texto)
+        return destino
+    return funcion
+
+
+def test_trabajo_termina_listo_con_su_archivo(tmp_path, silencio):
+    cola = ColaTrabajos(str(tmp_path), concurrentes=1)
+
+    trabajo = cola.enviar('ventas.xlsx', escribir('datos'))
+    assert trabajo['estado'] == 'en_cola'
+    assert 'ruta' not in trabajo
+
+    listo = esperar(cola, trabajo['id'])
+    assert (listo['estado'], listo['filas'], listo['error']) == ('listo', 3, None)
+    assert listo['terminado'] is not None
+    with open(listo['ruta']) as archivo:
+        assert archivo.read() == 'datos'
+    assert not os.path.exists(listo['ruta'] + '.parcial')
+
+
+@pytest.mark.parametrize('funcion, mensaje', [
+    (lambda destino, progreso: 1 / 0, 'division by zero'),
+    (lambda destino, progreso: None, 'No se pudo generar el archivo'),
+])
+def test_trabajo_que_falla_queda_en_error(tmp_path, silencio, funcion, mensaje):
+    cola = ColaTrabajos(str(tmp_path), concurrentes=1)
+
+    trabajo = esperar(cola, cola.enviar('ventas.xlsx', funcion)['id'])
+
+    assert (trabajo['estado'], trabajo['error']) == ('error', mensaje)
+    assert not os.path.exists(trabajo['ruta'])
+    assert not os.path.exists(trabajo['ruta'] + '.parcial')
+
+
+def test_otro_worker_lee_el_estado_del_disco(tmp_path, silencio):
+    cola = ColaTrabajos(str(tmp_path), concurrentes=1)
+    otro_worker = ColaTrabajos(str(tmp_path))
+    liberar = threading.Event()
+
+    def funcion(destino, progreso):
+        progreso(5)
+        liberar.wait(5)
+        return escribir('datos')(destino, lambda filas: None)
+
+    trabajo_id = cola.enviar('ventas.xlsx', funcion)['id']
+    en_curso = esperar(otro_worker, trabajo_id, estados=('en_curso',))
+    liberar.set()
+
+    assert en_curso['nombre'] == 'ventas.xlsx'
+    assert esperar(otro_worker, trabajo_id)['estado'] == 'listo'
+    assert otro_worker.obtener('f' * 32) is None
+    assert otro_worker.obtener('../../etc/passwd') is None
+
+
+def test_cola_llena_rechaza_trabajos(tmp_path, silencio):
+    cola = ColaTrabajos(str(tmp_path), concurrentes=1, max_pendientes=2)
+    liberar = threading.Event()
+
+    def lento(destino, progreso):
+        liberar.wait(5)
+        return escribir('datos')(destino, progreso)
+
+    primero = cola.enviar('a.xlsx', lento)
+    cola.enviar('b.xlsx', lento)
+    with pytest.raises(ColaLlena):
+        cola.enviar('c.xlsx', lento)
+
+    liberar.set()
+    esperar(cola, primero['id'])
+
+
+def test_limpiar_respeta_la_retencion(tmp_path, silencio):
+    cola = ColaTrabajos(str(tmp_path), concurrentes=1, retencion=60)
+    viejo = esperar(cola, cola.enviar('viejo.xlsx', escribir('v'))['id'])
+    nuevo = esperar(cola, cola.enviar('nuevo.xlsx', escribir('n'))['id'])
+
+    # El primero terminó hace dos minutos; también hay un archivo suelto de un reinicio
+    hace_rato = time.time() - 120
+    viejo['terminado'] = hace_rato
+    suelto = tmp_path / 'suelto.xlsx'
+    suelto.write_text('x')
+    reciente = tmp_path / 'reciente.xlsx'
+    reciente.write_text('x')
+    for ruta in (viejo['ruta'], cola._ruta_estado(viejo['id']), nuevo['ruta'], suelto):
+        os.utime(ruta, (hace_rato, hace_rato))
+
+    assert cola.limpiar() == 3
+
+    assert cola.obtener(viejo['id']) is None
+    assert not os.path.exists(viejo['ruta'])
+    assert not suelto.exists()
+    assert cola.obtener(nuevo['id'])['estado'] == 'listo'
+    assert os.path.exists(nuevo['ruta'])
+    assert reciente.exists()
+
+
+def test_agregar_listo_y_cambiados(tmp_path, silencio):
+    cola = ColaTrabajos(str(tmp_path))
+    origen = tmp_path / 'cache.xlsx'
+    origen.write_text('guardado')
+    vistos = {}
+
+    trabajo = cola.agregar_listo('ventas.xlsx', str(origen), lambda de, a: os.link(de, a))
+
+    assert trabajo['estado'] == 'listo'
+    assert [t['id'] for t in cola.cambiados(vistos)] == [trabajo['id']]
+    assert cola.cambiados(vistos) == []
+    with open(cola.obtener(trabajo['id'])['ruta']) as archivo:
+        assert archivo.read() == 'guardado'
@@ -0,0 +1,258 @@
+import copy
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+
+class CacheResultados:
+    """Cache en memoria para resultados de consultas pesadas.
+
+    - Cada entrada guarda las tablas de las que depende; invalidar(tabla)
+      borra todas las que la usan.
+    - Las entradas que dependen de "hoy" vencen a los ttl_hoy segundos; el
+      resto vence a los ttl segundos aunque nadie escriba.
+    - Si varios pedidos llegan a la vez por la misma clave, solo el primero
+      ejecuta la consulta y los demás esperan su resultado.
+    - Cada pedido recibe su propia copia del valor: modificar el resultado
+      (listas, diccionarios) no altera lo guardado para los siguientes.
+    - Con varios procesos (workers), leer_versiones() -> {tabla: versión} y
+      publicar_versiones(tablas) comparten las invalidaciones: cada
+      invalidar publica y cada obtener descarta lo que otro proceso invalidó.
+      Las escrituras anidadas publican una sola vez, al terminar la externa
+      (la interna corre con la transacción de la externa todavía abierta).
+    """
+
+    def __init__(self, ttl=600, ttl_hoy=30, leer_versiones=None, publicar_versiones=None):
+        self.ttl = ttl
+        self.ttl_hoy = ttl_hoy
+        self._entradas = {}
+        self._en_curso = {}
+        self._version = 0
+        self._versiones_tablas = {}
+        self._leer_versiones = leer_versiones
+        self._publicar_versiones = publicar_versiones
+        self._escrituras = threading.local()
+        self._lock = threading.Lock()
+
+    def sincronizar(self):
+        """Borrar las entradas de tablas que otro proceso invalidó desde la última lectura"""
+        if self._leer_versiones is None:
+            return
+        versiones = self._leer_versiones()
+        if versiones is None:
+            # Sin saber qué cambió, nada de lo guardado es confiable
+            self.limpiar()
+            return
+        with self._lock:
+            cambiadas = {tabla for tabla, version in versiones.items()
+                         if self._versiones_tablas.get(tabla) != version}
+            if not cambiadas:
+                return
+            self._versiones_tablas.update(versiones)
+            self._version += 1
+            for clave in [c for c, e in self._entradas.items() if e['tablas'] & cambiadas]:
+                del self._entradas[clave]
+
+    def obtener(self, clave, calcular, tablas, ttl=None):
+        """Devolver el valor de la clave, calculándolo una sola vez si falta"""
+        self.sincronizar()
+        while True:
+            with self._lock:
+                entrada = self._entradas.get(clave)
+                if entrada and entrada['vence'] > time.monotonic():
+                    return copy.deepcopy(entrada['valor'])
+
+                evento = self._en_curso.get(clave)
+                if evento is None:
+                    evento = threading.Event()
+                    self._en_curso[clave] = evento
+                    version = self._version
+                    break
+
+            # Otro pedido ya está calculando esta clave: esperar su resultado
+            evento.wait()
+
+        try:
+            valor = calcular()
+            with self._lock:
+                # Si hubo escrituras mientras se calculaba, el valor puede estar viejo
+                if valor is not None and version == self._version:
+                    self._entradas[clave] = {
+                        'valor': valor,
+                        'tablas': set(tablas),
+                        'vence': time.monotonic() + (ttl if ttl is not None else self.ttl)
+                    }
+            return copy.deepcopy(valor)
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+            evento.set()
+
+    def invalidar(self, *tablas):
+        """Borrar las entradas que dependen de alguna de las tablas"""
+        tablas = set(tablas)
+        with self._lock:
+            self._version += 1
+            for clave in [c for c, e in self._entradas.items() if e['tablas'] & tablas]:
+                del self._entradas[clave]
+
+        if self._publicar_versiones is None:
+            return
+        pendientes = getattr(self._escrituras, 'pendientes', None)
+        if pendientes is not None:
+            pendientes.update(tablas)
+        else:
+            self._publicar_versiones(tablas)
+
+    @contextmanager
+    def escritura(self, *tablas):
+        """Invalidar las tablas al salir; las escrituras anidadas publican con la externa"""
+        if getattr(self._escrituras, 'pendientes', None) is not None:
+            try:
+                yield
+            finally:
+                self.invalidar(*tablas)
+            return
+
+        self._escrituras.pendientes = set()
+        try:
+            yield
+        finally:
+            pendientes = self._escrituras.pendientes | set(tablas)
+            self._escrituras.pendientes = None
+            self.invalidar(*pendientes)
+
+    def limpiar(self):
+        """Vaciar el cache completo"""
+        with self._lock:
+            self._version += 1
+            self._entradas.clear()
+
+
+class CacheArchivos:
+    """Cache en disco de archivos generados (exportaciones).
+
+    - La clave es el hash de (reporte, parámetros, versión de los datos):
+      si los datos cambian, cambia la versión y el archivo viejo ya no se
+      encuentra; nunca hace falta invalidar.
+    - Se borran los menos usados cuando el total supera max_bytes. El último
+      uso es el mtime del archivo, así que sobrevive a los reinicios.
+    - Sin locks: las operaciones son de archivos completos (os.replace) y la
+      usan también los hilos de exportación, fuera de eventlet.
+    """
+
+    def __init__(self, directorio, max_bytes=256 * 1024 * 1024, extension='.xlsx'):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.extension = extension
+        os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def clave(reporte, parametros, version):
+        texto = json.dumps([reporte, list(parametros), version], default=str, ensure_ascii=False)
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + self.extension)
+
+    def obtener(self, clave):
+        """Ruta del archivo guardado con esa clave (marcándolo como usado) o None"""
+        ruta = self._ruta(clave)
+        try:
+            os.utime(ruta)
+        except OSError:
+            return None
+        return ruta
+
+    def guardar(self, clave, archivo):
+        """Guardar una copia del archivo con esa clave y recortar el cache"""
+        temporal = f'{self._ruta(clave)}.{threading.get_ident()}.tmp'
+        try:
+            enlazar(archivo, temporal)
+            os.replace(temporal, self._ruta(clave))
+        except OSError as e:
+            print(f'❌ Error al guardar en el cache de exportaciones: {e}')
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return
+        self.recortar()
+
+    def recortar(self):
+        """Borrar los archivos menos usados hasta quedar dentro de max_bytes"""
+        archivos = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(self.extension):
+                continue
+            try:
+                estado = os.stat(os.path.join(self.directorio, nombre))
+            except OSError:
+                continue
+            archivos.append((estado.st_mtime, estado.st_size, nombre))
+
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, nombre in sorted(archivos):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+            except OSError:
+                pass
+            total -= tamano
+
+
+def enlazar(origen, destino):
+    """Hard link del archivo (sin copiar bytes); si no se puede, una copia"""
+    try:
+        os.link(origen, destino)
+    except OSError:
+        shutil.copyfile(origen, destino)
+
+
+def _depende_de_hoy(valores):
+    """True si la consulta usa la fecha actual (sin fechas o con fechas >= hoy)"""
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    fechas = [v[:10] for v in valores
+              if isinstance(v, str) and len(v) >= 10 and v[4] == '-' and v[7] == '-']
+    return not fechas or max(fechas) >= hoy
+
+
+def cacheado(*tablas):
+    """Decorador para métodos de Database cuyo resultado depende de esas tablas"""
+    def decorador(metodo):
+        @wraps(metodo)
+        def envoltura(self, *args, **kwargs):
+            if self.cache is None:
+                return metodo(self, *args, **kwargs)
+
+            clave = (metodo.__name__, args, tuple(sorted(kwargs.items())))
+            ttl = None
+            if _depende_de_hoy(list(args) + list(kwargs.values())):
+                ttl = self.cache.ttl_hoy
+
+            return self.cache.obtener(clave, lambda: metodo(self, *args, **kwargs),
+                                      tablas, ttl)
+        return envoltura
+    return decorador
+
+
+def invalida(*tablas):
+    """Decorador para métodos de Database que escriben en esas tablas"""
+    def decorador(metodo):
+        @wraps(metodo)
+        def envoltura(self, *args, **kwargs):
+            try:
+                if self.cache is None:
+                    return metodo(self, *args, **kwargs)
+                with self.cache.escritura(*tablas):
+                    return metodo(self, *args, **kwargs)
+            finally:
+                for observador in self.observadores_escritura:
+                    observador(tablas)
+        return envoltura
+    return decorador
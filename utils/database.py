@@ -1,18 +1,815 @@
+import hashlib
+import heapq
+import json
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 import os
+import re
+import sys
+
+# Permitir "from utils..." también al ejecutar este archivo directamente
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.pool import PoolConexiones
+from utils.cache import CacheResultados, cacheado, invalida
+from utils.perfilado import ConexionMedida, medir_conexion, instrumentar_clase
+
+# ========== PERFIL DE PRAGMAS ==========
+# Se aplica a cada conexión al abrirla. WAL permite que las lecturas (dashboard,
+# estadísticas) no esperen a las escrituras del POS; los valores se pueden
+# cambiar con variables de entorno o con Database(pragmas={...}).
+
+PERFIL_PRAGMAS = {
+    'journal_mode': os.getenv('DB_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('DB_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('DB_BUSY_TIMEOUT', 5000)),          # milisegundos
+    'mmap_size': int(os.getenv('DB_MMAP_SIZE', 64 * 1024 * 1024)),   # bytes
+    'cache_size': int(os.getenv('DB_CACHE_SIZE', -16000)),           # negativo = KiB
+    'temp_store': os.getenv('DB_TEMP_STORE', 'MEMORY'),
+}
+
+# ========== MIGRACIONES DEL ESQUEMA ==========
+# Cada migración es (versión, descripción, pasos). Se aplican en orden sobre
+# PRAGMA user_version, así una base existente se actualiza sola al arrancar.
+# Un paso puede ser una sentencia SQL o una función que recibe el cursor.
+
+# Orígenes del resumen diario: (tabla, origen, columna fecha, columna clave,
+# columna total, columna efectivo, columna qr). La clave es el método de pago
+# o, en compras, el tipo; los créditos otorgados no se desglosan.
+ORIGENES_RESUMEN_DIARIO = [
+    ('ventas', 'venta', 'fecha', 'metodo_pago', 'total', 'monto_efectivo', 'monto_qr'),
+    ('compras', 'compra', 'fecha', 'tipo', 'monto', None, None),
+    ('pagos_creditos', 'pago_credito', 'fecha', 'metodo_pago', 'monto', None, None),
+    ('creditos', 'credito', 'fecha_credito', None, 'monto_total', None, None),
+]
+
+
+def _sql_resumen_diario(fila, signo, origen, fecha, clave, total, efectivo, qr):
+    """UPSERT que suma (o resta) una fila al resumen diario"""
+    clave = f"COALESCE({fila}.{clave}, '')" if clave else "''"
+    efectivo = f'COALESCE({fila}.{efectivo}, 0)' if efectivo else '0'
+    qr = f'COALESCE({fila}.{qr}, 0)' if qr else '0'
+    return f'''
+        INSERT INTO resumen_diario
+        (fecha, origen, clave, cantidad, total, monto_efectivo, monto_qr)
+        VALUES (
+            COALESCE(DATE({fila}.{fecha}), ''), '{origen}', {clave},
+            {signo}1, {signo}COALESCE({fila}.{total}, 0), {signo}{efectivo}, {signo}{qr}
+        )
+        ON CONFLICT (fecha, origen, clave) DO UPDATE SET
+            cantidad = cantidad + excluded.cantidad,
+            total = total + excluded.total,
+            monto_efectivo = monto_efectivo + excluded.monto_efectivo,
+            monto_qr = monto_qr + excluded.monto_qr;
+    '''
+
+
+def _migrar_resumen_diario(cursor):
+    """Crear resumen_diario, llenarlo con el historial y enlazar los triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resumen_diario (
+            fecha TEXT NOT NULL,
+            origen TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            monto_efectivo REAL NOT NULL DEFAULT 0,
+            monto_qr REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, origen, clave)
+        ) WITHOUT ROWID
+    ''')
+    
+    for tabla, origen, fecha, clave, total, efectivo, qr in ORIGENES_RESUMEN_DIARIO:
+        # Historial existente
+        cursor.execute(f'''
+            INSERT INTO resumen_diario
+            (fecha, origen, clave, cantidad, total, monto_efectivo, monto_qr)
+            SELECT
+                COALESCE(DATE({fecha}), ''), '{origen}', {f"COALESCE({clave}, '')" if clave else "''"},
+                COUNT(*), COALESCE(SUM({total}), 0),
+                {f'COALESCE(SUM({efectivo}), 0)' if efectivo else '0'},
+                {f'COALESCE(SUM({qr}), 0)' if qr else '0'}
+            FROM {tabla}
+            GROUP BY 1, 3
+        ''')
+        
+        # Triggers: el resumen se actualiza en la misma transacción que la fila
+        columnas = (origen, fecha, clave, total, efectivo, qr)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_resumen_{tabla}_insert
+            AFTER INSERT ON {tabla} BEGIN
+                {_sql_resumen_diario('NEW', '', *columnas)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_resumen_{tabla}_delete
+            AFTER DELETE ON {tabla} BEGIN
+                {_sql_resumen_diario('OLD', '-', *columnas)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_resumen_{tabla}_update
+            AFTER UPDATE OF {', '.join(c for c in (fecha, clave, total, efectivo, qr) if c)}
+            ON {tabla} BEGIN
+                {_sql_resumen_diario('OLD', '-', *columnas)}
+                {_sql_resumen_diario('NEW', '', *columnas)}
+            END
+        ''')
+
+
+# Contadores que la fila de caja mantiene con cada movimiento:
+# (columna, condición sobre el movimiento {m}, valor a sumar)
+CONTADORES_CAJA = [
+    ('ingresos_efectivo', "{m}.tipo = 'ingreso' AND {m}.metodo_pago = 'efectivo'", '{m}.monto'),
+    ('ingresos_qr', "{m}.tipo = 'ingreso' AND {m}.metodo_pago = 'qr'", '{m}.monto'),
+    ('ingresos_mixto', "{m}.tipo = 'ingreso' AND {m}.metodo_pago = 'mixto'", '{m}.monto'),
+    ('ingresos_credito', "{m}.tipo = 'ingreso' AND {m}.metodo_pago = 'credito'", '{m}.monto'),
+    ('egresos_efectivo', "{m}.tipo = 'egreso' AND {m}.metodo_pago = 'efectivo'", '{m}.monto'),
+    ('egresos_otros', "{m}.tipo = 'egreso' AND {m}.metodo_pago != 'efectivo'", '{m}.monto'),
+    ('total_ingresos', "{m}.tipo = 'ingreso'", '{m}.monto'),
+    ('total_egresos', "{m}.tipo = 'egreso'", '{m}.monto'),
+    ('num_ventas', "{m}.referencia_tipo = 'venta'", '1'),
+    ('num_compras', "{m}.referencia_tipo = 'compra'", '1'),
+    ('num_pagos', "{m}.referencia_tipo = 'pago_credito'", '1'),
+]
+
+
+def _sql_sumas_caja(m='m'):
+    """Columnas SUM(CASE ...) que recalculan los contadores desde los movimientos"""
+    return ',\n'.join(
+        f"COALESCE(SUM(CASE WHEN {condicion.format(m=m)} THEN {valor.format(m=m)} ELSE 0 END), 0) as {columna}"
+        for columna, condicion, valor in CONTADORES_CAJA
+    )
+
+
+def _sql_contadores_caja(fila, signo):
+    """UPDATE que suma (o resta) un movimiento a los contadores de su caja"""
+    asignaciones = ',\n'.join(
+        f"{columna} = {columna} {signo} CASE WHEN {condicion.format(m=fila)} THEN {valor.format(m=fila)} ELSE 0 END"
+        for columna, condicion, valor in CONTADORES_CAJA
+    )
+    return f'UPDATE caja SET {asignaciones} WHERE id = {fila}.caja_id;'
+
+
+def _migrar_contadores_caja(cursor):
+    """Agregar los contadores a caja, calcularlos y enlazar los triggers"""
+    cursor.execute('PRAGMA table_info(caja)')
+    existentes = {row[1] for row in cursor.fetchall()}
+    
+    for columna, _, valor in CONTADORES_CAJA:
+        if columna not in existentes:
+            tipo = 'INTEGER' if valor == '1' else 'REAL'
+            cursor.execute(f'ALTER TABLE caja ADD COLUMN {columna} {tipo} DEFAULT 0')
+    
+    # Valores actuales a partir de los movimientos ya registrados
+    columnas = ', '.join(columna for columna, _, _ in CONTADORES_CAJA)
+    cursor.execute(f'''
+        UPDATE caja SET ({columnas}) = (
+            SELECT {_sql_sumas_caja()}
+            FROM movimientos_caja m
+            WHERE m.caja_id = caja.id
+        )
+    ''')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_caja_movimiento_insert
+        AFTER INSERT ON movimientos_caja BEGIN
+            {_sql_contadores_caja('NEW', '+')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_caja_movimiento_delete
+        AFTER DELETE ON movimientos_caja BEGIN
+            {_sql_contadores_caja('OLD', '-')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_caja_movimiento_update
+        AFTER UPDATE ON movimientos_caja BEGIN
+            {_sql_contadores_caja('OLD', '-')}
+            {_sql_contadores_caja('NEW', '+')}
+        END
+    ''')
+
+
+def _migrar_version_catalogo(cursor):
+    """Versión del catálogo de productos para sincronizar el POS por diferencias
+    
+    Cada alta, cambio o baja de un producto (incluido el stock que descuentan
+    las ventas) incrementa catalogo_version y marca la fila con la versión
+    nueva; las bajas quedan en productos_eliminados.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalogo_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO catalogo_version (id, version) VALUES (1, 1)')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS productos_eliminados (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    
+    cursor.execute('PRAGMA table_info(productos)')
+    if 'version' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute('ALTER TABLE productos ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_version ON productos(version)')
+    
+    incrementar = 'UPDATE catalogo_version SET version = version + 1 WHERE id = 1;'
+    actual = '(SELECT version FROM catalogo_version WHERE id = 1)'
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_catalogo_insert
+        AFTER INSERT ON productos BEGIN
+            {incrementar}
+            UPDATE productos SET version = {actual} WHERE id = NEW.id;
+            DELETE FROM productos_eliminados WHERE id = NEW.id;
+        END
+    ''')
+    # El WHEN evita volver a disparar con el propio UPDATE de la versión
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_catalogo_update
+        AFTER UPDATE ON productos WHEN NEW.version = OLD.version BEGIN
+            {incrementar}
+            UPDATE productos SET version = {actual} WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_catalogo_delete
+        AFTER DELETE ON productos BEGIN
+            {incrementar}
+            INSERT OR REPLACE INTO productos_eliminados (id, version) VALUES (OLD.id, {actual});
+        END
+    ''')
+
+
+def _migrar_busqueda_productos(cursor):
+    """Índice FTS5 sobre nombre, descripción y categoría de productos
+    
+    unicode61 con remove_diacritics ignora acentos ("pacena" encuentra
+    "Paceña") y prefix='2 3' acelera las búsquedas por prefijo mientras se
+    escribe. Es una tabla de contenido externo: los triggers la mantienen al
+    día con productos sin duplicar el texto.
+    """
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+                nombre, descripcion, categoria,
+                content='productos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite compilado sin FTS5: buscar_productos usa LIKE
+        print(f'⚠️ Búsqueda FTS5 no disponible: {e}')
+        return
+    
+    cursor.execute("INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')")
+    
+    insertar = '''INSERT INTO productos_fts (rowid, nombre, descripcion, categoria)
+               VALUES (NEW.id, NEW.nombre, NEW.descripcion, NEW.categoria);'''
+    borrar = '''INSERT INTO productos_fts (productos_fts, rowid, nombre, descripcion, categoria)
+            VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion, OLD.categoria);'''
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_fts_insert
+        AFTER INSERT ON productos BEGIN
+            {insertar}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_fts_delete
+        AFTER DELETE ON productos BEGIN
+            {borrar}
+        END
+    ''')
+    # Solo cuando cambia el texto: los cambios de stock no tocan el índice
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_fts_update
+        AFTER UPDATE OF nombre, descripcion, categoria ON productos BEGIN
+            {borrar}
+            {insertar}
+        END
+    ''')
+
+
+def _migrar_movimientos_stock(cursor):
+    """Libro de movimientos de stock (solo agregar) y fotos diarias de stock
+    
+    Cada venta, compra o ajuste agrega filas a movimientos_stock; stock_diario
+    guarda el stock al cierre de cada día con movimientos, así que el stock a
+    una fecha es una foto más los movimientos posteriores a ella.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS movimientos_stock (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            producto_id INTEGER NOT NULL,
+            fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            cantidad INTEGER NOT NULL,
+            origen TEXT NOT NULL,
+            referencia_id INTEGER,
+            costo_unitario REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_movimientos_stock_fecha ON movimientos_stock(fecha)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_movimientos_stock_producto
+        ON movimientos_stock(producto_id, fecha)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_movimientos_stock_origen
+        ON movimientos_stock(origen, producto_id)
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_diario (
+            fecha DATE NOT NULL,
+            producto_id INTEGER NOT NULL,
+            stock INTEGER NOT NULL,
+            PRIMARY KEY (fecha, producto_id)
+        ) WITHOUT ROWID
+    ''')
+    
+    # El libro no se modifica: las correcciones son movimientos nuevos
+    for operacion in ('UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_movimientos_stock_{operacion.lower()}
+            BEFORE {operacion} ON movimientos_stock BEGIN
+                SELECT RAISE(ABORT, 'movimientos_stock es de solo agregar');
+            END
+        ''')
+    
+    # Punto de partida: el stock actual de cada producto
+    cursor.execute('''
+        INSERT INTO movimientos_stock (producto_id, cantidad, origen, costo_unitario)
+        SELECT id, stock, 'inicial', precio_compra FROM productos WHERE stock != 0
+    ''')
+
+
+def _sql_ventas_producto_diario(fila, signo):
+    """UPSERT que suma (o resta) una línea de detalle a ventas_producto_diario"""
+    return f'''
+        INSERT INTO ventas_producto_diario (fecha, producto_id, cantidad, subtotal)
+        VALUES (
+            COALESCE((SELECT DATE(fecha) FROM ventas WHERE id = {fila}.venta_id), \'\'),
+            {fila}.producto_id, {signo}{fila}.cantidad, {signo}{fila}.subtotal
+        )
+        ON CONFLICT (fecha, producto_id) DO UPDATE SET
+            cantidad = cantidad + excluded.cantidad,
+            subtotal = subtotal + excluded.subtotal;
+    '''
+
+
+def _migrar_ventas_producto_diario(cursor):
+    """Ventas por producto y día, para top de productos y categorías
+    
+    Igual que resumen_diario: una fila por (fecha, producto) que los
+    triggers de detalle_ventas mantienen en la misma transacción que la
+    venta. Un rango de fechas es un recorrido de la clave primaria en lugar
+    de juntar detalle_ventas con ventas.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ventas_producto_diario (
+            fecha TEXT NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            subtotal REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, producto_id)
+        ) WITHOUT ROWID
+    ''')
+    
+    cursor.execute('''
+        INSERT INTO ventas_producto_diario (fecha, producto_id, cantidad, subtotal)
+        SELECT COALESCE(DATE(v.fecha), \'\'), dv.producto_id, SUM(dv.cantidad), SUM(dv.subtotal)
+        FROM detalle_ventas dv
+        LEFT JOIN ventas v ON dv.venta_id = v.id
+        GROUP BY 1, 2
+    ''')
+    # Para rangos largos: agrupar por producto recorriendo el índice, sin ordenar
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ventas_producto_diario_producto
+        ON ventas_producto_diario(producto_id, fecha, cantidad, subtotal)
+    ''')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_producto_insert
+        AFTER INSERT ON detalle_ventas BEGIN
+            {_sql_ventas_producto_diario('NEW', '')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_producto_delete
+        AFTER DELETE ON detalle_ventas BEGIN
+            {_sql_ventas_producto_diario('OLD', '-')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_producto_update
+        AFTER UPDATE OF venta_id, producto_id, cantidad, subtotal ON detalle_ventas BEGIN
+            {_sql_ventas_producto_diario('OLD', '-')}
+            {_sql_ventas_producto_diario('NEW', '')}
+        END
+    ''')
+
+
+def _sql_ventas_producto_de_venta(fecha, venta_id, signo):
+    """UPSERT que suma (o resta) todas las líneas de una venta en la fecha indicada"""
+    return f'''
+        INSERT INTO ventas_producto_diario (fecha, producto_id, cantidad, subtotal)
+        SELECT {fecha}, producto_id, {signo}SUM(cantidad), {signo}SUM(subtotal)
+        FROM detalle_ventas WHERE venta_id = {venta_id}
+        GROUP BY producto_id
+        ON CONFLICT (fecha, producto_id) DO UPDATE SET
+            cantidad = cantidad + excluded.cantidad,
+            subtotal = subtotal + excluded.subtotal;
+    '''
+
+
+def _migrar_fecha_ventas_producto(cursor):
+    """Mover las líneas de ventas_producto_diario cuando cambia la fecha de la venta
+    
+    Los triggers de detalle_ventas no ven los cambios en ventas: si se
+    corrige la fecha de una venta (o se borra y su detalle queda sin venta,
+    con fecha ''), sus líneas quedaban en el día viejo. Se recalcula la
+    tabla por si ya había quedado desfasada.
+    """
+    cursor.execute('DELETE FROM ventas_producto_diario')
+    cursor.execute('''
+        INSERT INTO ventas_producto_diario (fecha, producto_id, cantidad, subtotal)
+        SELECT COALESCE(DATE(v.fecha), \'\'), dv.producto_id, SUM(dv.cantidad), SUM(dv.subtotal)
+        FROM detalle_ventas dv
+        LEFT JOIN ventas v ON dv.venta_id = v.id
+        GROUP BY 1, 2
+    ''')
+    
+    fecha_vieja = "COALESCE(DATE(OLD.fecha), '')"
+    fecha_nueva = "COALESCE(DATE(NEW.fecha), '')"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_producto_fecha
+        AFTER UPDATE OF fecha ON ventas
+        WHEN {fecha_vieja} != {fecha_nueva} BEGIN
+            {_sql_ventas_producto_de_venta(fecha_vieja, 'OLD.id', '-')}
+            {_sql_ventas_producto_de_venta(fecha_nueva, 'NEW.id', '')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_producto_venta_delete
+        AFTER DELETE ON ventas
+        WHEN DATE(OLD.fecha) IS NOT NULL BEGIN
+            {_sql_ventas_producto_de_venta('DATE(OLD.fecha)', 'OLD.id', '-')}
+            {_sql_ventas_producto_de_venta("''", 'OLD.id', '')}
+        END
+    ''')
+
+
+def _sql_ventas_por_hora(fila, signo):
+    """UPSERT que suma (o resta) una venta a su casilla de fecha y hora"""
+    return f'''
+        INSERT INTO ventas_por_hora (fecha, hora, dia_semana, cantidad, total)
+        VALUES (
+            COALESCE(DATE({fila}.fecha), \'\'),
+            COALESCE(CAST(strftime(\'%H\', {fila}.fecha) AS INTEGER), 0),
+            COALESCE(CAST(strftime(\'%w\', {fila}.fecha) AS INTEGER), 0),
+            {signo}1, {signo}COALESCE({fila}.total, 0)
+        )
+        ON CONFLICT (fecha, hora) DO UPDATE SET
+            cantidad = cantidad + excluded.cantidad,
+            total = total + excluded.total;
+    '''
+
+
+def _migrar_ventas_por_hora(cursor):
+    """Ventas por fecha y hora (con el día de la semana) para el mapa de calor
+    
+    Una casilla por hora con ventas, mantenida por triggers sobre ventas.
+    Cualquier rango se resuelve sumando a lo sumo 24 casillas por día en
+    lugar de calcular strftime sobre cada venta.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ventas_por_hora (
+            fecha TEXT NOT NULL,
+            hora INTEGER NOT NULL,
+            dia_semana INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, hora)
+        ) WITHOUT ROWID
+    ''')
+    
+    cursor.execute('''
+        INSERT INTO ventas_por_hora (fecha, hora, dia_semana, cantidad, total)
+        SELECT
+            COALESCE(DATE(fecha), \'\'),
+            COALESCE(CAST(strftime(\'%H\', fecha) AS INTEGER), 0),
+            COALESCE(CAST(strftime(\'%w\', fecha) AS INTEGER), 0),
+            COUNT(*), COALESCE(SUM(total), 0)
+        FROM ventas
+        GROUP BY 1, 2
+    ''')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_hora_insert
+        AFTER INSERT ON ventas BEGIN
+            {_sql_ventas_por_hora('NEW', '')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_hora_delete
+        AFTER DELETE ON ventas BEGIN
+            {_sql_ventas_por_hora('OLD', '-')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_hora_update
+        AFTER UPDATE OF fecha, total ON ventas BEGIN
+            {_sql_ventas_por_hora('OLD', '-')}
+            {_sql_ventas_por_hora('NEW', '')}
+        END
+    ''')
+
+
+MIGRACIONES = [
+    (1, 'Índices para filtros por fecha, estado y relaciones', [
+        'CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas(fecha)',
+        'CREATE INDEX IF NOT EXISTS idx_compras_fecha_tipo ON compras(fecha, tipo)',
+        'CREATE INDEX IF NOT EXISTS idx_movimientos_caja ON movimientos_caja(caja_id, tipo, metodo_pago)',
+        'CREATE INDEX IF NOT EXISTS idx_detalle_ventas_venta ON detalle_ventas(venta_id)',
+        'CREATE INDEX IF NOT EXISTS idx_detalle_ventas_producto ON detalle_ventas(producto_id)',
+        'CREATE INDEX IF NOT EXISTS idx_creditos_estado_cliente ON creditos(estado, cliente_nombre)',
+        'CREATE INDEX IF NOT EXISTS idx_creditos_fecha ON creditos(fecha_credito)',
+        'CREATE INDEX IF NOT EXISTS idx_pagos_creditos_credito ON pagos_creditos(credito_id)',
+        'CREATE INDEX IF NOT EXISTS idx_pagos_creditos_fecha ON pagos_creditos(fecha)',
+        'CREATE INDEX IF NOT EXISTS idx_caja_estado ON caja(estado)',
+    ]),
+    (2, 'Resumen diario de ventas, compras y créditos', [
+        _migrar_resumen_diario,
+    ]),
+    (3, 'Contadores acumulados en la fila de caja', [
+        _migrar_contadores_caja,
+    ]),
+    (4, 'Índice para paginar ventas por método de pago', [
+        'CREATE INDEX IF NOT EXISTS idx_ventas_metodo_fecha ON ventas(metodo_pago, fecha)',
+    ]),
+    (5, 'Versión del catálogo de productos', [
+        _migrar_version_catalogo,
+    ]),
+    (6, 'Índice de búsqueda de productos', [
+        _migrar_busqueda_productos,
+    ]),
+    (7, 'Movimientos de stock y fotos diarias', [
+        _migrar_movimientos_stock,
+    ]),
+    (8, 'Índice de saldos de créditos abiertos para el dashboard', [
+        'CREATE INDEX IF NOT EXISTS idx_creditos_estado_saldo ON creditos(estado, saldo_pendiente)',
+    ]),
+    (9, 'Ventas por producto y día', [
+        _migrar_ventas_producto_diario,
+    ]),
+    (10, 'Ventas por fecha y hora para el mapa de calor', [
+        _migrar_ventas_por_hora,
+    ]),
+    (11, 'Versiones de tablas para invalidar el cache entre procesos', [
+        '''CREATE TABLE IF NOT EXISTS cache_versiones (
+            tabla TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID''',
+    ]),
+    (12, 'Ventas por producto y día al cambiar la fecha de una venta', [
+        _migrar_fecha_ventas_producto,
+    ]),
+]
+
+
+# Filas del mapa de calor: (valor de strftime('%w'), nombre), de lunes a domingo
+DIAS_SEMANA = [(1, 'Lunes'), (2, 'Martes'), (3, 'Miércoles'), (4, 'Jueves'),
+               (5, 'Viernes'), (6, 'Sábado'), (0, 'Domingo')]
+
+# Hasta cuántos días un rango se lee de ventas_producto_diario por fecha
+DIAS_RANGO_CORTO = 60
+
+# Tablas de las que depende obtener_estadisticas_dashboard
+TABLAS_DASHBOARD = ('productos', 'ventas', 'compras', 'creditos', 'caja', 'movimientos_caja')
+
+
+def rango_fechas(fecha_desde=None, fecha_hasta=None):
+    """Convertir un rango de días inclusivo en límites [desde, hasta)
+    
+    Filtrar con "fecha >= ? AND fecha < ?" en lugar de "DATE(fecha) BETWEEN"
+    permite que SQLite use los índices sobre la columna fecha.
+    """
+    desde = fecha_desde[:10] if fecha_desde else None
+    hasta = None
+    if fecha_hasta:
+        dia_siguiente = datetime.strptime(fecha_hasta[:10], '%Y-%m-%d') + timedelta(days=1)
+        hasta = dia_siguiente.strftime('%Y-%m-%d')
+    return desde, hasta
+
+
+def leer_cursor_ventas(texto):
+    """Separar el cursor "fecha|id" de /api/ventas (ValueError si está mal formado)"""
+    fecha, separador, venta_id = texto.rpartition('|')
+    if not separador or not venta_id.isdigit():
+        raise ValueError(f'Cursor inválido: {texto}')
+    datetime.fromisoformat(fecha)
+    return fecha, int(venta_id)
+
+
+def mismo_dia_anio_anterior(fecha):
+    """La misma fecha un año antes (el 29 de febrero pasa al 28)"""
+    try:
+        return fecha.replace(year=fecha.year - 1)
+    except ValueError:
+        return fecha.replace(year=fecha.year - 1, day=28)
+
+
+def ventana_comparacion(desde, hasta, modo='anterior'):
+    """Ventana contra la que comparar [desde, hasta] (fechas 'YYYY-MM-DD' inclusivas)
+    
+    - anterior: los mismos días inmediatamente antes
+    - anio_anterior: las mismas fechas del año anterior
+    """
+    inicio = datetime.strptime(desde[:10], '%Y-%m-%d')
+    fin = datetime.strptime(hasta[:10], '%Y-%m-%d')
+    if modo == 'anio_anterior':
+        inicio, fin = mismo_dia_anio_anterior(inicio), mismo_dia_anio_anterior(fin)
+    elif modo == 'anterior':
+        dias = (fin - inicio).days + 1
+        inicio, fin = inicio - timedelta(days=dias), fin - timedelta(days=dias)
+    else:
+        raise ValueError(f'Modo de comparación desconocido: {modo}')
+    return inicio.strftime('%Y-%m-%d'), fin.strftime('%Y-%m-%d')
+
+
+def unir_rangos_fechas(rangos):
+    """Unir rangos de días inclusivos (desde, hasta) que se tocan o se pisan"""
+    unidos = []
+    for desde, hasta in sorted((date.fromisoformat(d[:10]), date.fromisoformat(h[:10]))
+                               for d, h in rangos):
+        if unidos and desde <= unidos[-1][1] + timedelta(days=1):
+            unidos[-1][1] = max(unidos[-1][1], hasta)
+        else:
+            unidos.append([desde, hasta])
+    return [(desde.isoformat(), hasta.isoformat()) for desde, hasta in unidos]
+
+
+def comparaciones_predeterminadas(hoy):
+    """Hoy vs ayer, esta semana vs la anterior y este mes vs el anterior
+    
+    Cada comparación es (nombre, (desde, hasta), (desde, hasta) anterior).
+    """
+    hoy = hoy.date() if isinstance(hoy, datetime) else hoy
+    ayer = hoy - timedelta(days=1)
+    inicio_semana = hoy - timedelta(days=hoy.weekday())
+    inicio_mes = hoy.replace(day=1)
+    fin_mes_anterior = inicio_mes - timedelta(days=1)
+    
+    return (
+        ('hoy', (hoy.isoformat(), hoy.isoformat()), (ayer.isoformat(), ayer.isoformat())),
+        ('semana', (inicio_semana.isoformat(), hoy.isoformat()),
+         ((inicio_semana - timedelta(days=7)).isoformat(),
+          (inicio_semana - timedelta(days=1)).isoformat())),
+        ('mes', (inicio_mes.isoformat(), hoy.isoformat()),
+         (fin_mes_anterior.replace(day=1).isoformat(), fin_mes_anterior.isoformat())),
+    )
+
+
+class StockInsuficiente(Exception):
+    """Alguna línea dejaría el stock en negativo; fallidos dice cuáles"""
+    
+    def __init__(self, fallidos):
+        self.fallidos = fallidos
+        nombres = ', '.join(f.get('producto_nombre') or f'#{f["producto_id"]}' for f in fallidos)
+        super().__init__(f'Stock insuficiente: {nombres}')
+
+
+class ProductosInexistentes(Exception):
+    """Alguna línea de una compra apunta a un producto que no existe; fallidos dice cuáles"""
+    
+    def __init__(self, fallidos):
+        self.fallidos = fallidos
+        nombres = ', '.join(f.get('producto_nombre') or f'#{f["producto_id"]}' for f in fallidos)
+        super().__init__(f'Productos inexistentes: {nombres}')
+
 
 class Database:
-    def __init__(self, db_path='database/licoreria.db'):
+    def __init__(self, db_path='database/licoreria.db', pool_size=None, pragmas=None,
+                 usar_cache=None, usar_metricas=None):
         self.db_path = db_path
+        self.pragmas = {**PERFIL_PRAGMAS, **(pragmas or {})}
+        
+        # Perfilado de métodos y consultas (DB_METRICAS=0 lo desactiva)
+        if usar_metricas is None:
+            usar_metricas = os.getenv('DB_METRICAS', '1') == '1'
+        self.metricas = usar_metricas
+        
+        # Tamaño del pool de conexiones (0 = una conexión nueva por consulta)
+        if pool_size is None:
+            pool_size = int(os.getenv('DB_POOL_SIZE', 5))
+        
+        # Funciones a llamar con las tablas de cada método @invalida que termina
+        self.observadores_escritura = []
+        
+        self.pool = None
+        if pool_size > 0:
+            self.pool = PoolConexiones(self._nueva_conexion, tamano=pool_size)
+        
+        # Cache de estadísticas (CACHE_ESTADISTICAS=0 lo desactiva). Con varios
+        # workers (WEB_CONCURRENCY > 1) las invalidaciones se comparten por la
+        # tabla cache_versiones; CACHE_COMPARTIDO=0/1 lo fuerza
+        self.cache = None
+        if usar_cache is None:
+            usar_cache = os.getenv('CACHE_ESTADISTICAS', '1') == '1'
+        if usar_cache:
+            compartido = os.getenv('CACHE_COMPARTIDO',
+                                   '1' if int(os.getenv('WEB_CONCURRENCY', 1)) > 1 else '0') == '1'
+            self.cache = CacheResultados(
+                ttl=int(os.getenv('CACHE_TTL', 600)),
+                ttl_hoy=int(os.getenv('CACHE_TTL_HOY', 30)),
+                leer_versiones=self._leer_versiones_cache if compartido else None,
+                publicar_versiones=self._publicar_versiones_cache if compartido else None)
+        
         self.inicializar_base_datos()
     
-    def get_connection(self):
-        """Crear conexión a la base de datos"""
-        conn = sqlite3.connect(self.db_path)
+    def _nueva_conexion(self):
+        """Abrir y configurar una conexión (una sola vez por conexión)"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               factory=ConexionMedida if self.metricas else sqlite3.Connection)
         conn.row_factory = sqlite3.Row
+        
+        for nombre, valor in self.pragmas.items():
+            conn.execute(f'PRAGMA {nombre} = {valor}')
+        
         return conn
     
+    def checkpoint_wal(self, modo='PASSIVE'):
+        """Pasar el WAL al archivo principal sin bloquear a lectores ni escritores"""
+        try:
+            conn = self.get_connection()
+            resultado = conn.execute(f'PRAGMA wal_checkpoint({modo})').fetchone()
+            conn.close()
+            
+            return {
+                'ocupado': resultado[0],
+                'paginas_wal': resultado[1],
+                'paginas_copiadas': resultado[2]
+            }
+        except Exception as e:
+            print(f'❌ Error en checkpoint del WAL: {e}')
+            return None
+    
+    def _leer_versiones_cache(self):
+        """{tabla: versión} de cache_versiones, o None si no se pudo leer"""
+        try:
+            conn = self.get_connection()
+            filas = conn.execute('SELECT tabla, version FROM cache_versiones').fetchall()
+            conn.close()
+            return {tabla: version for tabla, version in filas}
+        except Exception as e:
+            print(f'❌ Error al leer versiones del cache: {e}')
+            return None
+    
+    def _publicar_versiones_cache(self, tablas):
+        """Incrementar la versión de las tablas para que los demás procesos invaliden su cache"""
+        try:
+            conn = self.get_connection()
+            conn.executemany('''
+                INSERT INTO cache_versiones (tabla, version) VALUES (?, 1)
+                ON CONFLICT(tabla) DO UPDATE SET version = version + 1
+            ''', [(tabla,) for tabla in sorted(tablas)])
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f'❌ Error al publicar versiones del cache: {e}')
+    
+    def get_connection(self):
+        """Obtener conexión a la base de datos (del pool si está activo)"""
+        if self.metricas:
+            if self.pool:
+                return medir_conexion(self.pool.obtener, 'pool')
+            return medir_conexion(self._nueva_conexion, 'nueva')
+        if self.pool:
+            return self.pool.obtener()
+        return self._nueva_conexion()
+
+    def _iterar_consulta(self, query, params=(), tamano=500, encabezado=False):
+        """Recorrer el resultado de una consulta por bloques, sin cargarlo entero"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(query, params)
+            if encabezado:
+                yield tuple(col[0] for col in cursor.description)
+            while True:
+                filas = cursor.fetchmany(tamano)
+                if not filas:
+                    break
+                yield from filas
+        finally:
+            conn.close()
+
     def inicializar_base_datos(self):
         """Crear todas las tablas necesarias"""
         conn = self.get_connection()
@@ -160,11 +957,47 @@ class Database:
         ''')
         
         conn.commit()
+        
+        self._aplicar_migraciones(conn)
+        
         conn.close()
         print('✅ Base de datos inicializada correctamente')
     
+    def _aplicar_migraciones(self, conn):
+        """Aplicar las migraciones pendientes según PRAGMA user_version
+        
+        Cada migración toma el lock de escritura (BEGIN IMMEDIATE) y vuelve a
+        leer la versión: si varios workers arrancan a la vez, solo uno la aplica.
+        """
+        cursor = conn.cursor()
+        
+        for version, descripcion, pasos in MIGRACIONES:
+            cursor.execute('PRAGMA user_version')
+            if version <= cursor.fetchone()[0]:
+                continue
+            
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('PRAGMA user_version')
+                if version <= cursor.fetchone()[0]:
+                    conn.rollback()
+                    continue
+                for paso in pasos:
+                    if callable(paso):
+                        paso(cursor)
+                    else:
+                        cursor.execute(paso)
+                cursor.execute(f'PRAGMA user_version = {version}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            
+            print(f'✅ Migración {version} aplicada: {descripcion}')
+    
     # ========== FUNCIONES PARA PRODUCTOS ==========
     
+    @invalida('productos')
     def crear_producto(self, nombre, descripcion, imagen, precio_compra, precio_venta, 
                       unidad, categoria, stock, stock_minimo):
         """Crear un nuevo producto"""
@@ -181,6 +1014,13 @@ class Database:
                   unidad, categoria, stock, stock_minimo))
             
             producto_id = cursor.lastrowid
+            
+            if stock:
+                cursor.execute('''
+                    INSERT INTO movimientos_stock (producto_id, cantidad, origen, costo_unitario)
+                    VALUES (?, ?, 'inicial', ?)
+                ''', (producto_id, stock, precio_compra))
+            
             conn.commit()
             conn.close()
             
@@ -209,6 +1049,85 @@ class Database:
             print(f'❌ Error al obtener productos: {e}')
             return []
     
+    def obtener_version_catalogo(self):
+        """Versión actual del catálogo (cambia con cada alta, cambio o baja de producto)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT version FROM catalogo_version WHERE id = 1')
+            version = cursor.fetchone()['version']
+            
+            conn.close()
+            return version
+        except Exception as e:
+            print(f'❌ Error al obtener versión del catálogo: {e}')
+            return None
+    
+    def obtener_cambios_catalogo(self, desde_version):
+        """Productos modificados y eliminados después de una versión del catálogo"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM productos WHERE version > ? ORDER BY nombre ASC
+            ''', (desde_version,))
+            productos = [dict(row) for row in cursor.fetchall()]
+            
+            cursor.execute('''
+                SELECT id FROM productos_eliminados WHERE version > ?
+            ''', (desde_version,))
+            eliminados = [row['id'] for row in cursor.fetchall()]
+            
+            conn.close()
+            return {'productos': productos, 'eliminados': eliminados}
+        except Exception as e:
+            print(f'❌ Error al obtener cambios del catálogo: {e}')
+            return None
+    
+    def buscar_productos(self, texto, limite=20, solo_con_stock=False):
+        """Buscar productos por prefijo en nombre, descripción o categoría (sin acentos)"""
+        terminos = re.findall(r'\w+', texto or '')
+        if not terminos:
+            return []
+        
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            filtro_stock = ' AND p.stock > 0' if solo_con_stock else ''
+            try:
+                # Cada término como prefijo; el nombre pesa más en el orden
+                consulta = ' '.join(f'"{t}"*' for t in terminos)
+                cursor.execute(f'''
+                    SELECT p.* FROM productos_fts f
+                    JOIN productos p ON p.id = f.rowid
+                    WHERE productos_fts MATCH ?{filtro_stock}
+                    ORDER BY bm25(productos_fts, 10.0, 1.0, 3.0)
+                    LIMIT ?
+                ''', (consulta, limite))
+            except sqlite3.OperationalError:
+                # Sin índice FTS5
+                condiciones = ' AND '.join(
+                    '(p.nombre LIKE ? OR p.descripcion LIKE ? OR p.categoria LIKE ?)' for _ in terminos
+                )
+                params = [f'%{t}%' for t in terminos for _ in range(3)]
+                cursor.execute(f'''
+                    SELECT p.* FROM productos p
+                    WHERE {condiciones}{filtro_stock}
+                    ORDER BY p.nombre ASC
+                    LIMIT ?
+                ''', params + [limite])
+            
+            productos = [dict(row) for row in cursor.fetchall()]
+            
+            conn.close()
+            return productos
+        except Exception as e:
+            print(f'❌ Error al buscar productos: {e}')
+            return []
+    
     def obtener_producto(self, producto_id):
         """Obtener un producto por ID"""
         try:
@@ -227,6 +1146,7 @@ class Database:
             print(f'❌ Error al obtener producto: {e}')
             return None
     
+    @invalida('productos')
     def actualizar_producto(self, id, nombre, descripcion, imagen, precio_compra, 
                           precio_venta, unidad, categoria, stock, stock_minimo):
         """Actualizar un producto existente"""
@@ -234,6 +1154,12 @@ class Database:
             conn = self.get_connection()
             cursor = conn.cursor()
             
+            # Si se editó el stock a mano, la diferencia queda como ajuste
+            cursor.execute('''
+                INSERT INTO movimientos_stock (producto_id, cantidad, origen, costo_unitario)
+                SELECT id, ? - stock, 'ajuste', ? FROM productos WHERE id = ? AND stock != ?
+            ''', (stock, precio_compra, id, stock))
+            
             cursor.execute('''
                 UPDATE productos SET
                     nombre = ?,
@@ -259,12 +1185,17 @@ class Database:
             print(f'❌ Error al actualizar producto: {e}')
             return False
     
+    @invalida('productos')
     def eliminar_producto(self, producto_id):
         """Eliminar un producto"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
+            cursor.execute('''
+                INSERT INTO movimientos_stock (producto_id, cantidad, origen, costo_unitario)
+                SELECT id, -stock, 'baja', precio_compra FROM productos WHERE id = ? AND stock != 0
+            ''', (producto_id,))
             cursor.execute('DELETE FROM productos WHERE id = ?', (producto_id,))
             
             conn.commit()
@@ -276,85 +1207,368 @@ class Database:
             print(f'❌ Error al eliminar producto: {e}')
             return False
     
+    @invalida('productos')
     def actualizar_stock(self, producto_id, cantidad, operacion='sumar'):
-        """Actualizar stock de un producto"""
+        """Actualizar stock de un producto (queda en el libro como ajuste)"""
         try:
+            fallidos = self.aplicar_movimientos_stock([{
+                'producto_id': producto_id,
+                'cantidad': cantidad,
+                'operacion': operacion
+            }])
+            return not fallidos
+        except Exception as e:
+            print(f'❌ Error al actualizar stock: {e}')
+            return False
+    
+    @invalida('productos')
+    def aplicar_movimientos_stock(self, movimientos, validar=False, cursor=None,
+                                  origen='ajuste', referencia_id=None):
+        """Aplicar varios movimientos de stock en una sola sentencia
+        
+        movimientos: dicts con producto_id, cantidad, operacion ('sumar' o
+        'restar', por defecto 'restar') y opcionalmente costo_unitario. Cada
+        línea aplicada se agrega a movimientos_stock con su origen y
+        referencia (venta, compra, ajuste). Con validar=True un producto solo se
+        descuenta si alcanza su stock (stock >= cantidad, sumando las líneas
+        repetidas); el UPDATE lleva esa condición, así que dos terminales no
+        pueden dejarlo en negativo.
+        
+        Con cursor se usa la transacción de quien llama y no se confirma;
+        sin él, se confirma solo si no falló ninguna línea. Devuelve la lista
+        de líneas fallidas (vacía si todo se aplicó).
+        """
+        if not movimientos:
+            return []
+        
+        deltas = []
+        for mov in movimientos:
+            cantidad = mov['cantidad'] if mov.get('operacion') == 'sumar' else -mov['cantidad']
+            deltas.append((mov['producto_id'], cantidad))
+        
+        conn = None
+        if cursor is None:
             conn = self.get_connection()
             cursor = conn.cursor()
-            
-            if operacion == 'sumar':
-                cursor.execute('''
-                    UPDATE productos 
-                    SET stock = stock + ?,
+            # sqlite3 no abre la transacción implícita ante "WITH ... UPDATE":
+            # sin BEGIN explícito el UPDATE se confirmaría solo y el rollback
+            # de un lote con fallidos no lo desharía
+            cursor.execute('BEGIN')
+        
+        try:
+            if sqlite3.sqlite_version_info >= (3, 35, 0):
+                valores = ', '.join(['(?, ?)'] * len(deltas))
+                cursor.execute(f'''
+                    WITH delta (producto_id, cantidad) AS (VALUES {valores})
+                    UPDATE productos
+                    SET stock = stock + d.cantidad,
                         fecha_modificacion = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (cantidad, producto_id))
-            else:  # restar
+                    FROM (
+                        SELECT producto_id, SUM(cantidad) AS cantidad
+                        FROM delta GROUP BY producto_id
+                    ) AS d
+                    WHERE productos.id = d.producto_id
+                    AND (d.cantidad >= 0 OR ? = 0 OR productos.stock + d.cantidad >= 0)
+                    RETURNING productos.id
+                ''', [v for delta in deltas for v in delta] + [int(validar)])
+                aplicados = {row[0] for row in cursor.fetchall()}
+            else:
+                # SQLite sin UPDATE ... FROM / RETURNING: una sentencia por producto
+                totales = {}
+                for producto_id, cantidad in deltas:
+                    totales[producto_id] = totales.get(producto_id, 0) + cantidad
+                aplicados = set()
+                for producto_id, cantidad in totales.items():
+                    cursor.execute('''
+                        UPDATE productos
+                        SET stock = stock + ?,
+                            fecha_modificacion = CURRENT_TIMESTAMP
+                        WHERE id = ? AND (? >= 0 OR ? = 0 OR stock + ? >= 0)
+                    ''', (cantidad, producto_id, cantidad, int(validar), cantidad))
+                    if cursor.rowcount:
+                        aplicados.add(producto_id)
+            
+            # Libro de stock: una fila por línea aplicada
+            cursor.executemany('''
+                INSERT INTO movimientos_stock
+                (producto_id, cantidad, origen, referencia_id, costo_unitario)
+                SELECT id, ?, ?, ?, COALESCE(?, precio_compra) FROM productos WHERE id = ?
+            ''', [(cantidad, origen, referencia_id, mov.get('costo_unitario'), producto_id)
+                  for mov, (producto_id, cantidad) in zip(movimientos, deltas)
+                  if producto_id in aplicados])
+            
+            fallidos = []
+            pendientes = {producto_id for producto_id, _ in deltas} - aplicados
+            if pendientes:
+                # Una sola consulta para informar el stock disponible de los que fallaron
+                marcas = ', '.join(['?'] * len(pendientes))
+                cursor.execute(f'SELECT id, stock FROM productos WHERE id IN ({marcas})',
+                               list(pendientes))
+                disponibles = {row[0]: row[1] for row in cursor.fetchall()}
+                
+                for indice, mov in enumerate(movimientos):
+                    if mov['producto_id'] in pendientes:
+                        fallidos.append({
+                            'indice': indice,
+                            'producto_id': mov['producto_id'],
+                            'producto_nombre': mov.get('producto_nombre'),
+                            'cantidad': mov['cantidad'],
+                            'stock': disponibles.get(mov['producto_id']),
+                            'motivo': ('stock insuficiente' if mov['producto_id'] in disponibles
+                                       else 'producto inexistente')
+                        })
+            
+            if conn is not None:
+                if fallidos:
+                    conn.rollback()
+                else:
+                    conn.commit()
+            return fallidos
+        finally:
+            if conn is not None:
+                conn.close()
+    
+    # ========== INVENTARIO: MOVIMIENTOS Y FOTOS DE STOCK ==========
+    
+    def generar_snapshots_stock(self, hasta=None):
+        """Guardar el stock al cierre de cada día con movimientos (hasta ayer por defecto)
+        
+        Cada foto se arma con la anterior más los movimientos del día, así que
+        solo se leen los movimientos nuevos. Corre con el lock de escritura
+        tomado para que dos workers no generen el mismo día a la vez.
+        """
+        if hasta is None:
+            # movimientos_stock.fecha es CURRENT_TIMESTAMP (UTC): "ayer" también
+            # en UTC, si no la foto se toma antes de que termine ese día
+            hasta = (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d')
+        _, limite = rango_fechas(None, hasta)
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            cursor.execute('SELECT MAX(fecha) FROM stock_diario')
+            previa = cursor.fetchone()[0]
+            desde = rango_fechas(None, previa)[1] if previa else ''
+            
+            cursor.execute('''
+                SELECT DISTINCT DATE(fecha) AS dia FROM movimientos_stock
+                WHERE fecha >= ? AND fecha < ?
+                ORDER BY dia
+            ''', (desde, limite))
+            dias = [row['dia'] for row in cursor.fetchall()]
+            
+            for dia in dias:
+                inicio = rango_fechas(None, previa)[1] if previa else ''
                 cursor.execute('''
-                    UPDATE productos 
-                    SET stock = stock - ?,
-                        fecha_modificacion = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (cantidad, producto_id))
+                    INSERT INTO stock_diario (fecha, producto_id, stock)
+                    SELECT ?, producto_id, SUM(cantidad) FROM (
+                        SELECT producto_id, stock AS cantidad FROM stock_diario WHERE fecha = ?
+                        UNION ALL
+                        SELECT producto_id, cantidad FROM movimientos_stock
+                        WHERE fecha >= ? AND fecha < ?
+                    )
+                    GROUP BY producto_id
+                    HAVING SUM(cantidad) != 0
+                ''', (dia, previa, inicio, rango_fechas(None, dia)[1]))
+                previa = dia
             
             conn.commit()
+            if dias:
+                print(f'✅ Fotos de stock generadas: {len(dias)} día(s) hasta {dias[-1]}')
+            return len(dias)
+        except Exception as e:
+            conn.rollback()
+            print(f'❌ Error al generar fotos de stock: {e}')
+            return None
+        finally:
             conn.close()
-            return True
+    
+    def obtener_stock_en_fecha(self, fecha, producto_id=None, cursor=None):
+        """Stock de cada producto al cierre de un día: la última foto más los movimientos posteriores"""
+        _, limite = rango_fechas(None, fecha)
+        
+        conn = None
+        if cursor is None:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+        
+        try:
+            cursor.execute('SELECT MAX(fecha) FROM stock_diario WHERE fecha < ?', (limite,))
+            foto = cursor.fetchone()[0]
+            desde = rango_fechas(None, foto)[1] if foto else ''
+            
+            filtro = ' AND producto_id = ?' if producto_id else ''
+            params_filtro = [producto_id] if producto_id else []
+            
+            cursor.execute(f'''
+                SELECT producto_id, SUM(cantidad) AS stock FROM (
+                    SELECT producto_id, stock AS cantidad FROM stock_diario
+                    WHERE fecha = ?{filtro}
+                    UNION ALL
+                    SELECT producto_id, cantidad FROM movimientos_stock
+                    WHERE fecha >= ? AND fecha < ?{filtro}
+                )
+                GROUP BY producto_id
+            ''', [foto] + params_filtro + [desde, limite] + params_filtro)
+            
+            return {row['producto_id']: row['stock'] for row in cursor.fetchall()}
+        finally:
+            if conn is not None:
+                conn.close()
+    
+    @cacheado('productos')
+    def obtener_valorizacion_stock(self, fecha=None):
+        """Valorizar el stock a una fecha (hoy por defecto) con el libro de movimientos
+        
+        Cada producto se valoriza al costo de su última compra hasta esa fecha
+        o, si no tiene compras, a su precio de compra actual.
+        """
+        try:
+            fecha = fecha or datetime.now().strftime('%Y-%m-%d')
+            _, limite = rango_fechas(None, fecha)
+            
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            stock = self.obtener_stock_en_fecha(fecha, cursor=cursor)
+            
+            # Último costo de compra por producto (MAX(id) elige la fila más reciente)
+            cursor.execute('''
+                SELECT producto_id, costo_unitario, MAX(id)
+                FROM movimientos_stock
+                WHERE origen = 'compra' AND fecha < ?
+                GROUP BY producto_id
+            ''', (limite,))
+            costos = {row['producto_id']: row['costo_unitario'] for row in cursor.fetchall()}
+            
+            cursor.execute('SELECT id, nombre, categoria, precio_compra FROM productos')
+            productos = {row['id']: row for row in cursor.fetchall()}
+            
+            conn.close()
+            
+            detalle = []
+            for producto_id, cantidad in stock.items():
+                if not cantidad:
+                    continue
+                producto = productos.get(producto_id)
+                costo = costos.get(producto_id)
+                if costo is None:
+                    costo = producto['precio_compra'] if producto else 0
+                detalle.append({
+                    'producto_id': producto_id,
+                    'nombre': producto['nombre'] if producto else f'Producto #{producto_id}',
+                    'categoria': producto['categoria'] if producto else None,
+                    'stock': cantidad,
+                    'costo_unitario': costo,
+                    'valor': cantidad * costo
+                })
+            
+            detalle.sort(key=lambda d: d['valor'], reverse=True)
+            
+            return {
+                'fecha': fecha,
+                'productos': detalle,
+                'total_unidades': sum(d['stock'] for d in detalle),
+                'total_valor': sum(d['valor'] for d in detalle)
+            }
         except Exception as e:
-            print(f'❌ Error al actualizar stock: {e}')
-            return False
+            print(f'❌ Error al valorizar stock: {e}')
+            return None
     
-    def exportar_productos_excel(self, productos):
-        """Exportar productos a Excel"""
+    def obtener_movimientos_stock(self, producto_id, fecha_desde=None, fecha_hasta=None, limite=200):
+        """Movimientos de stock de un producto (más recientes primero)"""
         try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, Alignment, PatternFill
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            query = 'SELECT * FROM movimientos_stock WHERE producto_id = ?'
+            params = [producto_id]
+            fecha_desde, fecha_hasta = rango_fechas(fecha_desde, fecha_hasta)
             
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Productos"
+            if fecha_desde:
+                query += ' AND fecha >= ?'
+                params.append(fecha_desde)
+            
+            if fecha_hasta:
+                query += ' AND fecha < ?'
+                params.append(fecha_hasta)
+            
+            query += ' ORDER BY fecha DESC, id DESC LIMIT ?'
+            params.append(limite)
+            
+            cursor.execute(query, params)
+            movimientos = [dict(row) for row in cursor.fetchall()]
+            
+            conn.close()
+            return movimientos
+        except Exception as e:
+            print(f'❌ Error al obtener movimientos de stock: {e}')
+            return []
+    
+    @invalida('productos')
+    def verificar_stock(self, corregir=False):
+        """Comparar el stock de cada producto con la suma de su libro de movimientos"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT p.id, p.nombre, p.stock, p.precio_compra,
+                   COALESCE(SUM(m.cantidad), 0) AS libro
+            FROM productos p
+            LEFT JOIN movimientos_stock m ON m.producto_id = p.id
+            GROUP BY p.id
+            HAVING p.stock != libro
+        ''')
+        diferencias = [dict(row) for row in cursor.fetchall()]
+        
+        if diferencias and corregir:
+            # El stock del producto manda: la diferencia se registra como ajuste
+            cursor.executemany('''
+                INSERT INTO movimientos_stock (producto_id, cantidad, origen, costo_unitario)
+                VALUES (?, ?, 'ajuste', ?)
+            ''', [(d['id'], d['stock'] - d['libro'], d['precio_compra']) for d in diferencias])
+            conn.commit()
+            print(f'⚠️ Libro de stock corregido para {len(diferencias)} producto(s)')
+        
+        conn.close()
+        
+        return {
+            'correcto': not diferencias,
+            'diferencias': [{
+                'producto_id': d['id'],
+                'nombre': d['nombre'],
+                'stock': d['stock'],
+                'libro': d['libro']
+            } for d in diferencias],
+            'corregido': bool(diferencias) and corregir
+        }
+    
+    def exportar_productos_excel(self, destino=None, progreso=None):
+        """Exportar productos a Excel"""
+        try:
+            from utils.exportador import ExportadorExcel
             
             headers = ['ID', 'Nombre', 'Descripción', 'Categoría', 'Unidad', 
                       'Precio Compra', 'Precio Venta', 'Stock', 'Stock Mínimo', 
                       'Fecha Creación']
             
-            header_fill = PatternFill(start_color="0066CC", end_color="0066CC", fill_type="solid")
-            header_font = Font(color="FFFFFF", bold=True)
+            filas = self._iterar_consulta('''
+                SELECT id, nombre, descripcion, categoria, unidad, precio_compra,
+                       precio_venta, stock, stock_minimo, fecha_creacion
+                FROM productos ORDER BY nombre ASC
+            ''')
             
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col, value=header)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-            
-            for row_idx, producto in enumerate(productos, 2):
-                ws.cell(row=row_idx, column=1, value=producto['id'])
-                ws.cell(row=row_idx, column=2, value=producto['nombre'])
-                ws.cell(row=row_idx, column=3, value=producto.get('descripcion', ''))
-                ws.cell(row=row_idx, column=4, value=producto['categoria'])
-                ws.cell(row=row_idx, column=5, value=producto['unidad'])
-                ws.cell(row=row_idx, column=6, value=producto['precio_compra'])
-                ws.cell(row=row_idx, column=7, value=producto['precio_venta'])
-                ws.cell(row=row_idx, column=8, value=producto['stock'])
-                ws.cell(row=row_idx, column=9, value=producto['stock_minimo'])
-                ws.cell(row=row_idx, column=10, value=producto['fecha_creacion'])
-                
-                if producto['stock'] <= producto['stock_minimo']:
-                    for col in range(1, 11):
-                        ws.cell(row=row_idx, column=col).fill = PatternFill(
-                            start_color="FFF3CD", end_color="FFF3CD", fill_type="solid"
-                        )
-            
-            column_widths = [8, 30, 40, 15, 12, 15, 15, 10, 15, 20]
-            for col, width in enumerate(column_widths, 1):
-                ws.column_dimensions[chr(64 + col)].width = width
-            
-            os.makedirs('exports', exist_ok=True)
-            filepath = f'exports/productos_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            wb.save(filepath)
-            
-            print(f'✅ Archivo Excel generado: {filepath}')
-            return filepath
+            exportador = ExportadorExcel(progreso=progreso)
+            exportador.agregar_hoja(
+                "Productos", headers, (tuple(row) for row in filas),
+                color="0066CC", centrar=True,
+                anchos=[8, 30, 40, 15, 12, 15, 15, 10, 15, 20],
+                # Stock bajo resaltado en amarillo
+                resaltar=lambda fila: "FFF3CD" if fila[7] <= fila[8] else None
+            )
+            return exportador.guardar(destino)
         except Exception as e:
             print(f'❌ Error al exportar a Excel: {e}')
             return None
@@ -374,6 +1588,7 @@ class Database:
 
     # ========== FUNCIONES PARA VENTAS ==========
 
+    @invalida('ventas', 'movimientos_caja')
     def crear_venta(self, total, metodo_pago, monto_efectivo=0, monto_qr=0, 
                     cliente_nombre=None, cliente_telefono=None):
         """Crear una nueva venta Y registrar en caja"""
@@ -398,76 +1613,8 @@ class Database:
             venta_id = cursor.lastrowid
             
             # IMPORTANTE: Registrar en caja (excepto crédito)
-            if metodo_pago != 'credito':
-                cursor.execute('SELECT id FROM caja WHERE estado = "abierta"')
-                caja_abierta = cursor.fetchone()
-                
-                if caja_abierta:
-                    # Para ventas EFECTIVO
-                    if metodo_pago == 'efectivo':
-                        cursor.execute('''
-                            INSERT INTO movimientos_caja 
-                            (caja_id, tipo, concepto, monto, metodo_pago, referencia_id, referencia_tipo)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            caja_abierta['id'],
-                            'ingreso',
-                            f"Venta #{venta_id}",
-                            float(total),
-                            'efectivo',
-                            venta_id,
-                            'venta'
-                        ))
-                    
-                    # Para ventas QR
-                    elif metodo_pago == 'qr':
-                        cursor.execute('''
-                            INSERT INTO movimientos_caja 
-                            (caja_id, tipo, concepto, monto, metodo_pago, referencia_id, referencia_tipo)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            caja_abierta['id'],
-                            'ingreso',
-                            f"Venta #{venta_id}",
-                            float(total),
-                            'qr',
-                            venta_id,
-                            'venta'
-                        ))
-                    
-                    # Para ventas MIXTAS
-                    elif metodo_pago == 'mixto':
-                        # Registrar parte efectivo
-                        if float(monto_efectivo) > 0:
-                            cursor.execute('''
-                                INSERT INTO movimientos_caja 
-                                (caja_id, tipo, concepto, monto, metodo_pago, referencia_id, referencia_tipo)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', (
-                                caja_abierta['id'],
-                                'ingreso',
-                                f"Venta #{venta_id} - Efectivo",
-                                float(monto_efectivo),
-                                'efectivo',
-                                venta_id,
-                                'venta'
-                            ))
-                        
-                        # Registrar parte QR
-                        if float(monto_qr) > 0:
-                            cursor.execute('''
-                                INSERT INTO movimientos_caja 
-                                (caja_id, tipo, concepto, monto, metodo_pago, referencia_id, referencia_tipo)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', (
-                                caja_abierta['id'],
-                                'ingreso',
-                                f"Venta #{venta_id} - QR",
-                                float(monto_qr),
-                                'qr',
-                                venta_id,
-                                'venta'
-                            ))
+            self._registrar_venta_en_caja(cursor, venta_id, total, metodo_pago,
+                                          monto_efectivo, monto_qr)
             
             conn.commit()
             conn.close()
@@ -479,9 +1626,114 @@ class Database:
             print(f'❌ Error al crear venta: {e}')
             return None
 
+    def _registrar_venta_en_caja(self, cursor, venta_id, total, metodo_pago,
+                                 monto_efectivo=0, monto_qr=0):
+        """Registrar los ingresos de una venta en la caja abierta (excepto crédito)"""
+        if metodo_pago == 'credito':
+            return
+        
+        cursor.execute('SELECT id FROM caja WHERE estado = "abierta"')
+        caja_abierta = cursor.fetchone()
+        
+        if not caja_abierta:
+            return
+        
+        # Ventas EFECTIVO o QR: un solo movimiento; MIXTAS: uno por cada parte
+        if metodo_pago in ('efectivo', 'qr'):
+            movimientos = [(f"Venta #{venta_id}", float(total), metodo_pago)]
+        elif metodo_pago == 'mixto':
+            movimientos = []
+            if float(monto_efectivo) > 0:
+                movimientos.append((f"Venta #{venta_id} - Efectivo", float(monto_efectivo), 'efectivo'))
+            if float(monto_qr) > 0:
+                movimientos.append((f"Venta #{venta_id} - QR", float(monto_qr), 'qr'))
+        else:
+            movimientos = []
+        
+        cursor.executemany('''
+            INSERT INTO movimientos_caja 
+            (caja_id, tipo, concepto, monto, metodo_pago, referencia_id, referencia_tipo)
+            VALUES (?, 'ingreso', ?, ?, ?, ?, 'venta')
+        ''', [(caja_abierta['id'], concepto, monto, metodo, venta_id)
+              for concepto, monto, metodo in movimientos])
+    
+    @invalida('ventas', 'detalle_ventas', 'productos', 'movimientos_caja', 'creditos')
+    def registrar_venta_completa(self, total, metodo_pago, items, monto_efectivo=0,
+                                 monto_qr=0, cliente_nombre=None, cliente_telefono=None,
+                                 validar_stock=True):
+        """Registrar venta, detalle, stock, caja y crédito en una sola transacción
+        
+        Si validar_stock y algún producto no alcanza, no se registra nada y se
+        lanza StockInsuficiente con las líneas que fallaron.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # Insertar venta
+            cursor.execute('''
+                INSERT INTO ventas 
+                (total, metodo_pago, monto_efectivo, monto_qr, cliente_nombre, cliente_telefono)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                float(total),
+                metodo_pago,
+                float(monto_efectivo),
+                float(monto_qr),
+                cliente_nombre,
+                cliente_telefono
+            ))
+            
+            venta_id = cursor.lastrowid
+            
+            # Detalle de venta (todas las líneas de una vez)
+            cursor.executemany('''
+                INSERT INTO detalle_ventas (
+                    venta_id, producto_id, producto_nombre,
+                    cantidad, precio_unitario, subtotal
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(venta_id, item['producto_id'], item['producto_nombre'],
+                   item['cantidad'], item['precio_unitario'], item['subtotal'])
+                  for item in items])
+            
+            # Descontar stock (todas las líneas en una sentencia)
+            fallidos = self.aplicar_movimientos_stock(items, validar=validar_stock, cursor=cursor,
+                                                      origen='venta', referencia_id=venta_id)
+            if fallidos:
+                raise StockInsuficiente(fallidos)
+            
+            # Movimientos de caja
+            self._registrar_venta_en_caja(cursor, venta_id, total, metodo_pago,
+                                          monto_efectivo, monto_qr)
+            
+            # Si es venta a crédito, crear registro de crédito
+            if metodo_pago == 'credito':
+                cursor.execute('''
+                    INSERT INTO creditos 
+                    (venta_id, cliente_nombre, cliente_telefono, monto_total, saldo_pendiente)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (venta_id, cliente_nombre, cliente_telefono, total, total))
+            
+            conn.commit()
+            
+            print(f'✅ Venta creada: #{venta_id} - Bs. {total} ({len(items)} items)')
+            return venta_id
+            
+        except StockInsuficiente as e:
+            conn.rollback()
+            print(f'⚠️ Venta rechazada: {e}')
+            raise
+        except Exception as e:
+            conn.rollback()
+            print(f'❌ Error al registrar venta: {e}')
+            return None
+        finally:
+            conn.close()
+
     # RESTO DE LAS FUNCIONES CONTINÚAN AQUÍ...
     
     
+    @invalida('detalle_ventas')
     def crear_detalle_venta(self, venta_id, producto_id, producto_nombre, 
                            cantidad, precio_unitario, subtotal):
         """Crear detalle de una venta"""
@@ -504,13 +1756,46 @@ class Database:
             print(f'❌ Error al crear detalle de venta: {e}')
             return False
     
-    def obtener_ventas(self):
-        """Obtener todas las ventas"""
+    def obtener_ventas(self, limite=None, despues_de=None, fecha_desde=None,
+                       fecha_hasta=None, metodo_pago=None):
+        """Obtener ventas (más recientes primero) con paginación por cursor
+        
+        despues_de es el cursor (fecha, id) de la última venta de la página
+        anterior (ver leer_cursor_ventas): la consulta sigue desde ahí por el
+        índice de fecha, así que cada página cuesta lo mismo sin importar
+        cuántas ventas haya.
+        """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            cursor.execute('SELECT * FROM ventas ORDER BY fecha DESC')
+            query = 'SELECT * FROM ventas WHERE 1=1'
+            params = []
+            fecha_desde, fecha_hasta = rango_fechas(fecha_desde, fecha_hasta)
+            
+            if fecha_desde:
+                query += ' AND fecha >= ?'
+                params.append(fecha_desde)
+            
+            if fecha_hasta:
+                query += ' AND fecha < ?'
+                params.append(fecha_hasta)
+            
+            if metodo_pago:
+                query += ' AND metodo_pago = ?'
+                params.append(metodo_pago)
+            
+            if despues_de:
+                query += ' AND (fecha, id) < (?, ?)'
+                params.extend(despues_de)
+            
+            query += ' ORDER BY fecha DESC, id DESC'
+            
+            if limite:
+                query += ' LIMIT ?'
+                params.append(limite)
+            
+            cursor.execute(query, params)
             rows = cursor.fetchall()
             
             ventas = []
@@ -568,9 +1853,9 @@ class Database:
             
             cursor.execute('''
                 SELECT * FROM ventas 
-                WHERE DATE(fecha) BETWEEN ? AND ?
+                WHERE fecha >= ? AND fecha < ?
                 ORDER BY fecha DESC
-            ''', (fecha_desde, fecha_hasta))
+            ''', rango_fechas(fecha_desde, fecha_hasta))
             
             rows = cursor.fetchall()
             
@@ -584,66 +1869,55 @@ class Database:
             print(f'❌ Error al obtener ventas por fecha: {e}')
             return []
     
-    def exportar_ventas_excel(self, ventas, fecha_desde, fecha_hasta):
+    def exportar_ventas_excel(self, fecha_desde, fecha_hasta, destino=None, progreso=None):
         """Exportar ventas a Excel"""
         try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, Alignment, PatternFill
-            
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Ventas"
+            from utils.exportador import ExportadorExcel
             
             headers = ['ID', 'Fecha', 'Hora', 'Método de Pago', 'Cliente', 
                       'Teléfono', 'Efectivo', 'QR', 'Total', 'Estado']
             
-            header_fill = PatternFill(start_color="28A745", end_color="28A745", fill_type="solid")
-            header_font = Font(color="FFFFFF", bold=True)
-            
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col, value=header)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal="center", vertical="center")
+            ventas = self._iterar_consulta('''
+                SELECT * FROM ventas 
+                WHERE fecha >= ? AND fecha < ?
+                ORDER BY fecha DESC
+            ''', rango_fechas(fecha_desde, fecha_hasta))
             
             total_general = 0
-            for row_idx, venta in enumerate(ventas, 2):
-                fecha_obj = datetime.fromisoformat(venta['fecha'].replace('Z', '+00:00'))
-                
-                ws.cell(row=row_idx, column=1, value=venta['id'])
-                ws.cell(row=row_idx, column=2, value=fecha_obj.strftime('%Y-%m-%d'))
-                ws.cell(row=row_idx, column=3, value=fecha_obj.strftime('%H:%M:%S'))
-                ws.cell(row=row_idx, column=4, value=venta['metodo_pago'].upper())
-                ws.cell(row=row_idx, column=5, value=venta.get('cliente_nombre', '-'))
-                ws.cell(row=row_idx, column=6, value=venta.get('cliente_telefono', '-'))
-                ws.cell(row=row_idx, column=7, value=venta['monto_efectivo'])
-                ws.cell(row=row_idx, column=8, value=venta['monto_qr'])
-                ws.cell(row=row_idx, column=9, value=venta['total'])
-                ws.cell(row=row_idx, column=10, value=venta['estado'].upper())
-                
-                total_general += venta['total']
-            
-            # Fila de totales
-            row_total = len(ventas) + 2
-            ws.cell(row=row_total, column=8, value="TOTAL:").font = Font(bold=True)
-            ws.cell(row=row_total, column=9, value=total_general).font = Font(bold=True)
-            
-            column_widths = [8, 12, 10, 15, 25, 15, 12, 12, 12, 12]
-            for col, width in enumerate(column_widths, 1):
-                ws.column_dimensions[chr(64 + col)].width = width
             
-            os.makedirs('exports', exist_ok=True)
-            filepath = f'exports/ventas_{fecha_desde}_{fecha_hasta}.xlsx'
-            wb.save(filepath)
-            
-            print(f'✅ Archivo Excel de ventas generado: {filepath}')
-            return filepath
+            def filas():
+                nonlocal total_general
+                for venta in ventas:
+                    fecha_obj = datetime.fromisoformat(venta['fecha'].replace('Z', '+00:00'))
+                    total_general += venta['total']
+                    yield [
+                        venta['id'],
+                        fecha_obj.strftime('%Y-%m-%d'),
+                        fecha_obj.strftime('%H:%M:%S'),
+                        venta['metodo_pago'].upper(),
+                        venta['cliente_nombre'],
+                        venta['cliente_telefono'],
+                        venta['monto_efectivo'],
+                        venta['monto_qr'],
+                        venta['total'],
+                        venta['estado'].upper()
+                    ]
+            
+            exportador = ExportadorExcel(progreso=progreso)
+            exportador.agregar_hoja(
+                "Ventas", headers, filas(), color="28A745", centrar=True,
+                anchos=[8, 12, 10, 15, 25, 15, 12, 12, 12, 12],
+                # Fila de totales, una vez recorridas todas las ventas
+                pie=lambda: [[None] * 7 + ["TOTAL:", total_general]]
+            )
+            return exportador.guardar(destino)
         except Exception as e:
             print(f'❌ Error al exportar ventas a Excel: {e}')
             return None
     
     # ========== FUNCIONES PARA CRÉDITOS ==========
     
+    @invalida('creditos')
     def crear_credito(self, venta_id, cliente_nombre, cliente_telefono, monto_total):
         """Crear un crédito"""
         try:
@@ -674,6 +1948,29 @@ class Database:
 # ELIMINA AMBAS versiones y REEMPLAZA con este código:
 # ============================================
 
+    def _registrar_compra_en_caja(self, cursor, compra_id, tipo, monto, metodo_pago, descripcion=None):
+        """Registrar una compra como EGRESO de la caja abierta (las compras salen dinero)"""
+        cursor.execute('SELECT id FROM caja WHERE estado = "abierta"')
+        caja_abierta = cursor.fetchone()
+        
+        if not caja_abierta:
+            return
+        
+        # Determinar concepto según el tipo
+        if tipo == 'productos':
+            concepto = f"Compra de productos #{compra_id}"
+        elif tipo == 'insumos':
+            concepto = f"Compra de insumos #{compra_id}"
+        else:  # gastos
+            concepto = f"Gasto: {descripcion}" if descripcion else f"Gasto #{compra_id}"
+        
+        cursor.execute('''
+            INSERT INTO movimientos_caja 
+            (caja_id, tipo, concepto, monto, metodo_pago, referencia_id, referencia_tipo)
+            VALUES (?, 'egreso', ?, ?, ?, ?, 'compra')
+        ''', (caja_abierta['id'], concepto, float(monto), metodo_pago, compra_id))
+    
+    @invalida('compras', 'movimientos_caja')
     def crear_compra(self, tipo, monto, proveedor, metodo_pago, descripcion=None, fecha=None, observaciones=None):
         """Crear una nueva compra Y registrar en caja"""
         try:
@@ -686,119 +1983,68 @@ class Database:
             # Insertar compra
             cursor.execute('''
                 INSERT INTO compras (tipo, descripcion, monto, proveedor, metodo_pago, fecha)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (tipo, descripcion, monto, proveedor, metodo_pago, fecha))
-        
-            compra_id = cursor.lastrowid
-            
-            # IMPORTANTE: Registrar en caja como EGRESO (las compras salen dinero)
-            cursor.execute('SELECT id FROM caja WHERE estado = "abierta"')
-            caja_abierta = cursor.fetchone()
-            
-            if caja_abierta:
-                # Determinar concepto según el tipo
-                if tipo == 'productos':
-                    concepto = f"Compra de productos #{compra_id}"
-                elif tipo == 'insumos':
-                    concepto = f"Compra de insumos #{compra_id}"
-                else:  # gastos
-                    concepto = f"Gasto: {descripcion}" if descripcion else f"Gasto #{compra_id}"
-                
-                # Registrar movimiento de EGRESO en caja
-                cursor.execute('''
-                    INSERT INTO movimientos_caja 
-                    (caja_id, tipo, concepto, monto, metodo_pago, referencia_id, referencia_tipo)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    caja_abierta['id'],
-                    'egreso',  # Las compras son EGRESOS (sale dinero)
-                    concepto,
-                    float(monto),
-                    metodo_pago,
-                    compra_id,
-                    'compra'
-                ))
-            
-            conn.commit()
-            conn.close()
-            
-            print(f'✅ Compra creada: #{compra_id} - {tipo} - Bs. {monto}')
-            return compra_id
-            
-        except Exception as e:
-            print(f"❌ Error al crear compra: {e}")
-            return None
-
-    def crear_detalle_compra(self, compra_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal):
-        """Crear detalle de compra (para compra de productos)"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-        
-            cursor.execute('''
-                INSERT INTO detalle_compras 
-                (compra_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (compra_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal))
-        
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"Error al crear detalle de compra: {e}")
-            return False
-
-    def obtener_compras(self, tipo=None, desde=None, hasta=None, buscar=None, limite=100):
-        """Obtener compras con filtros opcionales"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-        
-            query = "SELECT * FROM compras WHERE 1=1"
-            params = []
-        
-            if tipo:
-                query += " AND tipo = ?"
-                params.append(tipo)
-        
-            if desde:
-                query += " AND DATE(fecha) >= ?"
-                params.append(desde)
-        
-            if hasta:
-                query += " AND DATE(fecha) <= ?"
-                params.append(hasta)
-        
-            if buscar:
-                query += " AND (proveedor LIKE ? OR descripcion LIKE ?)"
-                params.append(f'%{buscar}%')
-                params.append(f'%{buscar}%')
-        
-            query += " ORDER BY fecha DESC LIMIT ?"
-            params.append(limite)
-        
-            cursor.execute(query, params)
-            compras = []
-        
-            for row in cursor.fetchall():
-                compras.append({
-                    'id': row['id'],
-                    'tipo': row['tipo'],
-                    'descripcion': row['descripcion'],
-                    'monto': row['monto'],
-                    'proveedor': row['proveedor'],
-                    'metodo_pago': row['metodo_pago'],
-                    'fecha': row['fecha']
-                })
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (tipo, descripcion, monto, proveedor, metodo_pago, fecha))
         
+            compra_id = cursor.lastrowid
+            
+            self._registrar_compra_en_caja(cursor, compra_id, tipo, monto, metodo_pago, descripcion)
+            
+            conn.commit()
             conn.close()
-            return compras
+            
+            print(f'✅ Compra creada: #{compra_id} - {tipo} - Bs. {monto}')
+            return compra_id
+            
         except Exception as e:
-            print(f"Error al obtener compras: {e}")
-            return []
+            print(f"❌ Error al crear compra: {e}")
+            return None
 
-    
+    @invalida('compras', 'detalle_compras', 'productos', 'movimientos_caja')
+    def registrar_compra_completa(self, tipo, monto, proveedor, metodo_pago, items=None,
+                                  descripcion=None, fecha=None, observaciones=None):
+        """Registrar compra, egreso de caja, detalle y stock en una sola transacción
+        
+        Si alguna línea apunta a un producto inexistente no se registra nada y
+        se lanza ProductosInexistentes con las líneas que fallaron.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            
+            if fecha is None:
+                fecha = datetime.now()
+            
+            cursor.execute('''
+                INSERT INTO compras (tipo, descripcion, monto, proveedor, metodo_pago, fecha)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (tipo, descripcion, monto, proveedor, metodo_pago, fecha))
+            
+            compra_id = cursor.lastrowid
+            
+            self._registrar_compra_en_caja(cursor, compra_id, tipo, monto, metodo_pago, descripcion)
+            
+            # Compra de productos: detalle y stock con la misma transacción
+            if tipo == 'productos' and items:
+                self._registrar_detalle_compra(cursor, compra_id, items)
+            
+            conn.commit()
+            
+            print(f'✅ Compra creada: #{compra_id} - {tipo} - Bs. {monto} ({len(items or [])} items)')
+            return compra_id
+            
+        except ProductosInexistentes as e:
+            conn.rollback()
+            print(f'⚠️ Compra rechazada: {e}')
+            raise
+        except Exception as e:
+            conn.rollback()
+            print(f'❌ Error al crear compra: {e}')
+            return None
+        finally:
+            conn.close()
 
+    @invalida('detalle_compras')
     def crear_detalle_compra(self, compra_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal):
         """Crear detalle de compra (para compra de productos)"""
         try:
@@ -818,33 +2064,60 @@ class Database:
             print(f"Error al crear detalle de compra: {e}")
             return False
 
+    def _registrar_detalle_compra(self, cursor, compra_id, items):
+        """Crear el detalle de una compra de productos y sumar su stock con la transacción de quien llama
+        
+        Lanza ProductosInexistentes si alguna línea no se pudo aplicar; quien
+        llama hace el rollback.
+        """
+        cursor.executemany('''
+            INSERT INTO detalle_compras 
+            (compra_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(compra_id, item['producto_id'], item['producto_nombre'], item['cantidad'],
+               item['precio_unitario'], item['subtotal']) for item in items])
+        
+        fallidos = self.aplicar_movimientos_stock(
+            [dict(item, operacion='sumar', costo_unitario=item['precio_unitario']) for item in items],
+            cursor=cursor, origen='compra', referencia_id=compra_id
+        )
+        if fallidos:
+            raise ProductosInexistentes(fallidos)
+
+    def _consulta_compras(self, tipo=None, desde=None, hasta=None, buscar=None):
+        """Armar la consulta de compras con filtros opcionales"""
+        query = "SELECT * FROM compras WHERE 1=1"
+        params = []
+        desde, hasta = rango_fechas(desde, hasta)
+    
+        if tipo:
+            query += " AND tipo = ?"
+            params.append(tipo)
+    
+        if desde:
+            query += " AND fecha >= ?"
+            params.append(desde)
+    
+        if hasta:
+            query += " AND fecha < ?"
+            params.append(hasta)
+    
+        if buscar:
+            query += " AND (proveedor LIKE ? OR descripcion LIKE ?)"
+            params.append(f'%{buscar}%')
+            params.append(f'%{buscar}%')
+    
+        query += " ORDER BY fecha DESC"
+        return query, params
+
     def obtener_compras(self, tipo=None, desde=None, hasta=None, buscar=None, limite=100):
         """Obtener compras con filtros opcionales"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
         
-            query = "SELECT * FROM compras WHERE 1=1"
-            params = []
-        
-            if tipo:
-                query += " AND tipo = ?"
-                params.append(tipo)
-        
-            if desde:
-                query += " AND DATE(fecha) >= ?"
-                params.append(desde)
-        
-            if hasta:
-                query += " AND DATE(fecha) <= ?"
-                params.append(hasta)
-        
-            if buscar:
-                query += " AND (proveedor LIKE ? OR descripcion LIKE ?)"
-                params.append(f'%{buscar}%')
-                params.append(f'%{buscar}%')
-        
-            query += " ORDER BY fecha DESC LIMIT ?"
+            query, params = self._consulta_compras(tipo, desde, hasta, buscar)
+            query += " LIMIT ?"
             params.append(limite)
         
             cursor.execute(query, params)
@@ -867,6 +2140,8 @@ class Database:
             print(f"Error al obtener compras: {e}")
             return []
 
+    
+
     def obtener_compra(self, compra_id):
         """Obtener una compra específica por ID"""
         try:
@@ -924,6 +2199,7 @@ class Database:
             print(f"Error al obtener detalle de compra: {e}")
             return []
 
+    @invalida('compras')
     def actualizar_compra(self, id, tipo, monto, proveedor, metodo_pago, descripcion=None, observaciones=None):
         """Actualizar una compra existente"""
         try:
@@ -943,6 +2219,7 @@ class Database:
             print(f"Error al actualizar compra: {e}")
             return False
 
+    @invalida('compras', 'detalle_compras')
     def eliminar_compra(self, compra_id):
         """Eliminar una compra y sus detalles"""
         try:
@@ -962,17 +2239,21 @@ class Database:
             print(f"Error al eliminar compra: {e}")
             return False
 
+    @cacheado('compras')
     def obtener_estadisticas_compras(self, desde=None, hasta=None):
         """Obtener estadísticas de compras"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
         
+            desde, hasta = rango_fechas(desde, hasta)
+        
             # Total hoy
             cursor.execute('''
                 SELECT COALESCE(SUM(monto), 0) as total 
                 FROM compras 
-                WHERE DATE(fecha) = DATE('now', 'localtime')
+                WHERE fecha >= DATE('now', 'localtime')
+                AND fecha < DATE('now', 'localtime', '+1 day')
             ''')
             total_hoy = cursor.fetchone()['total']
         
@@ -980,7 +2261,8 @@ class Database:
             cursor.execute('''
                 SELECT COALESCE(SUM(monto), 0) as total 
                 FROM compras 
-                WHERE strftime('%Y-%m', fecha) = strftime('%Y-%m', 'now', 'localtime')
+                WHERE fecha >= DATE('now', 'localtime', 'start of month')
+                AND fecha < DATE('now', 'localtime', 'start of month', '+1 month')
             ''')
             total_mes = cursor.fetchone()['total']
         
@@ -989,11 +2271,11 @@ class Database:
             params_gastos = []
         
             if desde:
-                query_gastos += " AND DATE(fecha) >= ?"
+                query_gastos += " AND fecha >= ?"
                 params_gastos.append(desde)
         
             if hasta:
-                query_gastos += " AND DATE(fecha) <= ?"
+                query_gastos += " AND fecha < ?"
                 params_gastos.append(hasta)
         
             cursor.execute(query_gastos, params_gastos)
@@ -1004,11 +2286,11 @@ class Database:
             params_general = []
         
             if desde:
-                query_general += " AND DATE(fecha) >= ?"
+                query_general += " AND fecha >= ?"
                 params_general.append(desde)
         
             if hasta:
-                query_general += " AND DATE(fecha) <= ?"
+                query_general += " AND fecha < ?"
                 params_general.append(hasta)
         
             cursor.execute(query_general, params_general)
@@ -1031,73 +2313,50 @@ class Database:
                 'totalGeneral': 0
             }
 
-    def exportar_compras_excel(self, compras, fecha_desde=None, fecha_hasta=None):
+    def exportar_compras_excel(self, tipo=None, fecha_desde=None, fecha_hasta=None, destino=None, progreso=None):
         """Exportar compras a archivo Excel"""
         try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, PatternFill, Alignment
+            from openpyxl.styles import Font
+            from utils.exportador import ExportadorExcel
         
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Compras y Gastos"
+            query, params = self._consulta_compras(tipo, fecha_desde, fecha_hasta)
+            compras = self._iterar_consulta(query, params)
         
             # Título
-            ws['A1'] = 'REPORTE DE COMPRAS Y GASTOS'
-            ws['A1'].font = Font(bold=True, size=14)
-            ws['A2'] = f'Período: {fecha_desde or "Inicio"} - {fecha_hasta or "Actual"}'
-            ws['A2'].font = Font(italic=True)
+            previas = [
+                (['REPORTE DE COMPRAS Y GASTOS'], Font(bold=True, size=14)),
+                ([f'Período: {fecha_desde or "Inicio"} - {fecha_hasta or "Actual"}'], Font(italic=True)),
+                ([], None)  # Línea vacía
+            ]
         
             # Encabezados
             headers = ['ID', 'Fecha', 'Tipo', 'Descripción', 'Proveedor', 'Método Pago', 'Monto']
-            ws.append([])  # Línea vacía
-            ws.append(headers)
-        
-            # Estilo para encabezados
-            header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            header_font = Font(color="FFFFFF", bold=True)
-        
-            for cell in ws[4]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal="center")
         
             # Datos
             total = 0
-            for compra in compras:
-                ws.append([
-                    compra['id'],
-                    compra['fecha'],
-                    compra['tipo'].capitalize(),
-                    compra['descripcion'] or '-',
-                    compra['proveedor'] or '-',
-                    compra['metodo_pago'].capitalize(),
-                    f"Bs. {compra['monto']:.2f}"
-                ])
-                total += compra['monto']
-        
-            # Total
-            ws.append([])
-            ws.append(['', '', '', '', '', 'TOTAL:', f'Bs. {total:.2f}'])
-        
-            # Última fila en negrita
-            for cell in ws[ws.max_row]:
-                cell.font = Font(bold=True)
-        
-            # Ajustar anchos de columna
-            ws.column_dimensions['A'].width = 10
-            ws.column_dimensions['B'].width = 20
-            ws.column_dimensions['C'].width = 15
-            ws.column_dimensions['D'].width = 30
-            ws.column_dimensions['E'].width = 25
-            ws.column_dimensions['F'].width = 15
-            ws.column_dimensions['G'].width = 15
-        
-            # Guardar archivo
-            os.makedirs('exports', exist_ok=True)
-            filename = f'exports/compras_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            wb.save(filename)
         
-            return filename
+            def filas():
+                nonlocal total
+                for compra in compras:
+                    total += compra['monto']
+                    yield [
+                        compra['id'],
+                        compra['fecha'],
+                        compra['tipo'].capitalize(),
+                        compra['descripcion'] or '-',
+                        compra['proveedor'] or '-',
+                        compra['metodo_pago'].capitalize(),
+                        f"Bs. {compra['monto']:.2f}"
+                    ]
+        
+            exportador = ExportadorExcel(progreso=progreso)
+            exportador.agregar_hoja(
+                "Compras y Gastos", headers, filas(), color="366092", centrar=True,
+                anchos=[10, 20, 15, 30, 25, 15, 15], previas=previas,
+                # Total en negrita
+                pie=lambda: [[], ['', '', '', '', '', 'TOTAL:', f'Bs. {total:.2f}']]
+            )
+            return exportador.guardar(destino)
         except Exception as e:
             print(f"Error al exportar compras: {e}")
             return None
@@ -1115,6 +2374,7 @@ class Database:
 
     # ===== FUNCIONES DE CRÉDITOS =====
 
+    @invalida('creditos')
     def crear_credito(self, venta_id, cliente_nombre, cliente_telefono, monto_total):
         """Crear un nuevo crédito"""
         conn = self.get_connection()
@@ -1189,6 +2449,7 @@ class Database:
         conn.close()
         return pagos
     
+    @invalida('pagos_creditos', 'creditos', 'movimientos_caja')
     def registrar_pago_credito(self, credito_id, data):
         """Registrar un pago de crédito"""
         conn = self.get_connection()
@@ -1255,6 +2516,7 @@ class Database:
         
         return pago_id
     
+    @cacheado('creditos', 'pagos_creditos')
     def obtener_estadisticas_creditos(self):
         """Obtener estadísticas de créditos"""
         conn = self.get_connection()
@@ -1273,7 +2535,7 @@ class Database:
             SELECT COUNT(*) as cantidad, COALESCE(SUM(saldo_pendiente), 0) as total
             FROM creditos 
             WHERE estado IN ('pendiente', 'parcial')
-            AND date(fecha_credito) <= date('now', '-30 days')
+            AND fecha_credito < date('now', '-29 days')
         ''')
         vencidos = cursor.fetchone()
         
@@ -1281,7 +2543,8 @@ class Database:
         cursor.execute('''
             SELECT COALESCE(SUM(monto), 0) as total
             FROM pagos_creditos
-            WHERE strftime('%Y-%m', fecha) = strftime('%Y-%m', 'now', 'localtime')
+            WHERE fecha >= date('now', 'localtime', 'start of month')
+            AND fecha < date('now', 'localtime', 'start of month', '+1 month')
         ''')
         cobrado_mes = cursor.fetchone()
         
@@ -1333,58 +2596,25 @@ class Database:
             'total_adeudado': total_adeudado
         }
     
-    def exportar_creditos_excel(self):
+    def exportar_creditos_excel(self, destino=None, progreso=None):
         """Exportar créditos a Excel"""
-        creditos = self.obtener_creditos()
+        from utils.exportador import ExportadorExcel
         
-        # Crear workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Créditos"
+        creditos = self._iterar_consulta('''
+            SELECT id, fecha_credito, cliente_nombre, COALESCE(cliente_telefono, '-'),
+                   monto_total, monto_pagado, saldo_pendiente, estado,
+                   COALESCE(fecha_ultimo_pago, '-')
+            FROM creditos ORDER BY fecha_credito DESC
+        ''')
         
         # Encabezados
         headers = ['ID', 'Fecha', 'Cliente', 'Teléfono', 'Monto Total', 
                    'Monto Pagado', 'Saldo Pendiente', 'Estado', 'Último Pago']
-        ws.append(headers)
-        
-        # Estilos
-        for cell in ws[1]:
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color="ffc107", end_color="ffc107", fill_type="solid")
-            cell.font = Font(color="000000", bold=True)
-        
-        # Datos
-        for credito in creditos:
-            ws.append([
-                credito['id'],
-                credito['fecha_credito'],
-                credito['cliente_nombre'],
-                credito['cliente_telefono'] or '-',
-                credito['monto_total'],
-                credito['monto_pagado'],
-                credito['saldo_pendiente'],
-                credito['estado'],
-                credito['fecha_ultimo_pago'] or '-'
-            ])
-        
-        # Ajustar columnas
-        for column in ws.columns:
-            max_length = 0
-            column = [cell for cell in column]
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2) * 1.2
-            ws.column_dimensions[column[0].column_letter].width = adjusted_width
-        
-        # Guardar
-        filename = f"exports/creditos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        wb.save(filename)
-        
-        return filename
+        
+        exportador = ExportadorExcel(progreso=progreso)
+        exportador.agregar_hoja("Créditos", headers, (tuple(c) for c in creditos),
+                                color="ffc107", color_texto="000000")
+        return exportador.guardar(destino)
     
     # ===== FUNCIONES DE CAJA =====
 
@@ -1394,6 +2624,7 @@ class Database:
 # BUSCA la función abrir_caja y REEMPLÁZALA con este código:
 # ============================================
 
+    @invalida('caja')
     def abrir_caja(self, monto_inicial=0):
         """Abrir una nueva caja"""
         try:
@@ -1428,29 +2659,25 @@ class Database:
     
     
     
+    @invalida('caja')
     def cerrar_caja(self, caja_id, efectivo_contado):
         """Cerrar caja actual"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        # Calcular totales
-        cursor.execute('''
-            SELECT 
-                COALESCE(SUM(CASE WHEN tipo = 'ingreso' AND metodo_pago = 'efectivo' THEN monto ELSE 0 END), 0) as total_efectivo_ing,
-                COALESCE(SUM(CASE WHEN tipo = 'egreso' AND metodo_pago = 'efectivo' THEN monto ELSE 0 END), 0) as total_efectivo_egr,
-                COALESCE(SUM(CASE WHEN tipo = 'ingreso' AND metodo_pago = 'qr' THEN monto ELSE 0 END), 0) as total_qr,
-                COALESCE(SUM(CASE WHEN tipo = 'ingreso' AND metodo_pago = 'credito' THEN monto ELSE 0 END), 0) as total_credito,
-                COALESCE(SUM(CASE WHEN tipo = 'ingreso' THEN monto ELSE 0 END), 0) as total_ingresos,
-                COALESCE(SUM(CASE WHEN tipo = 'egreso' THEN monto ELSE 0 END), 0) as total_egresos
-            FROM movimientos_caja 
-            WHERE caja_id = ?
-        ''', (caja_id,))
-        
-        totales = cursor.fetchone()
+        # Totales acumulados en la fila de caja (se mantienen con cada movimiento)
+        cursor.execute('SELECT * FROM caja WHERE id = ?', (caja_id,))
+        caja = cursor.fetchone()
         
-        # Obtener monto inicial
-        cursor.execute('SELECT monto_inicial FROM caja WHERE id = ?', (caja_id,))
-        monto_inicial = cursor.fetchone()['monto_inicial']
+        totales = {
+            'total_efectivo_ing': caja['ingresos_efectivo'],
+            'total_efectivo_egr': caja['egresos_efectivo'],
+            'total_qr': caja['ingresos_qr'],
+            'total_credito': caja['ingresos_credito'],
+            'total_ingresos': caja['total_ingresos'],
+            'total_egresos': caja['total_egresos']
+        }
+        monto_inicial = caja['monto_inicial']
         
         # Calcular efectivo esperado
         efectivo_esperado = monto_inicial + totales['total_efectivo_ing'] - totales['total_efectivo_egr']
@@ -1553,44 +2780,28 @@ class Database:
                 conn.close()
                 return {}
             
-            # Calcular totales por tipo y método
-            cursor.execute('''
-                SELECT 
-                    COALESCE(SUM(CASE WHEN tipo = 'ingreso' AND metodo_pago = 'efectivo' THEN monto ELSE 0 END), 0) as ingresos_efectivo,
-                    COALESCE(SUM(CASE WHEN tipo = 'ingreso' AND metodo_pago = 'qr' THEN monto ELSE 0 END), 0) as ingresos_qr,
-                    COALESCE(SUM(CASE WHEN tipo = 'ingreso' AND metodo_pago = 'mixto' THEN monto ELSE 0 END), 0) as ingresos_mixto,
-                    COALESCE(SUM(CASE WHEN tipo = 'egreso' AND metodo_pago = 'efectivo' THEN monto ELSE 0 END), 0) as egresos_efectivo,
-                    COALESCE(SUM(CASE WHEN tipo = 'egreso' AND metodo_pago != 'efectivo' THEN monto ELSE 0 END), 0) as egresos_otros,
-                    COALESCE(SUM(CASE WHEN tipo = 'ingreso' THEN monto ELSE 0 END), 0) as total_ingresos,
-                    COALESCE(SUM(CASE WHEN tipo = 'egreso' THEN monto ELSE 0 END), 0) as total_egresos,
-                    COUNT(CASE WHEN referencia_tipo = 'venta' THEN 1 END) as num_ventas,
-                    COUNT(CASE WHEN referencia_tipo = 'compra' THEN 1 END) as num_compras,
-                    COUNT(CASE WHEN referencia_tipo = 'pago_credito' THEN 1 END) as num_pagos
-                FROM movimientos_caja 
-                WHERE caja_id = ?
-            ''', (caja_id,))
-            
-            totales = cursor.fetchone()
+            # Los totales se acumulan en la fila de caja con cada movimiento,
+            # así que no hace falta recorrer movimientos_caja
             
             # Calcular efectivo actual (monto inicial + ingresos efectivo - egresos efectivo)
-            efectivo_actual = caja['monto_inicial'] + totales['ingresos_efectivo'] - totales['egresos_efectivo']
+            efectivo_actual = caja['monto_inicial'] + caja['ingresos_efectivo'] - caja['egresos_efectivo']
             
             conn.close()
             
             return {
                 'monto_inicial': caja['monto_inicial'],
                 'efectivo_actual': efectivo_actual,
-                'ingresos_efectivo': totales['ingresos_efectivo'],
-                'ingresos_qr': totales['ingresos_qr'],
-                'ingresos_mixto': totales['ingresos_mixto'],
-                'egresos_efectivo': totales['egresos_efectivo'],
-                'egresos_otros': totales['egresos_otros'],
-                'total_ingresos': totales['total_ingresos'],
-                'total_egresos': totales['total_egresos'],
-                'num_ventas': totales['num_ventas'],
-                'num_compras': totales['num_compras'],
-                'num_pagos': totales['num_pagos'],
-                'balance': totales['total_ingresos'] - totales['total_egresos']
+                'ingresos_efectivo': caja['ingresos_efectivo'],
+                'ingresos_qr': caja['ingresos_qr'],
+                'ingresos_mixto': caja['ingresos_mixto'],
+                'egresos_efectivo': caja['egresos_efectivo'],
+                'egresos_otros': caja['egresos_otros'],
+                'total_ingresos': caja['total_ingresos'],
+                'total_egresos': caja['total_egresos'],
+                'num_ventas': caja['num_ventas'],
+                'num_compras': caja['num_compras'],
+                'num_pagos': caja['num_pagos'],
+                'balance': caja['total_ingresos'] - caja['total_egresos']
             }
         except Exception as e:
             print(f'❌ Error en obtener_resumen_caja: {e}')
@@ -1610,6 +2821,50 @@ class Database:
                 'balance': 0
             }
 
+    @invalida('caja')
+    def verificar_totales_caja(self, caja_id, corregir=False):
+        """Recalcular los totales de una caja desde sus movimientos y detectar diferencias"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM caja WHERE id = ?', (caja_id,))
+        caja = cursor.fetchone()
+        
+        if not caja:
+            conn.close()
+            return None
+        
+        cursor.execute(f'''
+            SELECT {_sql_sumas_caja()}
+            FROM movimientos_caja m
+            WHERE m.caja_id = ?
+        ''', (caja_id,))
+        recalculado = cursor.fetchone()
+        
+        diferencias = {}
+        for columna, _, _ in CONTADORES_CAJA:
+            if abs((caja[columna] or 0) - recalculado[columna]) > 0.005:
+                diferencias[columna] = {
+                    'acumulado': caja[columna],
+                    'recalculado': recalculado[columna]
+                }
+        
+        if diferencias and corregir:
+            asignaciones = ', '.join(f'{columna} = ?' for columna in diferencias)
+            cursor.execute(f'UPDATE caja SET {asignaciones} WHERE id = ?',
+                           [recalculado[columna] for columna in diferencias] + [caja_id])
+            conn.commit()
+            print(f'⚠️ Totales de caja #{caja_id} corregidos: {", ".join(diferencias)}')
+        
+        conn.close()
+        
+        return {
+            'caja_id': caja_id,
+            'correcto': not diferencias,
+            'diferencias': diferencias,
+            'corregido': bool(diferencias) and corregir
+        }
+
 # ====================================
 # INSTRUCCIONES:
 # 1. Abre database.py
@@ -1628,25 +2883,30 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        cursor.execute(*self._consulta_historial_cajas(fecha_desde, fecha_hasta))
+        cajas = cursor.fetchall()
+        
+        conn.close()
+        return cajas
+    
+    def _consulta_historial_cajas(self, fecha_desde=None, fecha_hasta=None):
+        """Armar la consulta del historial de cajas cerradas"""
         query = 'SELECT * FROM caja WHERE estado = "cerrada"'
         params = []
+        fecha_desde, fecha_hasta = rango_fechas(fecha_desde, fecha_hasta)
         
         if fecha_desde:
-            query += ' AND date(fecha_apertura) >= date(?)'
+            query += ' AND fecha_apertura >= ?'
             params.append(fecha_desde)
         
         if fecha_hasta:
-            query += ' AND date(fecha_apertura) <= date(?)'
+            query += ' AND fecha_apertura < ?'
             params.append(fecha_hasta)
         
         query += ' ORDER BY fecha_apertura DESC'
-        
-        cursor.execute(query, params)
-        cajas = cursor.fetchall()
-        
-        conn.close()
-        return cajas
+        return query, params
     
+    @invalida('movimientos_caja')
     def registrar_retiro_caja(self, caja_id, data):
         """Registrar un retiro de caja"""
         conn = self.get_connection()
@@ -1670,130 +2930,152 @@ class Database:
         
         return movimiento_id
     
-    def exportar_caja_excel(self, caja_id):
+    def exportar_caja_excel(self, caja_id, destino=None, progreso=None):
         """Exportar reporte de caja a Excel"""
+        from utils.exportador import ExportadorExcel
+        
         caja = self.obtener_caja(caja_id)
-        movimientos = self.obtener_movimientos_caja(caja_id)
         resumen = self.obtener_resumen_caja(caja_id)
         
-        # Crear workbook
-        wb = openpyxl.Workbook()
-        
         # Hoja 1: Resumen
-        ws1 = wb.active
-        ws1.title = "Resumen"
-        
-        ws1.append(['REPORTE DE CAJA'])
-        ws1.append([''])
-        ws1.append(['Fecha Apertura:', caja['fecha_apertura']])
-        ws1.append(['Fecha Cierre:', caja['fecha_cierre'] or 'Abierta'])
-        ws1.append(['Usuario:', caja['usuario']])
-        ws1.append([''])
-        ws1.append(['RESUMEN FINANCIERO'])
-        ws1.append(['Monto Inicial:', f"Bs. {resumen['monto_inicial']:.2f}"])
-        ws1.append(['Total Ingresos:', f"Bs. {resumen['total_ingresos']:.2f}"])
-        ws1.append(['Total Egresos:', f"Bs. {resumen['total_egresos']:.2f}"])
-        ws1.append(['Balance:', f"Bs. {resumen['balance']:.2f}"])
-        ws1.append([''])
+        filas_resumen = [
+            ['REPORTE DE CAJA'],
+            [''],
+            ['Fecha Apertura:', caja['fecha_apertura']],
+            ['Fecha Cierre:', caja['fecha_cierre'] or 'Abierta'],
+            ['Usuario:', caja['usuario']],
+            [''],
+            ['RESUMEN FINANCIERO'],
+            ['Monto Inicial:', f"Bs. {resumen['monto_inicial']:.2f}"],
+            ['Total Ingresos:', f"Bs. {resumen['total_ingresos']:.2f}"],
+            ['Total Egresos:', f"Bs. {resumen['total_egresos']:.2f}"],
+            ['Balance:', f"Bs. {resumen['balance']:.2f}"],
+            ['']
+        ]
         
         if caja['estado'] == 'cerrada':
-            ws1.append(['CIERRE DE CAJA'])
-            ws1.append(['Efectivo Esperado:', f"Bs. {caja['efectivo_esperado']:.2f}"])
-            ws1.append(['Efectivo Contado:', f"Bs. {caja['efectivo_contado']:.2f}"])
-            ws1.append(['Diferencia:', f"Bs. {caja['diferencia']:.2f}"])
+            filas_resumen += [
+                ['CIERRE DE CAJA'],
+                ['Efectivo Esperado:', f"Bs. {caja['efectivo_esperado']:.2f}"],
+                ['Efectivo Contado:', f"Bs. {caja['efectivo_contado']:.2f}"],
+                ['Diferencia:', f"Bs. {caja['diferencia']:.2f}"]
+            ]
+        
+        exportador = ExportadorExcel(progreso=progreso)
+        exportador.agregar_hoja("Resumen", filas=filas_resumen)
         
         # Hoja 2: Movimientos
-        ws2 = wb.create_sheet("Movimientos")
+        movimientos = self._iterar_consulta('''
+            SELECT fecha, tipo, concepto, monto, COALESCE(metodo_pago, '-')
+            FROM movimientos_caja WHERE caja_id = ?
+            ORDER BY fecha DESC
+        ''', (caja_id,))
         
         headers = ['Fecha', 'Tipo', 'Concepto', 'Monto', 'Método Pago']
-        ws2.append(headers)
-        
-        for cell in ws2[1]:
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color="17a2b8", end_color="17a2b8", fill_type="solid")
-            cell.font = Font(color="FFFFFF", bold=True)
-        
-        for mov in movimientos:
-            ws2.append([
-                mov['fecha'],
-                mov['tipo'],
-                mov['concepto'],
-                mov['monto'],
-                mov['metodo_pago'] or '-'
-            ])
-        
-        # Ajustar columnas
-        for ws in [ws1, ws2]:
-            for column in ws.columns:
-                max_length = 0
-                column = [cell for cell in column]
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2) * 1.2
-                ws.column_dimensions[column[0].column_letter].width = adjusted_width
-        
-        # Guardar
-        filename = f"exports/caja_{caja_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        wb.save(filename)
-        
-        return filename
-    
-    def exportar_historial_cajas_excel(self, fecha_desde=None, fecha_hasta=None):
+        exportador.agregar_hoja("Movimientos", headers, (tuple(m) for m in movimientos),
+                                color="17a2b8")
+        return exportador.guardar(destino)
+    
+    def exportar_historial_cajas_excel(self, fecha_desde=None, fecha_hasta=None, destino=None, progreso=None):
         """Exportar historial de cajas a Excel"""
-        cajas = self.obtener_historial_cajas(fecha_desde, fecha_hasta)
+        from utils.exportador import ExportadorExcel
         
-        # Crear workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Historial Cajas"
+        query, params = self._consulta_historial_cajas(fecha_desde, fecha_hasta)
+        cajas = self._iterar_consulta(query, params)
         
         # Encabezados
         headers = ['ID', 'Apertura', 'Cierre', 'Inicial', 'Ingresos', 
                    'Egresos', 'Esperado', 'Contado', 'Diferencia']
-        ws.append(headers)
-        
-        # Estilos
-        for cell in ws[1]:
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color="6c757d", end_color="6c757d", fill_type="solid")
-            cell.font = Font(color="FFFFFF", bold=True)
-        
-        # Datos
-        for caja in cajas:
-            ws.append([
-                caja['id'],
-                caja['fecha_apertura'],
-                caja['fecha_cierre'],
-                caja['monto_inicial'],
-                caja['total_ingresos'],
-                caja['total_egresos'],
-                caja['efectivo_esperado'],
-                caja['efectivo_contado'],
-                caja['diferencia']
-            ])
-        
-        # Ajustar columnas
-        for column in ws.columns:
-            max_length = 0
-            column = [cell for cell in column]
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2) * 1.2
-            ws.column_dimensions[column[0].column_letter].width = adjusted_width
-        
-        # Guardar
-        filename = f"exports/historial_cajas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        wb.save(filename)
-        
-        return filename
+        
+        filas = ([
+            caja['id'],
+            caja['fecha_apertura'],
+            caja['fecha_cierre'],
+            caja['monto_inicial'],
+            caja['total_ingresos'],
+            caja['total_egresos'],
+            caja['efectivo_esperado'],
+            caja['efectivo_contado'],
+            caja['diferencia']
+        ] for caja in cajas)
+        
+        exportador = ExportadorExcel(progreso=progreso)
+        exportador.agregar_hoja("Historial Cajas", headers, filas, color="6c757d")
+        return exportador.guardar(destino)
+
+    def version_exportacion(self, reporte, *parametros):
+        """Marca de los datos que usa un reporte Excel, para reutilizar el archivo
+        
+        Se arma con los resúmenes que mantienen los triggers, así que cambia
+        cuando cambia algo de lo que el reporte exporta y se mantiene igual
+        para una caja cerrada o un rango pasado. None si el reporte no tiene
+        marca (no se cachea).
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            partes = []
+            
+            if reporte == 'productos':
+                # Cualquier cambio de un producto (incluido el stock) sube la versión
+                cursor.execute('SELECT version FROM catalogo_version WHERE id = 1')
+                partes.append(tuple(cursor.fetchone()))
+            elif reporte == 'caja':
+                # La fila de caja lleva los contadores de sus movimientos
+                cursor.execute('SELECT * FROM caja WHERE id = ?', (parametros[0],))
+                fila = cursor.fetchone()
+                if fila is None:
+                    conn.close()
+                    return None
+                partes.append(tuple(fila))
+            elif reporte in ('ventas', 'estadisticas') and all(parametros[:2]):
+                fecha_desde, fecha_hasta = parametros[0][:10], parametros[1][:10]
+                origenes = ('venta',) if reporte == 'ventas' else tuple(o[1] for o in ORIGENES_RESUMEN_DIARIO)
+                cursor.execute(f'''
+                    SELECT origen, clave, SUM(cantidad), SUM(total), SUM(monto_efectivo), SUM(monto_qr)
+                    FROM resumen_diario
+                    WHERE origen IN ({', '.join('?' * len(origenes))}) AND fecha >= ? AND fecha <= ?
+                    GROUP BY origen, clave
+                ''', (*origenes, fecha_desde, fecha_hasta))
+                partes.append([tuple(row) for row in cursor.fetchall()])
+                
+                if reporte == 'estadisticas':
+                    # Top de productos y categorías: ventas por producto y sus nombres
+                    partes.append(sorted(tuple(row) for row in
+                                         self._ventas_por_producto(cursor, fecha_desde, fecha_hasta)))
+                    cursor.execute('SELECT id, nombre, categoria FROM productos ORDER BY id')
+                    partes.append([tuple(row) for row in cursor.fetchall()])
+            else:
+                conn.close()
+                return None
+            
+            conn.close()
+            texto = json.dumps([reporte, partes], default=str, ensure_ascii=False)
+            return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+            
+        except Exception as e:
+            print(f'❌ Error al obtener versión de exportación: {e}')
+            return None
+    
+    def iterar_exportacion(self, reporte, fecha_desde=None, fecha_hasta=None,
+                           tipo=None, caja_id=None):
+        """Filas crudas de un reporte (la primera es el encabezado), leídas por bloques"""
+        if reporte == 'ventas':
+            query = 'SELECT * FROM ventas WHERE fecha >= ? AND fecha < ? ORDER BY fecha DESC'
+            params = rango_fechas(fecha_desde, fecha_hasta)
+        elif reporte == 'compras':
+            query, params = self._consulta_compras(tipo, fecha_desde, fecha_hasta)
+        elif reporte == 'creditos':
+            query, params = 'SELECT * FROM creditos ORDER BY fecha_credito DESC', ()
+        elif reporte == 'caja' and caja_id:
+            query = 'SELECT * FROM movimientos_caja WHERE caja_id = ? ORDER BY fecha DESC'
+            params = (caja_id,)
+        elif reporte == 'caja':
+            query, params = self._consulta_historial_cajas(fecha_desde, fecha_hasta)
+        else:
+            raise ValueError(f'Reporte desconocido: {reporte}')
+        
+        return self._iterar_consulta(query, params, encabezado=True)
 
 # ============================================
 # FIN DEL CÓDIGO PARA database.py
@@ -1814,103 +3096,117 @@ class Database:
 
     # ========== FUNCIONES PARA ESTADÍSTICAS (MÓDULO 7) ==========
     
+    @cacheado(*TABLAS_DASHBOARD)
     def obtener_estadisticas_dashboard(self):
-        """Obtener estadísticas para el dashboard principal"""
+        """Obtener estadísticas para el dashboard principal
+        
+        Una sola sentencia: las ventas y compras salen del resumen diario y el
+        efectivo de la caja de sus contadores, así que solo se recorren los
+        días del mes, los productos y los créditos abiertos.
+        """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
             hoy = datetime.now().strftime('%Y-%m-%d')
             
-            # Total productos
-            cursor.execute('SELECT COUNT(*) as total FROM productos')
-            total_productos = cursor.fetchone()['total']
-            
-            # Productos con stock bajo
-            cursor.execute('SELECT COUNT(*) as total FROM productos WHERE stock <= stock_minimo')
-            stock_bajo = cursor.fetchone()['total']
-            
-            # Ventas de hoy
-            cursor.execute('''
-                SELECT COUNT(*) as cantidad, COALESCE(SUM(total), 0) as total 
-                FROM ventas 
-                WHERE DATE(fecha) = DATE(?)
-            ''', (hoy,))
-            ventas_hoy = cursor.fetchone()
-            
-            # Ventas del mes
-            cursor.execute('''
-                SELECT COUNT(*) as cantidad, COALESCE(SUM(total), 0) as total 
-                FROM ventas 
-                WHERE strftime('%Y-%m', fecha) = strftime('%Y-%m', 'now')
-            ''')
-            ventas_mes = cursor.fetchone()
-            
-            # Compras/Gastos del mes
-            cursor.execute('''
-                SELECT COALESCE(SUM(monto), 0) as total 
-                FROM compras 
-                WHERE strftime('%Y-%m', fecha) = strftime('%Y-%m', 'now')
-            ''')
-            gastos_mes = cursor.fetchone()['total']
-            
-            # Créditos pendientes
             cursor.execute('''
-                SELECT COUNT(*) as cantidad, COALESCE(SUM(saldo_pendiente), 0) as total 
-                FROM creditos 
-                WHERE estado IN ('pendiente', 'parcial')
-            ''')
-            creditos = cursor.fetchone()
-            
-            # Estado de caja
-            cursor.execute('SELECT * FROM caja WHERE estado = "abierta"')
-            caja_abierta = cursor.fetchone()
-            
-            caja_estado = {
-                'abierta': caja_abierta is not None,
-                'monto_actual': 0
-            }
-            
-            if caja_abierta:
-                # Calcular efectivo actual
-                cursor.execute('''
-                    SELECT 
-                        COALESCE(SUM(CASE WHEN tipo = 'ingreso' AND metodo_pago = 'efectivo' THEN monto ELSE 0 END), 0) -
-                        COALESCE(SUM(CASE WHEN tipo = 'egreso' AND metodo_pago = 'efectivo' THEN monto ELSE 0 END), 0) as efectivo
-                    FROM movimientos_caja
-                    WHERE caja_id = ?
-                ''', (caja_abierta['id'],))
-                movimientos = cursor.fetchone()
-                caja_estado['monto_actual'] = caja_abierta['monto_inicial'] + (movimientos['efectivo'] if movimientos else 0)
+                WITH
+                prod AS (
+                    SELECT COUNT(*) as total,
+                           COALESCE(SUM(stock <= stock_minimo), 0) as stock_bajo
+                    FROM productos
+                ),
+                mes AS (
+                    SELECT DATE('now', 'start of month') as inicio,
+                           DATE('now', 'start of month', '+1 month') as fin
+                ),
+                resumen AS (
+                    SELECT
+                        COALESCE(SUM(CASE WHEN origen = 'venta' AND fecha = ? THEN cantidad END), 0) as ventas_hoy_cantidad,
+                        COALESCE(SUM(CASE WHEN origen = 'venta' AND fecha = ? THEN total END), 0) as ventas_hoy_total,
+                        COALESCE(SUM(CASE WHEN origen = 'venta' AND fecha >= mes.inicio AND fecha < mes.fin
+                                          THEN cantidad END), 0) as ventas_mes_cantidad,
+                        COALESCE(SUM(CASE WHEN origen = 'venta' AND fecha >= mes.inicio AND fecha < mes.fin
+                                          THEN total END), 0) as ventas_mes_total,
+                        COALESCE(SUM(CASE WHEN origen = 'compra' AND fecha >= mes.inicio AND fecha < mes.fin
+                                          THEN total END), 0) as gastos_mes
+                    FROM resumen_diario, mes
+                    WHERE (fecha = ? OR (fecha >= mes.inicio AND fecha < mes.fin))
+                    AND origen IN ('venta', 'compra')
+                ),
+                cred AS (
+                    SELECT COUNT(*) as cantidad, COALESCE(SUM(saldo_pendiente), 0) as total
+                    FROM creditos
+                    WHERE estado IN ('pendiente', 'parcial')
+                ),
+                caja_abierta AS (
+                    SELECT monto_inicial + ingresos_efectivo - egresos_efectivo as monto_actual
+                    FROM caja WHERE estado = 'abierta'
+                    LIMIT 1
+                )
+                SELECT
+                    prod.total as total_productos, prod.stock_bajo,
+                    resumen.*,
+                    cred.cantidad as creditos_cantidad, cred.total as creditos_total,
+                    (SELECT COUNT(*) FROM caja_abierta) as caja_abierta,
+                    COALESCE((SELECT monto_actual FROM caja_abierta), 0) as caja_monto_actual
+                FROM prod, resumen, cred
+            ''', (hoy, hoy, hoy))
+            fila = cursor.fetchone()
             
             conn.close()
             
             return {
                 'productos': {
-                    'total': total_productos,
-                    'stock_bajo': stock_bajo
+                    'total': fila['total_productos'],
+                    'stock_bajo': fila['stock_bajo']
                 },
                 'ventas_hoy': {
-                    'cantidad': ventas_hoy['cantidad'],
-                    'total': ventas_hoy['total']
+                    'cantidad': fila['ventas_hoy_cantidad'],
+                    'total': fila['ventas_hoy_total']
                 },
                 'ventas_mes': {
-                    'cantidad': ventas_mes['cantidad'],
-                    'total': ventas_mes['total']
+                    'cantidad': fila['ventas_mes_cantidad'],
+                    'total': fila['ventas_mes_total']
                 },
-                'gastos_mes': gastos_mes,
+                'gastos_mes': fila['gastos_mes'],
                 'creditos': {
-                    'cantidad': creditos['cantidad'],
-                    'total': creditos['total']
+                    'cantidad': fila['creditos_cantidad'],
+                    'total': fila['creditos_total']
                 },
-                'caja': caja_estado,
-                'ganancia_mes': ventas_mes['total'] - gastos_mes
+                'caja': {
+                    'abierta': fila['caja_abierta'] > 0,
+                    'monto_actual': fila['caja_monto_actual']
+                },
+                'ganancia_mes': fila['ventas_mes_total'] - fila['gastos_mes']
             }
             
         except Exception as e:
             print(f'❌ Error al obtener estadísticas dashboard: {e}')
             return None
     
+    def _totales_resumen_diario(self, cursor, fecha_desde, fecha_hasta):
+        """Sumar el resumen diario de un rango de días, agrupado por origen y clave"""
+        cursor.execute('''
+            SELECT 
+                origen,
+                clave,
+                SUM(cantidad) as cantidad,
+                SUM(total) as total,
+                SUM(monto_efectivo) as monto_efectivo,
+                SUM(monto_qr) as monto_qr
+            FROM resumen_diario
+            WHERE fecha >= ? AND fecha <= ?
+            GROUP BY origen, clave
+        ''', (fecha_desde[:10], fecha_hasta[:10]))
+        
+        totales = {}
+        for row in cursor.fetchall():
+            totales.setdefault(row['origen'], {})[row['clave']] = dict(row)
+        return totales
+    
+    @cacheado('ventas')
     def obtener_ventas_por_periodo(self, periodo='dia', fecha_desde=None, fecha_hasta=None):
         """Obtener ventas agrupadas por período (día, semana, mes)"""
         try:
@@ -1924,52 +3220,28 @@ class Database:
                 fecha_hasta = datetime.now().strftime('%Y-%m-%d')
             
             if periodo == 'dia':
-                cursor.execute('''
-                    SELECT 
-                        DATE(fecha) as periodo,
-                        COUNT(*) as cantidad,
-                        COALESCE(SUM(total), 0) as total,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'efectivo' THEN total ELSE 0 END), 0) as efectivo,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'qr' THEN total ELSE 0 END), 0) as qr,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'credito' THEN total ELSE 0 END), 0) as credito,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'mixto' THEN total ELSE 0 END), 0) as mixto
-                    FROM ventas
-                    WHERE DATE(fecha) BETWEEN DATE(?) AND DATE(?)
-                    GROUP BY DATE(fecha)
-                    ORDER BY DATE(fecha) ASC
-                ''', (fecha_desde, fecha_hasta))
-            
+                agrupar = 'fecha'
             elif periodo == 'semana':
-                cursor.execute('''
-                    SELECT 
-                        strftime('%Y-W%W', fecha) as periodo,
-                        COUNT(*) as cantidad,
-                        COALESCE(SUM(total), 0) as total,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'efectivo' THEN total ELSE 0 END), 0) as efectivo,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'qr' THEN total ELSE 0 END), 0) as qr,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'credito' THEN total ELSE 0 END), 0) as credito,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'mixto' THEN total ELSE 0 END), 0) as mixto
-                    FROM ventas
-                    WHERE DATE(fecha) BETWEEN DATE(?) AND DATE(?)
-                    GROUP BY strftime('%Y-W%W', fecha)
-                    ORDER BY periodo ASC
-                ''', (fecha_desde, fecha_hasta))
-            
+                agrupar = "strftime('%Y-W%W', fecha)"
             else:  # mes
-                cursor.execute('''
-                    SELECT 
-                        strftime('%Y-%m', fecha) as periodo,
-                        COUNT(*) as cantidad,
-                        COALESCE(SUM(total), 0) as total,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'efectivo' THEN total ELSE 0 END), 0) as efectivo,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'qr' THEN total ELSE 0 END), 0) as qr,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'credito' THEN total ELSE 0 END), 0) as credito,
-                        COALESCE(SUM(CASE WHEN metodo_pago = 'mixto' THEN total ELSE 0 END), 0) as mixto
-                    FROM ventas
-                    WHERE DATE(fecha) BETWEEN DATE(?) AND DATE(?)
-                    GROUP BY strftime('%Y-%m', fecha)
-                    ORDER BY periodo ASC
-                ''', (fecha_desde, fecha_hasta))
+                agrupar = "strftime('%Y-%m', fecha)"
+            
+            # Se lee del resumen diario: el costo depende de los días, no de las ventas
+            cursor.execute(f'''
+                SELECT 
+                    {agrupar} as periodo,
+                    SUM(cantidad) as cantidad,
+                    COALESCE(SUM(total), 0) as total,
+                    COALESCE(SUM(CASE WHEN clave = 'efectivo' THEN total ELSE 0 END), 0) as efectivo,
+                    COALESCE(SUM(CASE WHEN clave = 'qr' THEN total ELSE 0 END), 0) as qr,
+                    COALESCE(SUM(CASE WHEN clave = 'credito' THEN total ELSE 0 END), 0) as credito,
+                    COALESCE(SUM(CASE WHEN clave = 'mixto' THEN total ELSE 0 END), 0) as mixto
+                FROM resumen_diario
+                WHERE origen = 'venta' AND fecha >= ? AND fecha <= ?
+                GROUP BY periodo
+                HAVING SUM(cantidad) > 0
+                ORDER BY periodo ASC
+            ''', (fecha_desde[:10], fecha_hasta[:10]))
             
             rows = cursor.fetchall()
             conn.close()
@@ -1980,6 +3252,7 @@ class Database:
             print(f'❌ Error al obtener ventas por período: {e}')
             return []
     
+    @cacheado('compras')
     def obtener_compras_por_periodo(self, periodo='dia', fecha_desde=None, fecha_hasta=None):
         """Obtener compras/gastos agrupados por período"""
         try:
@@ -1991,32 +3264,21 @@ class Database:
             if not fecha_hasta:
                 fecha_hasta = datetime.now().strftime('%Y-%m-%d')
             
-            if periodo == 'dia':
-                cursor.execute('''
-                    SELECT 
-                        DATE(fecha) as periodo,
-                        COALESCE(SUM(CASE WHEN tipo = 'productos' THEN monto ELSE 0 END), 0) as productos,
-                        COALESCE(SUM(CASE WHEN tipo = 'insumos' THEN monto ELSE 0 END), 0) as insumos,
-                        COALESCE(SUM(CASE WHEN tipo = 'gastos' THEN monto ELSE 0 END), 0) as gastos,
-                        COALESCE(SUM(monto), 0) as total
-                    FROM compras
-                    WHERE DATE(fecha) BETWEEN DATE(?) AND DATE(?)
-                    GROUP BY DATE(fecha)
-                    ORDER BY DATE(fecha) ASC
-                ''', (fecha_desde, fecha_hasta))
-            else:
-                cursor.execute('''
-                    SELECT 
-                        strftime('%Y-%m', fecha) as periodo,
-                        COALESCE(SUM(CASE WHEN tipo = 'productos' THEN monto ELSE 0 END), 0) as productos,
-                        COALESCE(SUM(CASE WHEN tipo = 'insumos' THEN monto ELSE 0 END), 0) as insumos,
-                        COALESCE(SUM(CASE WHEN tipo = 'gastos' THEN monto ELSE 0 END), 0) as gastos,
-                        COALESCE(SUM(monto), 0) as total
-                    FROM compras
-                    WHERE DATE(fecha) BETWEEN DATE(?) AND DATE(?)
-                    GROUP BY strftime('%Y-%m', fecha)
-                    ORDER BY periodo ASC
-                ''', (fecha_desde, fecha_hasta))
+            agrupar = 'fecha' if periodo == 'dia' else "strftime('%Y-%m', fecha)"
+            
+            cursor.execute(f'''
+                SELECT 
+                    {agrupar} as periodo,
+                    COALESCE(SUM(CASE WHEN clave = 'productos' THEN total ELSE 0 END), 0) as productos,
+                    COALESCE(SUM(CASE WHEN clave = 'insumos' THEN total ELSE 0 END), 0) as insumos,
+                    COALESCE(SUM(CASE WHEN clave = 'gastos' THEN total ELSE 0 END), 0) as gastos,
+                    COALESCE(SUM(total), 0) as total
+                FROM resumen_diario
+                WHERE origen = 'compra' AND fecha >= ? AND fecha <= ?
+                GROUP BY periodo
+                HAVING SUM(cantidad) > 0
+                ORDER BY periodo ASC
+            ''', (fecha_desde[:10], fecha_hasta[:10]))
             
             rows = cursor.fetchall()
             conn.close()
@@ -2027,80 +3289,111 @@ class Database:
             print(f'❌ Error al obtener compras por período: {e}')
             return []
     
+    def _ventas_por_producto(self, cursor, fecha_desde=None, fecha_hasta=None):
+        """Cantidad y subtotal vendidos de cada producto en un rango de días
+        
+        En rangos cortos conviene buscar los días por la clave primaria y
+        agrupar lo poco que sale; en los largos (o sin rango), recorrer el
+        índice por producto evita ordenar días x productos filas. Sin ANALYZE
+        el planificador no elige el índice solo, por eso se indica.
+        """
+        dias = None
+        if fecha_desde and fecha_hasta:
+            dias = (date.fromisoformat(fecha_hasta[:10]) - date.fromisoformat(fecha_desde[:10])).days
+        indice = ('' if dias is not None and dias <= DIAS_RANGO_CORTO
+                  else 'INDEXED BY idx_ventas_producto_diario_producto')
+        
+        query = f'''
+            SELECT producto_id, SUM(cantidad) as cantidad, SUM(subtotal) as total
+            FROM ventas_producto_diario {indice}
+        '''
+        params = []
+        if dias is not None:
+            query += ' WHERE fecha >= ? AND fecha <= ?'
+            params = [fecha_desde[:10], fecha_hasta[:10]]
+        query += ' GROUP BY producto_id HAVING SUM(cantidad) != 0 OR SUM(subtotal) != 0'
+        
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    
+    @cacheado('detalle_ventas', 'productos', 'ventas')
     def obtener_top_productos(self, limite=10, fecha_desde=None, fecha_hasta=None):
-        """Obtener los productos más vendidos"""
+        """Obtener los productos más vendidos
+        
+        Suma ventas_producto_diario en el rango (una fila por producto y día)
+        y se queda con los primeros con un heap; solo de esos se buscan los
+        datos del producto.
+        """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            query = '''
-                SELECT 
-                    dv.producto_id,
-                    dv.producto_nombre,
-                    SUM(dv.cantidad) as cantidad_vendida,
-                    SUM(dv.subtotal) as total_vendido,
-                    p.categoria,
-                    p.stock
-                FROM detalle_ventas dv
-                LEFT JOIN productos p ON dv.producto_id = p.id
-                LEFT JOIN ventas v ON dv.venta_id = v.id
-            '''
-            
-            params = []
-            if fecha_desde and fecha_hasta:
-                query += ' WHERE DATE(v.fecha) BETWEEN DATE(?) AND DATE(?)'
-                params = [fecha_desde, fecha_hasta]
-            
-            query += '''
-                GROUP BY dv.producto_id, dv.producto_nombre
-                ORDER BY cantidad_vendida DESC
-                LIMIT ?
-            '''
-            params.append(limite)
+            vendidos = self._ventas_por_producto(cursor, fecha_desde, fecha_hasta)
+            top = heapq.nlargest(int(limite), vendidos, key=lambda fila: fila['cantidad'])
+            
+            productos = {}
+            if top:
+                marcadores = ', '.join('?' * len(top))
+                cursor.execute(f'''
+                    SELECT id, nombre, categoria, stock FROM productos WHERE id IN ({marcadores})
+                ''', [fila['producto_id'] for fila in top])
+                productos = {row['id']: row for row in cursor.fetchall()}
+            
+            resultado = []
+            for fila in top:
+                producto = productos.get(fila['producto_id'])
+                nombre = producto['nombre'] if producto else None
+                if nombre is None:
+                    # Producto eliminado: el nombre queda en el detalle
+                    cursor.execute('''
+                        SELECT producto_nombre FROM detalle_ventas WHERE producto_id = ? LIMIT 1
+                    ''', (fila['producto_id'],))
+                    row = cursor.fetchone()
+                    nombre = row['producto_nombre'] if row else None
+                resultado.append({
+                    'producto_id': fila['producto_id'],
+                    'producto_nombre': nombre,
+                    'cantidad_vendida': fila['cantidad'],
+                    'total_vendido': fila['total'],
+                    'categoria': producto['categoria'] if producto else None,
+                    'stock': producto['stock'] if producto else None
+                })
             
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
             conn.close()
-            
-            return [dict(row) for row in rows]
+            return resultado
             
         except Exception as e:
             print(f'❌ Error al obtener top productos: {e}')
             return []
     
+    @cacheado('detalle_ventas', 'productos', 'ventas')
     def obtener_ventas_por_categoria(self, fecha_desde=None, fecha_hasta=None):
         """Obtener ventas agrupadas por categoría de producto"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            query = '''
-                SELECT 
-                    p.categoria,
-                    SUM(dv.cantidad) as cantidad,
-                    SUM(dv.subtotal) as total
-                FROM detalle_ventas dv
-                LEFT JOIN productos p ON dv.producto_id = p.id
-                LEFT JOIN ventas v ON dv.venta_id = v.id
-            '''
-            
-            params = []
-            if fecha_desde and fecha_hasta:
-                query += ' WHERE DATE(v.fecha) BETWEEN DATE(?) AND DATE(?)'
-                params = [fecha_desde, fecha_hasta]
-            
-            query += ' GROUP BY p.categoria ORDER BY total DESC'
-            
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
+            vendidos = self._ventas_por_producto(cursor, fecha_desde, fecha_hasta)
+            cursor.execute('SELECT id, categoria FROM productos')
+            categorias = {row['id']: row['categoria'] for row in cursor.fetchall()}
             conn.close()
             
-            return [dict(row) for row in rows]
+            # La categoría es la actual del producto (None si se eliminó)
+            por_categoria = {}
+            for fila in vendidos:
+                categoria = categorias.get(fila['producto_id'])
+                acumulado = por_categoria.setdefault(categoria, {'categoria': categoria,
+                                                                 'cantidad': 0, 'total': 0})
+                acumulado['cantidad'] += fila['cantidad']
+                acumulado['total'] += fila['total']
+            
+            return sorted(por_categoria.values(), key=lambda fila: fila['total'], reverse=True)
             
         except Exception as e:
             print(f'❌ Error al obtener ventas por categoría: {e}')
             return []
     
+    @cacheado('ventas', 'compras', 'pagos_creditos', 'creditos')
     def obtener_resumen_financiero(self, fecha_desde=None, fecha_hasta=None):
         """Obtener resumen financiero completo"""
         try:
@@ -2112,51 +3405,39 @@ class Database:
             if not fecha_hasta:
                 fecha_hasta = datetime.now().strftime('%Y-%m-%d')
             
+            # Todo sale del resumen diario (una fila por día, origen y clave)
+            totales = self._totales_resumen_diario(cursor, fecha_desde, fecha_hasta)
+            conn.close()
+            
+            def sumar(origen, campo='total', clave=None):
+                filas = totales.get(origen, {})
+                if clave is not None:
+                    return filas[clave][campo] if clave in filas else 0
+                return sum(fila[campo] for fila in filas.values())
+            
             # Total ventas
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as cantidad,
-                    COALESCE(SUM(total), 0) as total,
-                    COALESCE(SUM(CASE WHEN metodo_pago = 'efectivo' THEN total ELSE 0 END), 0) as efectivo,
-                    COALESCE(SUM(CASE WHEN metodo_pago = 'qr' THEN total ELSE 0 END), 0) as qr,
-                    COALESCE(SUM(CASE WHEN metodo_pago = 'credito' THEN total ELSE 0 END), 0) as credito,
-                    COALESCE(SUM(CASE WHEN metodo_pago = 'mixto' THEN monto_efectivo ELSE 0 END), 0) as mixto_efectivo,
-                    COALESCE(SUM(CASE WHEN metodo_pago = 'mixto' THEN monto_qr ELSE 0 END), 0) as mixto_qr
-                FROM ventas
-                WHERE DATE(fecha) BETWEEN DATE(?) AND DATE(?)
-            ''', (fecha_desde, fecha_hasta))
-            ventas = cursor.fetchone()
+            ventas = {
+                'cantidad': sumar('venta', 'cantidad'),
+                'total': sumar('venta'),
+                'efectivo': sumar('venta', clave='efectivo'),
+                'qr': sumar('venta', clave='qr'),
+                'credito': sumar('venta', clave='credito'),
+                'mixto_efectivo': sumar('venta', 'monto_efectivo', 'mixto'),
+                'mixto_qr': sumar('venta', 'monto_qr', 'mixto')
+            }
             
             # Total compras por tipo
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as cantidad,
-                    COALESCE(SUM(monto), 0) as total,
-                    COALESCE(SUM(CASE WHEN tipo = 'productos' THEN monto ELSE 0 END), 0) as productos,
-                    COALESCE(SUM(CASE WHEN tipo = 'insumos' THEN monto ELSE 0 END), 0) as insumos,
-                    COALESCE(SUM(CASE WHEN tipo = 'gastos' THEN monto ELSE 0 END), 0) as gastos
-                FROM compras
-                WHERE DATE(fecha) BETWEEN DATE(?) AND DATE(?)
-            ''', (fecha_desde, fecha_hasta))
-            compras = cursor.fetchone()
-            
-            # Créditos cobrados en el período
-            cursor.execute('''
-                SELECT COALESCE(SUM(monto), 0) as total
-                FROM pagos_creditos
-                WHERE DATE(fecha) BETWEEN DATE(?) AND DATE(?)
-            ''', (fecha_desde, fecha_hasta))
-            pagos_creditos = cursor.fetchone()['total']
-            
-            # Créditos otorgados en el período
-            cursor.execute('''
-                SELECT COALESCE(SUM(monto_total), 0) as total
-                FROM creditos
-                WHERE DATE(fecha_credito) BETWEEN DATE(?) AND DATE(?)
-            ''', (fecha_desde, fecha_hasta))
-            creditos_otorgados = cursor.fetchone()['total']
+            compras = {
+                'cantidad': sumar('compra', 'cantidad'),
+                'total': sumar('compra'),
+                'productos': sumar('compra', clave='productos'),
+                'insumos': sumar('compra', clave='insumos'),
+                'gastos': sumar('compra', clave='gastos')
+            }
             
-            conn.close()
+            # Créditos cobrados y otorgados en el período
+            pagos_creditos = sumar('pago_credito')
+            creditos_otorgados = sumar('credito')
             
             total_ingresos = ventas['total'] + pagos_creditos
             total_egresos = compras['total']
@@ -2196,66 +3477,45 @@ class Database:
             print(f'❌ Error al obtener resumen financiero: {e}')
             return None
     
-    def obtener_comparativa_periodos(self):
-        """Comparar ventas entre períodos (hoy vs ayer, esta semana vs anterior, este mes vs anterior)"""
+    @cacheado('ventas')
+    def obtener_comparativa_periodos(self, comparaciones=None):
+        """Comparar ventas entre períodos con una sola lectura del resumen diario
+        
+        comparaciones: tuplas (nombre, (desde, hasta), (desde, hasta) anterior)
+        con días inclusivos; por defecto hoy vs ayer, semana y mes contra los
+        anteriores (ver comparaciones_predeterminadas). Cada ventana es una
+        columna SUM(CASE ...) de una sola consulta; las ventanas se unen en
+        rangos disjuntos, así cada día se lee una vez del índice y los huecos
+        (por ejemplo hasta el mismo día del año anterior) no se recorren.
+        """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            hoy = datetime.now()
-            ayer = hoy - timedelta(days=1)
-            inicio_semana = hoy - timedelta(days=hoy.weekday())
-            inicio_semana_anterior = inicio_semana - timedelta(days=7)
-            fin_semana_anterior = inicio_semana - timedelta(days=1)
-            inicio_mes = hoy.replace(day=1)
-            if hoy.month == 1:
-                inicio_mes_anterior = hoy.replace(year=hoy.year-1, month=12, day=1)
-            else:
-                inicio_mes_anterior = hoy.replace(month=hoy.month-1, day=1)
-            fin_mes_anterior = inicio_mes - timedelta(days=1)
-            
-            # Ventas de hoy
-            cursor.execute('''
-                SELECT COALESCE(SUM(total), 0) as total, COUNT(*) as cantidad
-                FROM ventas WHERE DATE(fecha) = DATE(?)
-            ''', (hoy.strftime('%Y-%m-%d'),))
-            ventas_hoy = cursor.fetchone()
-            
-            # Ventas de ayer
-            cursor.execute('''
-                SELECT COALESCE(SUM(total), 0) as total, COUNT(*) as cantidad
-                FROM ventas WHERE DATE(fecha) = DATE(?)
-            ''', (ayer.strftime('%Y-%m-%d'),))
-            ventas_ayer = cursor.fetchone()
-            
-            # Ventas esta semana
-            cursor.execute('''
-                SELECT COALESCE(SUM(total), 0) as total, COUNT(*) as cantidad
-                FROM ventas WHERE DATE(fecha) >= DATE(?) AND DATE(fecha) <= DATE(?)
-            ''', (inicio_semana.strftime('%Y-%m-%d'), hoy.strftime('%Y-%m-%d')))
-            ventas_semana = cursor.fetchone()
-            
-            # Ventas semana anterior
-            cursor.execute('''
-                SELECT COALESCE(SUM(total), 0) as total, COUNT(*) as cantidad
-                FROM ventas WHERE DATE(fecha) >= DATE(?) AND DATE(fecha) <= DATE(?)
-            ''', (inicio_semana_anterior.strftime('%Y-%m-%d'), fin_semana_anterior.strftime('%Y-%m-%d')))
-            ventas_semana_anterior = cursor.fetchone()
+            if comparaciones is None:
+                comparaciones = comparaciones_predeterminadas(datetime.now())
             
-            # Ventas este mes
-            cursor.execute('''
-                SELECT COALESCE(SUM(total), 0) as total, COUNT(*) as cantidad
-                FROM ventas WHERE DATE(fecha) >= DATE(?) AND DATE(fecha) <= DATE(?)
-            ''', (inicio_mes.strftime('%Y-%m-%d'), hoy.strftime('%Y-%m-%d')))
-            ventas_mes = cursor.fetchone()
+            ventanas = [ventana for _, actual, anterior in comparaciones
+                        for ventana in (actual, anterior)]
+            columnas = []
+            params = []
+            for i, (desde, hasta) in enumerate(ventanas):
+                columnas.append(f'''
+                    COALESCE(SUM(CASE WHEN fecha BETWEEN ? AND ? THEN total END), 0) as total_{i},
+                    COALESCE(SUM(CASE WHEN fecha BETWEEN ? AND ? THEN cantidad END), 0) as cantidad_{i}
+                ''')
+                params += [desde[:10], hasta[:10]] * 2
             
-            # Ventas mes anterior
-            cursor.execute('''
-                SELECT COALESCE(SUM(total), 0) as total, COUNT(*) as cantidad
-                FROM ventas WHERE DATE(fecha) >= DATE(?) AND DATE(fecha) <= DATE(?)
-            ''', (inicio_mes_anterior.strftime('%Y-%m-%d'), fin_mes_anterior.strftime('%Y-%m-%d')))
-            ventas_mes_anterior = cursor.fetchone()
+            rangos = unir_rangos_fechas(ventanas)
+            for desde, hasta in rangos:
+                params += [desde, hasta]
             
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {', '.join(columnas)}
+                FROM resumen_diario
+                WHERE origen = 'venta'
+                AND ({' OR '.join(['fecha BETWEEN ? AND ?'] * len(rangos))})
+            ''', params)
+            fila = cursor.fetchone()
             conn.close()
             
             # Calcular variaciones
@@ -2264,33 +3524,29 @@ class Database:
                     return 100 if actual > 0 else 0
                 return round(((actual - anterior) / anterior) * 100, 1)
             
-            return {
-                'hoy': {
-                    'total': ventas_hoy['total'],
-                    'cantidad': ventas_hoy['cantidad'],
-                    'comparar_con': ventas_ayer['total'],
-                    'variacion': calcular_variacion(ventas_hoy['total'], ventas_ayer['total'])
-                },
-                'semana': {
-                    'total': ventas_semana['total'],
-                    'cantidad': ventas_semana['cantidad'],
-                    'comparar_con': ventas_semana_anterior['total'],
-                    'variacion': calcular_variacion(ventas_semana['total'], ventas_semana_anterior['total'])
-                },
-                'mes': {
-                    'total': ventas_mes['total'],
-                    'cantidad': ventas_mes['cantidad'],
-                    'comparar_con': ventas_mes_anterior['total'],
-                    'variacion': calcular_variacion(ventas_mes['total'], ventas_mes_anterior['total'])
+            resultado = {}
+            for i, (nombre, actual, anterior) in enumerate(comparaciones):
+                total, total_anterior = fila[f'total_{2 * i}'], fila[f'total_{2 * i + 1}']
+                resultado[nombre] = {
+                    'total': total,
+                    'cantidad': fila[f'cantidad_{2 * i}'],
+                    'comparar_con': total_anterior,
+                    'cantidad_anterior': fila[f'cantidad_{2 * i + 1}'],
+                    'variacion': calcular_variacion(total, total_anterior),
+                    'desde': actual[0][:10],
+                    'hasta': actual[1][:10],
+                    'comparar_desde': anterior[0][:10],
+                    'comparar_hasta': anterior[1][:10]
                 }
-            }
+            return resultado
             
         except Exception as e:
             print(f'❌ Error al obtener comparativa: {e}')
             return None
     
+    @cacheado('ventas')
     def obtener_ventas_por_hora(self, fecha=None):
-        """Obtener distribución de ventas por hora del día"""
+        """Obtener distribución de ventas por hora del día (las 24 horas)"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
@@ -2299,30 +3555,20 @@ class Database:
                 fecha = datetime.now().strftime('%Y-%m-%d')
             
             cursor.execute('''
-                SELECT 
-                    CAST(strftime('%H', fecha) AS INTEGER) as hora,
-                    COUNT(*) as cantidad,
-                    COALESCE(SUM(total), 0) as total
-                FROM ventas
-                WHERE DATE(fecha) = DATE(?)
-                GROUP BY CAST(strftime('%H', fecha) AS INTEGER)
-                ORDER BY hora ASC
-            ''', (fecha,))
+                SELECT hora, cantidad, total
+                FROM ventas_por_hora
+                WHERE fecha = ? AND cantidad != 0
+            ''', (fecha[:10],))
             
             rows = cursor.fetchall()
             conn.close()
             
-            # Completar todas las horas del día (6 AM - 11 PM)
-            resultado = {}
-            for hora in range(6, 24):
-                resultado[hora] = {'cantidad': 0, 'total': 0}
-            
+            resultado = {hora: {'cantidad': 0, 'total': 0} for hora in range(24)}
             for row in rows:
-                if row['hora'] in resultado:
-                    resultado[row['hora']] = {
-                        'cantidad': row['cantidad'],
-                        'total': row['total']
-                    }
+                resultado[row['hora']] = {
+                    'cantidad': row['cantidad'],
+                    'total': row['total']
+                }
             
             return resultado
             
@@ -2330,12 +3576,72 @@ class Database:
             print(f'❌ Error al obtener ventas por hora: {e}')
             return {}
     
-    def exportar_estadisticas_excel(self, fecha_desde, fecha_hasta):
-        """Exportar reporte de estadísticas completo a Excel"""
+    @cacheado('ventas')
+    def obtener_mapa_calor_ventas(self, fecha_desde=None, fecha_hasta=None):
+        """Mapa de calor día de la semana x hora de las ventas de un rango
+        
+        Devuelve matrices densas de 7x24 (lunes a domingo, horas 0 a 23) con
+        la cantidad y el total, y cuántas veces aparece cada día de la semana
+        en el rango para poder sacar promedios. Por defecto, las últimas
+        cuatro semanas.
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            if not fecha_hasta:
+                fecha_hasta = datetime.now().strftime('%Y-%m-%d')
+            if not fecha_desde:
+                fecha_desde = (date.fromisoformat(fecha_hasta[:10]) - timedelta(days=27)).isoformat()
+            
+            cursor.execute('''
+                SELECT dia_semana, hora, SUM(cantidad) as cantidad, SUM(total) as total
+                FROM ventas_por_hora
+                WHERE fecha >= ? AND fecha <= ?
+                GROUP BY dia_semana, hora
+            ''', (fecha_desde[:10], fecha_hasta[:10]))
+            
+            rows = cursor.fetchall()
+            conn.close()
+            
+            fila_de = {dia: i for i, (dia, _) in enumerate(DIAS_SEMANA)}
+            cantidad = [[0] * 24 for _ in DIAS_SEMANA]
+            total = [[0] * 24 for _ in DIAS_SEMANA]
+            for row in rows:
+                cantidad[fila_de[row['dia_semana']]][row['hora']] = row['cantidad']
+                total[fila_de[row['dia_semana']]][row['hora']] = row['total']
+            
+            # Ocurrencias de cada día de la semana en el rango (lunes = 0)
+            inicio = date.fromisoformat(fecha_desde[:10])
+            dias = (date.fromisoformat(fecha_hasta[:10]) - inicio).days + 1
+            ocurrencias = [0] * 7
+            if dias > 0:
+                semanas, resto = divmod(dias, 7)
+                ocurrencias = [semanas] * 7
+                for i in range(resto):
+                    ocurrencias[(inicio.weekday() + i) % 7] += 1
+            
+            return {
+                'desde': fecha_desde[:10],
+                'hasta': fecha_hasta[:10],
+                'dias': [nombre for _, nombre in DIAS_SEMANA],
+                'horas': list(range(24)),
+                'cantidad': cantidad,
+                'total': total,
+                'dias_en_rango': ocurrencias
+            }
+            
+        except Exception as e:
+            print(f'❌ Error al obtener mapa de calor de ventas: {e}')
+            return None
+    
+    def exportar_estadisticas_excel(self, fecha_desde, fecha_hasta, destino=None):
+        """Exportar reporte de estadísticas completo a Excel (por defecto en exports/)"""
         try:
             import openpyxl
             from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
             from openpyxl.chart import BarChart, PieChart, LineChart, Reference
+            from openpyxl.utils import get_column_letter
             
             wb = openpyxl.Workbook()
             
@@ -2424,7 +3730,8 @@ class Database:
             for ws in [ws1, ws2, ws3, ws4]:
                 for column in ws.columns:
                     max_length = 0
-                    column_letter = column[0].column_letter
+                    # La primera celda puede ser combinada (sin column_letter)
+                    column_letter = get_column_letter(column[0].column)
                     for cell in column:
                         try:
                             if len(str(cell.value)) > max_length:
@@ -2435,8 +3742,10 @@ class Database:
                     ws.column_dimensions[column_letter].width = adjusted_width
             
             # Guardar archivo
-            os.makedirs('exports', exist_ok=True)
-            filename = f"exports/estadisticas_{fecha_desde}_{fecha_hasta}.xlsx"
+            filename = destino
+            if filename is None:
+                os.makedirs('exports', exist_ok=True)
+                filename = f"exports/estadisticas_{fecha_desde}_{fecha_hasta}.xlsx"
             wb.save(filename)
             
             print(f'✅ Reporte de estadísticas exportado: {filename}')
@@ -2450,6 +3759,9 @@ class Database:
 # FIN DE LAS FUNCIONES DE ESTADÍSTICAS
 # ============================================
 
+# Medir la duración de cada método público (ver utils/perfilado.py)
+instrumentar_clase(Database)
+
 # Ejecutar si se llama directamente
 if __name__ == '__main__':
     db = Database()
@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+import tempfile
+from itertools import chain, islice
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class ExportadorExcel:
+    """Genera archivos .xlsx en modo write_only (memoria constante).
+
+    Las filas se escriben a medida que llegan del cursor, sin armar la hoja
+    completa en memoria. En este modo openpyxl escribe los anchos de columna
+    antes de la primera fila, así que se calculan en la misma pasada sobre
+    el encabezado y las primeras `muestra` filas, que se retienen solo
+    hasta fijar los anchos.
+
+    progreso, si se indica, se llama con el total de filas escritas cada
+    `cada` filas y al terminar cada hoja.
+    """
+
+    def __init__(self, muestra=500, ancho_maximo=60, progreso=None, cada=1000):
+        self.muestra = muestra
+        self.ancho_maximo = ancho_maximo
+        self.progreso = progreso
+        self.cada = cada
+        self.filas_escritas = 0
+        self.wb = Workbook(write_only=True)
+
+    def agregar_hoja(self, titulo, encabezados=None, filas=(), color=None,
+                     color_texto='FFFFFF', centrar=False, anchos=None,
+                     previas=(), pie=None, resaltar=None):
+        """Agregar una hoja y volcar sus filas.
+
+        - previas: filas (valores, Font) antes del encabezado (títulos)
+        - pie: función llamada al terminar las filas; devuelve filas en negrita
+        - resaltar: función fila -> color de relleno o None
+        """
+        ws = self.wb.create_sheet(titulo)
+        filas = iter(filas)
+        primeras = list(islice(filas, self.muestra))
+
+        if anchos is None:
+            anchos = self._calcular_anchos(
+                chain([v for v, _ in previas], [encabezados or []], primeras)
+            )
+        for col, ancho in enumerate(anchos, 1):
+            ws.column_dimensions[get_column_letter(col)].width = ancho
+
+        for valores, fuente in previas:
+            ws.append([self._celda(ws, v, fuente) for v in valores])
+
+        if encabezados:
+            fuente = Font(color=color_texto, bold=True)
+            relleno = PatternFill(start_color=color, end_color=color, fill_type='solid') if color else None
+            alineacion = Alignment(horizontal='center', vertical='center') if centrar else None
+            ws.append([self._celda(ws, v, fuente, relleno, alineacion) for v in encabezados])
+
+        rellenos = {}
+        for fila in chain(primeras, filas):
+            color_fila = resaltar(fila) if resaltar else None
+            if color_fila:
+                if color_fila not in rellenos:
+                    rellenos[color_fila] = PatternFill(start_color=color_fila, end_color=color_fila,
+                                                       fill_type='solid')
+                fila = [self._celda(ws, v, relleno=rellenos[color_fila]) for v in fila]
+            ws.append(fila)
+            self.filas_escritas += 1
+            if self.progreso and self.filas_escritas % self.cada == 0:
+                self.progreso(self.filas_escritas)
+
+        if pie:
+            negrita = Font(bold=True)
+            for fila in pie():
+                ws.append([self._celda(ws, v, negrita) for v in fila])
+
+        if self.progreso:
+            self.progreso(self.filas_escritas)
+        return ws
+
+    def guardar(self, destino=None):
+        """Guardar en una ruta o archivo; sin destino usa un temporal y lo devuelve al inicio"""
+        if destino is None:
+            destino = tempfile.TemporaryFile()
+        self.wb.save(destino)
+        if hasattr(destino, 'seek'):
+            destino.seek(0)
+        return destino
+
+    def _calcular_anchos(self, filas):
+        """Ancho de cada columna según el valor más largo"""
+        largos = []
+        for fila in filas:
+            for col, valor in enumerate(fila):
+                largo = len(str(valor)) if valor is not None else 0
+                if col == len(largos):
+                    largos.append(largo)
+                elif largo > largos[col]:
+                    largos[col] = largo
+        return [min((largo + 2) * 1.2, self.ancho_maximo) for largo in largos]
+
+    @staticmethod
+    def _celda(ws, valor, fuente=None, relleno=None, alineacion=None):
+        celda = WriteOnlyCell(ws, value=valor)
+        if fuente:
+            celda.font = fuente
+        if relleno:
+            celda.fill = relleno
+        if alineacion:
+            celda.alignment = alineacion
+        return celda
+
+
+def generar_csv(filas, tamano=500):
+    """Texto CSV por bloques de filas (con BOM para que Excel respete los acentos)"""
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    escritor = csv.writer(buffer)
+    for num, fila in enumerate(filas, 1):
+        escritor.writerow(fila)
+        if num % tamano == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def generar_ndjson(filas, tamano=500):
+    """Un objeto JSON por línea; la primera fila trae los nombres de columna"""
+    filas = iter(filas)
+    columnas = next(filas, None)
+    if columnas is None:
+        return
+
+    bloque = []
+    for fila in filas:
+        bloque.append(json.dumps(dict(zip(columnas, fila)), ensure_ascii=False, default=str))
+        if len(bloque) == tamano:
+            yield '\n'.join(bloque) + '\n'
+            bloque = []
+    if bloque:
+        yield '\n'.join(bloque) + '\n'
+
+
+FORMATOS_FLUJO = {
+    'csv': ('text/csv; charset=utf-8', generar_csv),
+    'ndjson': ('application/x-ndjson; charset=utf-8', generar_ndjson)
+}
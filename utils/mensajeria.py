@@ -0,0 +1,107 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import socketio
+
+# ========== COLA DE MENSAJES ENTRE WORKERS ==========
+# Con varios workers de gunicorn cada proceso solo conoce a sus propios
+# clientes de Socket.IO: un emit en el worker que atendió la venta no llega
+# a los navegadores conectados a otro. Con una cola de mensajes cada emit se
+# publica ahí y todos los workers lo reenvían a sus clientes.
+#
+# SOCKETIO_MESSAGE_QUEUE elige la cola:
+#   redis://host:6379/0       Redis (requiere el paquete redis)
+#   sqlite:///ruta/bus.db     tabla en un archivo SQLite, sin servicios extra;
+#                             sirve para varios workers en la misma máquina
+
+
+class ManagerSQLite(socketio.PubSubManager):
+    """Manager de Socket.IO que publica los mensajes en una tabla SQLite.
+
+    - Cada publicación es un INSERT; cada worker lee los ids nuevos cada
+      `intervalo` segundos.
+    - Los mensajes de más de `retencion` segundos se borran.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, url='sqlite:///database/socketio.db', channel='socketio',
+                 write_only=False, logger=None, intervalo=0.05, retencion=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.ruta = ruta_sqlite(url)
+        self.intervalo = intervalo
+        self.retencion = retencion
+        self._conn = None
+        self._lock = threading.Lock()
+
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        conn = self._conectar()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS mensajes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                canal TEXT NOT NULL,
+                datos BLOB NOT NULL,
+                creado REAL NOT NULL
+            )
+        ''')
+        conn.close()
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.ruta, timeout=10, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _publish(self, data):
+        datos = pickle.dumps(data)
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._conectar()
+            self._conn.execute('INSERT INTO mensajes (canal, datos, creado) VALUES (?, ?, ?)',
+                               (self.channel, datos, time.time()))
+
+    def _listen(self):
+        conn = self._conectar()
+        ultimo = conn.execute('SELECT COALESCE(MAX(id), 0) FROM mensajes').fetchone()[0]
+        ultima_limpieza = time.monotonic()
+        while True:
+            filas = conn.execute('SELECT id, datos FROM mensajes WHERE id > ? AND canal = ? ORDER BY id',
+                                 (ultimo, self.channel)).fetchall()
+            for mensaje_id, datos in filas:
+                ultimo = mensaje_id
+                try:
+                    yield pickle.loads(datos)
+                except Exception as e:
+                    print(f'❌ Mensaje de Socket.IO inválido ({mensaje_id}): {e}')
+
+            if time.monotonic() - ultima_limpieza >= self.retencion:
+                ultima_limpieza = time.monotonic()
+                self._borrar_viejos(conn)
+            self.server.sleep(self.intervalo)
+
+    def _borrar_viejos(self, conn):
+        try:
+            conn.execute('DELETE FROM mensajes WHERE creado < ?', (time.time() - self.retencion,))
+        except sqlite3.OperationalError as e:
+            # Otro worker está escribiendo; se borra en la próxima vuelta
+            print(f'❌ Error al borrar mensajes viejos de Socket.IO: {e}')
+
+
+def ruta_sqlite(url):
+    """'sqlite:///database/bus.db' -> 'database/bus.db' ('sqlite:////tmp/bus.db' -> '/tmp/bus.db')"""
+    return url[len('sqlite:///'):]
+
+
+def opciones_socketio(url):
+    """kwargs de SocketIO para la cola de mensajes de la URL (vacío = un solo proceso)"""
+    if not url:
+        return {}
+    if url.startswith('sqlite:///'):
+        return {'client_manager': ManagerSQLite(url)}
+    return {'message_queue': url}
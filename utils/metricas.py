@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import deque
+
+# Límites de los buckets de latencia, en segundos
+BUCKETS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _escapar(valor):
+    """Escapar un valor de etiqueta para el formato de texto de Prometheus"""
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+class Histograma:
+    """Histograma acumulado por combinación de etiquetas (tipo histogram de Prometheus)"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, buckets=BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def lineas(self):
+        with self._lock:
+            series = [(clave, list(conteos), suma, total)
+                      for clave, (conteos, suma, total) in self._series.items()]
+
+        for clave, conteos, suma, total in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                yield f'{self.nombre}_bucket{_etiquetas(clave + (("le", limite),))} {acumulado}'
+            yield f'{self.nombre}_bucket{_etiquetas(clave + (("le", "+Inf"),))} {total}'
+            yield f'{self.nombre}_sum{_etiquetas(clave)} {suma}'
+            yield f'{self.nombre}_count{_etiquetas(clave)} {total}'
+
+
+class Contador:
+    """Contador por combinación de etiquetas (tipo counter de Prometheus)"""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._series[clave] = self._series.get(clave, 0) + valor
+
+    def lineas(self):
+        with self._lock:
+            series = list(self._series.items())
+        for clave, valor in series:
+            yield f'{self.nombre}{_etiquetas(clave)} {valor}'
+
+
+class Resumen:
+    """Cuantiles sobre una ventana móvil (tipo summary de Prometheus).
+
+    Cada combinación de etiquetas guarda las últimas `maximo` observaciones
+    de los últimos `ventana` segundos; _sum y _count son acumulados.
+    """
+
+    tipo = 'summary'
+
+    def __init__(self, nombre, ayuda, cuantiles=(0.5, 0.95, 0.99), ventana=300, maximo=2048):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.cuantiles = tuple(cuantiles)
+        self.ventana = ventana
+        self.maximo = maximo
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        ahora = time.monotonic()
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [deque(maxlen=self.maximo), 0.0, 0]
+            serie[0].append((ahora, valor))
+            serie[1] += valor
+            serie[2] += 1
+
+    def calcular(self):
+        """{etiquetas: {'cuantiles': {q: valor}, 'suma': s, 'total': n}} de la ventana actual"""
+        limite = time.monotonic() - self.ventana
+        with self._lock:
+            series = []
+            for clave, (muestras, suma, total) in self._series.items():
+                while muestras and muestras[0][0] < limite:
+                    muestras.popleft()
+                series.append((clave, sorted(v for _, v in muestras), suma, total))
+
+        resultado = {}
+        for clave, valores, suma, total in series:
+            cuantiles = {}
+            for q in self.cuantiles:
+                # Método del rango más cercano
+                cuantiles[q] = valores[min(len(valores) - 1, int(q * len(valores)))] if valores else None
+            resultado[clave] = {'cuantiles': cuantiles, 'suma': suma, 'total': total,
+                                'muestras': len(valores)}
+        return resultado
+
+    def lineas(self):
+        for clave, datos in self.calcular().items():
+            for q, valor in datos['cuantiles'].items():
+                if valor is not None:
+                    yield f'{self.nombre}{_etiquetas(clave + (("quantile", q),))} {valor}'
+            yield f'{self.nombre}_sum{_etiquetas(clave)} {datos["suma"]}'
+            yield f'{self.nombre}_count{_etiquetas(clave)} {datos["total"]}'
+
+
+class RegistroMetricas:
+    """Conjunto de métricas del proceso, exportable en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, clase, nombre, *args):
+        with self._lock:
+            if nombre not in self._metricas:
+                self._metricas[nombre] = clase(nombre, *args)
+            return self._metricas[nombre]
+
+    def histograma(self, nombre, ayuda, buckets=BUCKETS_LATENCIA):
+        """Obtener (o crear) un histograma"""
+        return self._registrar(Histograma, nombre, ayuda, buckets)
+
+    def contador(self, nombre, ayuda):
+        """Obtener (o crear) un contador"""
+        return self._registrar(Contador, nombre, ayuda)
+
+    def resumen(self, nombre, ayuda, cuantiles=(0.5, 0.95, 0.99), ventana=300):
+        """Obtener (o crear) un resumen con cuantiles sobre una ventana móvil"""
+        return self._registrar(Resumen, nombre, ayuda, cuantiles, ventana)
+
+    def exportar(self):
+        """Texto en formato de exposición de Prometheus"""
+        with self._lock:
+            metricas = list(self._metricas.values())
+
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+            lineas.extend(metrica.lineas())
+        return '\n'.join(lineas) + '\n'
+
+
+# Registro compartido por la base de datos y la aplicación
+METRICAS = RegistroMetricas()
@@ -0,0 +1,301 @@
+import contextvars
+import inspect
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+from utils.metricas import METRICAS
+
+# ========== PERFILADO DE CONSULTAS ==========
+# Las conexiones abiertas con factory=ConexionMedida devuelven cursores que
+# miden cada sentencia (ejecución + lectura de filas). La sentencia se da por
+# terminada cuando el cursor se agota, se cierra, se reutiliza o se libera.
+# Las que superan el umbral van al log de consultas lentas con su plan.
+
+UMBRAL_LENTA = float(os.getenv('DB_CONSULTA_LENTA_MS', 100)) / 1000
+LOG_LENTAS = os.getenv('DB_LOG_LENTAS', 'logs/consultas_lentas.log')
+LARGO_MAXIMO_SQL = 200
+
+# Los valores de los parámetros (nombres, teléfonos de clientes...) solo van
+# al log con DB_LOG_PARAMETROS=1; por defecto se anotan cuántos y de qué tipo
+LOG_PARAMETROS = os.getenv('DB_LOG_PARAMETROS', '0') == '1'
+
+SENTENCIAS_DML = re.compile(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+BUCKETS_FILAS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+METODO_SEGUNDOS = METRICAS.histograma('db_metodo_segundos', 'Duración de cada método de Database')
+CONSULTA_SEGUNDOS = METRICAS.histograma('db_consulta_segundos',
+                                        'Duración de cada sentencia SQL (ejecución y lectura)')
+CONSULTA_FILAS = METRICAS.histograma('db_consulta_filas', 'Filas leídas o modificadas por sentencia',
+                                     BUCKETS_FILAS)
+CONSULTA_ERRORES = METRICAS.contador('db_consulta_errores_total', 'Sentencias que terminaron en error')
+CONSULTAS_LENTAS = METRICAS.contador('db_consultas_lentas_total', 'Sentencias sobre el umbral de lentitud')
+CONEXION_SEGUNDOS = METRICAS.histograma('db_conexion_segundos',
+                                        'Tiempo para obtener una conexión (pool o nueva)')
+
+# Método de Database en curso, para atribuir las sentencias que ejecuta
+metodo_actual = contextvars.ContextVar('metodo_actual', default='-')
+
+# Acumulador del tiempo pasado en Database durante la petición en curso
+tiempo_db = contextvars.ContextVar('tiempo_db', default=None)
+
+_lock_log = threading.Lock()
+
+
+def normalizar_sql(sql):
+    """Forma canónica de una sentencia para usarla como etiqueta.
+
+    Colapsa espacios, reemplaza números por ? y pliega listas de
+    parámetros (IN (?, ?, ?) y VALUES (?, ?), (?, ?)) a un solo (?).
+    DDL y PRAGMA se agrupan por sus dos primeras palabras.
+    """
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    if not SENTENCIAS_DML.match(sql):
+        return ' '.join(sql.split(' ')[:2]) + ' …'
+    sql = re.sub(r'(?<![\w.])\d+(?:\.\d+)?', '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', sql)
+    sql = re.sub(r'\(\?\)(?:\s*,\s*\(\?\))+', '(?)', sql)
+    if len(sql) > LARGO_MAXIMO_SQL:
+        sql = sql[:LARGO_MAXIMO_SQL - 1] + '…'
+    return sql
+
+
+def _plan_consulta(conn, sql, params):
+    """EXPLAIN QUERY PLAN de la sentencia, con un cursor sin medir"""
+    if not SENTENCIAS_DML.match(sql):
+        return []
+    if params is None:
+        return ['(sin plan: parámetros desconocidos)']
+    try:
+        cursor = sqlite3.Cursor(conn)
+        filas = cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        cursor.close()
+    except sqlite3.Error as e:
+        return [f'(sin plan: {e})']
+
+    # Cada fila es (id, padre, -, detalle); se indenta según la profundidad
+    profundidad = {0: -1}
+    lineas = []
+    for id_nodo, padre, _, detalle in filas:
+        profundidad[id_nodo] = profundidad.get(padre, -1) + 1
+        lineas.append('  ' * profundidad[id_nodo] + detalle)
+    return lineas
+
+
+def describir_parametros(params):
+    """Los valores (con DB_LOG_PARAMETROS=1) o solo la cantidad y los tipos"""
+    if LOG_PARAMETROS:
+        return f'{params!r}'[:500]
+    if isinstance(params, dict):
+        tipos = [f'{clave}: {type(valor).__name__}' for clave, valor in params.items()]
+    else:
+        tipos = [type(valor).__name__ for valor in params]
+    return f"{len(tipos)} ({', '.join(tipos)})"[:500]
+
+
+def registrar_consulta_lenta(conn, sql, params, segundos, filas):
+    """Escribir la sentencia lenta y su plan en el log"""
+    metodo = metodo_actual.get()
+    CONSULTAS_LENTAS.incrementar(metodo=metodo)
+    plan = _plan_consulta(conn, sql, params)
+    sentencia = re.sub(r'\s+', ' ', sql).strip()
+
+    texto = (f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {segundos * 1000:.1f} ms "
+             f"| {filas} filas | {metodo}\n"
+             f"  {sentencia}\n")
+    if params:
+        texto += f'  parámetros: {describir_parametros(params)}\n'
+    texto += ''.join(f'    {linea}\n' for linea in plan)
+
+    print(f'⚠️ Consulta lenta ({segundos * 1000:.0f} ms) en {metodo}: {normalizar_sql(sql)[:80]}')
+    try:
+        directorio = os.path.dirname(LOG_LENTAS)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with _lock_log:
+            with open(LOG_LENTAS, 'a', encoding='utf-8') as archivo:
+                archivo.write(texto + '\n')
+    except OSError as e:
+        print(f'❌ Error al escribir el log de consultas lentas: {e}')
+
+
+class CursorMedido(sqlite3.Cursor):
+    """Cursor que mide la duración y las filas de cada sentencia"""
+
+    _sql = None
+
+    def _empezar(self, sql, params, ejecutar):
+        self._terminar()
+        inicio = time.perf_counter()
+        try:
+            ejecutar()
+        except sqlite3.Error:
+            CONSULTA_ERRORES.incrementar(consulta=normalizar_sql(sql))
+            raise
+        self._sql = sql
+        self._params = params
+        self._segundos = time.perf_counter() - inicio
+        self._filas = 0
+
+        # Sin filas que leer (INSERT, UPDATE, DDL...): la sentencia ya terminó
+        if self.description is None:
+            self._filas = max(self.rowcount, 0)
+            self._terminar()
+        return self
+
+    def _terminar(self):
+        """Registrar la sentencia en curso, si la hay"""
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+
+        consulta = normalizar_sql(sql)
+        CONSULTA_SEGUNDOS.observar(self._segundos, consulta=consulta)
+        CONSULTA_FILAS.observar(self._filas, consulta=consulta)
+        if self._segundos >= UMBRAL_LENTA:
+            params = self._params
+            if params is not None and not isinstance(params, (tuple, list, dict)):
+                params = tuple(params)
+            registrar_consulta_lenta(self.connection, sql, params, self._segundos, self._filas)
+
+    def _leer(self, leer):
+        inicio = time.perf_counter()
+        resultado = leer()
+        if self._sql is not None:
+            self._segundos += time.perf_counter() - inicio
+        return resultado
+
+    def execute(self, sql, params=()):
+        return self._empezar(sql, params, lambda: super(CursorMedido, self).execute(sql, params))
+
+    def executemany(self, sql, params):
+        # Los parámetros pueden ser un generador: se separa la primera fila
+        # para el plan y se vuelve a encadenar con el resto
+        filas = iter(params)
+        primera = next(filas, None)
+        if primera is None:
+            return self._empezar(sql, None, lambda: super(CursorMedido, self).executemany(sql, ()))
+        todas = itertools.chain([primera], filas)
+        return self._empezar(sql, primera, lambda: super(CursorMedido, self).executemany(sql, todas))
+
+    def executescript(self, script):
+        self._terminar()
+        return super().executescript(script)
+
+    def fetchone(self):
+        fila = self._leer(super().fetchone)
+        if fila is None:
+            self._terminar()
+        elif self._sql is not None:
+            self._filas += 1
+        return fila
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        filas = self._leer(lambda: super(CursorMedido, self).fetchmany(size))
+        if self._sql is not None:
+            self._filas += len(filas)
+            if len(filas) < size:
+                self._terminar()
+        return filas
+
+    def fetchall(self):
+        filas = self._leer(super().fetchall)
+        if self._sql is not None:
+            self._filas += len(filas)
+            self._terminar()
+        return filas
+
+    def __next__(self):
+        try:
+            fila = self._leer(super().__next__)
+        except StopIteration:
+            self._terminar()
+            raise
+        if self._sql is not None:
+            self._filas += 1
+        return fila
+
+    def close(self):
+        self._terminar()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._terminar()
+        except Exception:
+            pass
+
+
+class ConexionMedida(sqlite3.Connection):
+    """Conexión cuyos cursores (incluidos los de conn.execute) son CursorMedido"""
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+
+
+def medir_conexion(obtener, origen):
+    """Obtener una conexión registrando cuánto tardó"""
+    inicio = time.perf_counter()
+    conn = obtener()
+    CONEXION_SEGUNDOS.observar(time.perf_counter() - inicio, origen=origen)
+    return conn
+
+
+def iniciar_tiempo_db():
+    """Empezar a acumular el tiempo en Database del contexto actual; devuelve el acumulador"""
+    acumulado = [0.0]
+    tiempo_db.set(acumulado)
+    return acumulado
+
+
+def medir_metodo(metodo):
+    """Decorador: duración del método y atribución de sus sentencias"""
+    @wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        if not self.metricas:
+            return metodo(self, *args, **kwargs)
+
+        externo = metodo_actual.get() == '-'
+        token = metodo_actual.set(metodo.__name__)
+        inicio = time.perf_counter()
+        try:
+            return metodo(self, *args, **kwargs)
+        finally:
+            segundos = time.perf_counter() - inicio
+            METODO_SEGUNDOS.observar(segundos, metodo=metodo.__name__)
+            metodo_actual.reset(token)
+
+            # Solo el método más externo suma, para no contar dos veces
+            acumulado = tiempo_db.get()
+            if externo and acumulado is not None:
+                acumulado[0] += segundos
+    return envoltura
+
+
+def instrumentar_clase(clase):
+    """Aplicar medir_metodo a los métodos públicos de la clase.
+
+    Los generadores quedan fuera: su trabajo ocurre al recorrerlos, no al
+    llamarlos, y sus sentencias igual se miden en el cursor.
+    """
+    for nombre, metodo in list(vars(clase).items()):
+        if nombre.startswith('_') or not inspect.isfunction(metodo):
+            continue
+        if inspect.isgeneratorfunction(inspect.unwrap(metodo)):
+            continue
+        setattr(clase, nombre, medir_metodo(metodo))
+    return clase
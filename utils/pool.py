@@ -0,0 +1,119 @@
+import sqlite3
+import threading
+import queue
+import time
+
+
+class ConexionPool:
+    """Conexión prestada por el pool: close() la devuelve en lugar de cerrarla"""
+
+    _conn = None
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, nombre):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('La conexión ya fue devuelta al pool')
+        return getattr(self._conn, nombre)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *args):
+        return self._conn.__exit__(*args)
+
+    def close(self):
+        """Devolver la conexión al pool"""
+        if self._conn is not None:
+            conn = self._conn
+            self._conn = None
+            self._pool.devolver(conn)
+
+    def __del__(self):
+        # Si un método olvidó cerrar (por ejemplo al saltar una excepción)
+        # la conexión vuelve al pool cuando se libera el objeto
+        self.close()
+
+
+class PoolConexiones:
+    """Pool de conexiones SQLite de larga vida.
+
+    Cada préstamo es exclusivo de quien lo pide (hilo o greenlet): el
+    semáforo limita cuántas conexiones pueden estar fuera a la vez y, con
+    eventlet.monkey_patch(), tanto el semáforo como la cola ceden el control
+    al resto de greenlets mientras esperan.
+    """
+
+    def __init__(self, crear_conexion, tamano=5, timeout=30, verificar_cada=60):
+        self.crear_conexion = crear_conexion
+        self.tamano = tamano
+        self.timeout = timeout
+        self.verificar_cada = verificar_cada
+        self._libres = queue.LifoQueue()
+        self._cupos = threading.BoundedSemaphore(tamano)
+
+    def obtener(self):
+        """Tomar una conexión libre (o crear una nueva si no hay)"""
+        if not self._cupos.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError('Pool de conexiones agotado')
+
+        try:
+            conn = self._tomar_libre()
+            if conn is None:
+                conn = self.crear_conexion()
+        except Exception:
+            self._cupos.release()
+            raise
+
+        return ConexionPool(self, conn)
+
+    def _tomar_libre(self):
+        """Sacar una conexión de la cola, descartando las que no respondan"""
+        while True:
+            try:
+                conn, ultimo_uso = self._libres.get_nowait()
+            except queue.Empty:
+                return None
+
+            if time.monotonic() - ultimo_uso < self.verificar_cada:
+                return conn
+
+            if self._esta_sana(conn):
+                return conn
+            self._cerrar(conn)
+
+    def _esta_sana(self, conn):
+        """Health check: la conexión sigue respondiendo"""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def devolver(self, conn):
+        """Recibir una conexión de vuelta, deshaciendo lo que no se confirmó"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._libres.put((conn, time.monotonic()))
+        except sqlite3.Error:
+            self._cerrar(conn)
+        finally:
+            self._cupos.release()
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def cerrar(self):
+        """Cerrar todas las conexiones libres"""
+        while True:
+            try:
+                conn, _ = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            self._cerrar(conn)
@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+# ========== COLA DE TRABAJOS EN SEGUNDO PLANO ==========
+# Las exportaciones grandes (openpyxl) son trabajo de CPU: dentro del worker
+# de eventlet bloquean a todos los greenlets, es decir, al POS. La cola las
+# corre en hilos del sistema operativo (los originales, no los parcheados
+# por eventlet.monkey_patch) y deja el archivo en el directorio de
+# exportaciones. El estado de cada trabajo es un dict que esos hilos solo
+# actualizan; quien lo publique (SocketIO) lo lee desde el lado de eventlet.
+# Cada cambio de estado también se guarda en <id>.json junto al archivo, para
+# que otro worker de gunicorn pueda responder por un trabajo que no corre él.
+
+ID_TRABAJO = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _modulos_originales():
+    """threading y queue sin el parche de eventlet, si está activo"""
+    try:
+        from eventlet import patcher
+    except ImportError:
+        import queue
+        return threading, queue
+    return patcher.original('threading'), patcher.original('queue')
+
+
+class ColaLlena(Exception):
+    """Hay demasiados trabajos pendientes para aceptar otro"""
+
+
+class ColaTrabajos:
+    """Cola local de trabajos que generan un archivo.
+
+    - concurrentes: hilos que ejecutan trabajos a la vez (el resto espera)
+    - max_pendientes: trabajos en cola o en curso antes de rechazar nuevos
+    - retencion: segundos que se conservan los archivos terminados
+    """
+
+    def __init__(self, directorio='exports', concurrentes=2, max_pendientes=20, retencion=3600):
+        self.directorio = directorio
+        self.concurrentes = concurrentes
+        self.max_pendientes = max_pendientes
+        self.retencion = retencion
+        self._trabajos = {}
+        self._hilos = []
+
+        hilos_so, colas_so = _modulos_originales()
+        self._hilos_so = hilos_so
+        self._cola = colas_so.Queue()
+        self._lock = hilos_so.Lock()
+
+    def enviar(self, nombre, funcion):
+        """Encolar funcion(destino, progreso), que debe escribir el archivo en destino.
+
+        Devuelve el estado público del trabajo; lanza ColaLlena si se
+        alcanzó max_pendientes.
+        """
+        with self._lock:
+            pendientes = sum(1 for t in self._trabajos.values() if t['estado'] in ('en_cola', 'en_curso'))
+            if pendientes >= self.max_pendientes:
+                raise ColaLlena(f'Hay {pendientes} exportaciones pendientes, intente en unos minutos')
+
+            trabajo = self._nuevo(nombre)
+            self._iniciar_hilos()
+
+        self._cola.put((trabajo, funcion))
+        return self.publico(trabajo)
+
+    def agregar_listo(self, nombre, archivo, copiar):
+        """Registrar como terminado un trabajo cuyo archivo ya existe (por ejemplo, en un cache).
+
+        copiar(origen, destino) deja el archivo en la ruta del trabajo.
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        with self._lock:
+            trabajo = self._nuevo(nombre)
+        copiar(archivo, trabajo['ruta'])
+        self._actualizar(trabajo, estado='listo', terminado=time.time())
+        return self.publico(trabajo)
+
+    def obtener(self, trabajo_id):
+        """Trabajo por id (el dict interno) o None
+
+        Si no es de este proceso se lee su estado guardado en disco por el
+        worker que lo ejecuta.
+        """
+        trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is not None or not ID_TRABAJO.match(trabajo_id):
+            return trabajo
+        try:
+            with open(self._ruta_estado(trabajo_id), encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def publico(trabajo):
+        """Estado del trabajo sin la ruta en disco"""
+        return {clave: valor for clave, valor in trabajo.items() if clave != 'ruta'}
+
+    def cambiados(self, vistos):
+        """Trabajos cuya versión cambió desde la última llamada con el mismo dict vistos"""
+        cambiados = []
+        for trabajo in list(self._trabajos.values()):
+            if vistos.get(trabajo['id']) != trabajo['version']:
+                vistos[trabajo['id']] = trabajo['version']
+                cambiados.append(trabajo)
+        for trabajo_id in list(vistos):
+            if trabajo_id not in self._trabajos:
+                del vistos[trabajo_id]
+        return cambiados
+
+    def limpiar(self):
+        """Borrar archivos y trabajos terminados hace más de `retencion` segundos.
+
+        También borra archivos sueltos del directorio con más de esa edad
+        (de un reinicio anterior). Devuelve cuántos archivos borró.
+        """
+        limite = time.time() - self.retencion
+        borrados = 0
+
+        with self._lock:
+            vencidos = [t for t in self._trabajos.values()
+                        if t['terminado'] is not None and t['terminado'] < limite]
+            for trabajo in vencidos:
+                del self._trabajos[trabajo['id']]
+            en_uso = set()
+            for t in self._trabajos.values():
+                en_uso.update((os.path.basename(t['ruta']), os.path.basename(t['ruta']) + '.parcial',
+                               t['id'] + '.json'))
+
+        if not os.path.isdir(self.directorio):
+            return borrados
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if (nombre in en_uso or nombre.startswith('.') or not os.path.isfile(ruta)
+                        or os.path.getmtime(ruta) >= limite):
+                    continue
+                os.remove(ruta)
+                borrados += 1
+            except OSError as e:
+                print(f'❌ Error al borrar exportación vieja {nombre}: {e}')
+        return borrados
+
+    def _nuevo(self, nombre):
+        trabajo_id = uuid.uuid4().hex
+        trabajo = {
+            'id': trabajo_id,
+            'nombre': nombre,
+            'estado': 'en_cola',
+            'filas': 0,
+            'error': None,
+            'creado': time.time(),
+            'terminado': None,
+            'ruta': os.path.join(self.directorio, f'{trabajo_id}_{nombre}'),
+            'version': 0,
+        }
+        self._trabajos[trabajo_id] = trabajo
+        self._guardar(trabajo)
+        return trabajo
+
+    def _iniciar_hilos(self):
+        """Arrancar los hilos de trabajo la primera vez que hacen falta"""
+        while len(self._hilos) < self.concurrentes:
+            hilo = self._hilos_so.Thread(target=self._trabajar, daemon=True,
+                                         name=f'exportador-{len(self._hilos) + 1}')
+            self._hilos.append(hilo)
+            hilo.start()
+
+    def _actualizar(self, trabajo, **cambios):
+        trabajo.update(cambios)
+        trabajo['version'] += 1
+        self._guardar(trabajo)
+
+    def _ruta_estado(self, trabajo_id):
+        return os.path.join(self.directorio, f'{trabajo_id}.json')
+
+    def _guardar(self, trabajo):
+        """Escribir el estado del trabajo en disco para los demás workers"""
+        ruta = self._ruta_estado(trabajo['id'])
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            with open(ruta + '.tmp', 'w', encoding='utf-8') as archivo:
+                json.dump(trabajo, archivo, ensure_ascii=False)
+            os.replace(ruta + '.tmp', ruta)
+        except OSError as e:
+            print(f"❌ Error al guardar el estado de la exportación {trabajo['id'][:8]}: {e}")
+
+    def _trabajar(self):
+        while True:
+            trabajo, funcion = self._cola.get()
+            self._ejecutar(trabajo, funcion)
+
+    def _ejecutar(self, trabajo, funcion):
+        """Generar el archivo en una ruta temporal y moverlo al terminar"""
+        self._actualizar(trabajo, estado='en_curso')
+        parcial = trabajo['ruta'] + '.parcial'
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            resultado = funcion(parcial, lambda filas: self._actualizar(trabajo, filas=filas))
+            if resultado is None or not os.path.exists(parcial):
+                raise RuntimeError('No se pudo generar el archivo')
+            os.replace(parcial, trabajo['ruta'])
+            self._actualizar(trabajo, estado='listo', terminado=time.time())
+            print(f"✅ Exportación lista: {trabajo['nombre']} ({trabajo['id'][:8]})")
+        except Exception as e:
+            if os.path.exists(parcial):
+                os.remove(parcial)
+            self._actualizar(trabajo, estado='error', error=str(e), terminado=time.time())
+            print(f"❌ Error en exportación {trabajo['nombre']}: {e}")